@@ -9,8 +9,61 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.exception import convert_exception_to_response
+from django.urls import resolve, set_urlconf
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Elevator.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up, since it loads the app's models.
+from Elevator_app.metrics import MetricsMiddleware  # noqa: E402
+from Elevator_app.streaming import websocket_application  # noqa: E402
+
+ASYNC_READS_PREFIX = "/async/"
+
+
+async def serve_view(request):
+    match = resolve(request.path_info)
+    request.resolver_match = match
+    return await match.func(request, *match.args, **match.kwargs)
+
+
+class AsyncReadsHandler(ASGIHandler):
+    """
+    Serves the async read views with only the metrics middleware. Under ASGI
+    Django runs every hook of a `MiddlewareMixin` middleware (sessions, auth,
+    CSRF, messages...) in a worker thread, which would cost each poll a dozen
+    thread hops. The project's middleware chain is left as Django builds it;
+    responses just come from a chain of our own.
+    """
+
+    def __init__(self):
+        super().__init__()
+        handler = convert_exception_to_response(serve_view)
+        if "Elevator_app.metrics.MetricsMiddleware" in settings.MIDDLEWARE:
+            try:
+                handler = convert_exception_to_response(MetricsMiddleware(handler))
+            except MiddlewareNotUsed:
+                pass
+        self.reads_chain = handler
+
+    async def get_response_async(self, request):
+        set_urlconf(settings.ROOT_URLCONF)
+        return await self.reads_chain(request)
+
+
+async_reads_application = AsyncReadsHandler()
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "websocket":
+        await websocket_application(scope, receive, send)
+    elif scope["type"] == "http" and scope["path"].startswith(ASYNC_READS_PREFIX):
+        await async_reads_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
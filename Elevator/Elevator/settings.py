@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "Elevator_app.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -85,12 +87,15 @@ DATABASES = {
     }
 }
 
-# DATABASES = {
-#     "default": {
-#         "ENGINE": "django.db.backends.sqlite3",
-#         "NAME": BASE_DIR / "db.sqlite3",
-#     }
-# }
+# ELEVATOR_SQLITE=1 switches to the local SQLite file, e.g. to run the
+# benchmark commands without a PostgreSQL server.
+if os.environ.get("ELEVATOR_SQLITE"):
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+        }
+    }
 
 
 # Password validation
@@ -133,3 +138,149 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# Elevator dispatch
+# STRATEGY is one of "fifo", "look" or "eta" (see Elevator_app/dispatch.py).
+# It dispatches the default pool and every building not in BUILDING_STRATEGIES,
+# which maps a building id to the strategy of that building's cars.
+# With DESTINATION_GROUPING, requests with the same floors made within
+# GROUP_WINDOW_SECONDS of each other ride together, up to each car's capacity.
+
+ELEVATOR_DISPATCH = {
+    "STRATEGY": "fifo",
+    "BUILDING_STRATEGIES": {},
+    "FLOOR_TRAVEL_SECONDS": 1.5,
+    "STOP_SECONDS": 8.0,
+    "AGING_WEIGHT": 0.5,
+    "MAX_BATCH_SIZE": 1000,
+    "DESTINATION_GROUPING": False,
+    "GROUP_WINDOW_SECONDS": 30.0,
+}
+
+
+# In-memory elevator state store (Elevator_app/state.py)
+# When enabled, endpoints read and mutate state in memory and changes are
+# written to the database every FLUSH_INTERVAL seconds. JOURNAL is replayed
+# on start after a crash. Only enable it with a single serving process: a
+# second process starting a store on the same JOURNAL raises
+# ImproperlyConfigured, so the ticker must run in the serving process too:
+# set TICK_INTERVAL (seconds) instead of running run_elevators.
+
+ELEVATOR_STATE_STORE = {
+    "ENABLED": False,
+    "FLUSH_INTERVAL": 1.0,
+    "TICK_INTERVAL": None,
+    "JOURNAL": BASE_DIR / "elevator_state.journal",
+    "FSYNC": True,
+}
+
+
+# Redis read-through cache (Elevator_app/cache.py)
+# Reads fall back to the database while Redis is unreachable.
+
+ELEVATOR_CACHE = {
+    "ENABLED": False,
+    "URL": "redis://localhost:6379/0",
+    "TTL": 60,
+    "LOCK_TIMEOUT": 5,
+    "LOCK_WAIT": 0.5,
+    "SOCKET_TIMEOUT": 0.1,
+    "RETRY_AFTER": 30,
+}
+
+
+# Live updates over WebSockets (Elevator_app/streaming.py). With REDIS_URL
+# set, events are published on CHANNEL and relayed by every ASGI process, so
+# moves made by run_elevators or other workers reach every client. A client
+# with more than MAX_PENDING_ASSIGNMENTS undelivered assignments is closed.
+
+ELEVATOR_STREAMING = {
+    "REDIS_URL": None,
+    "CHANNEL": "elevator:events",
+    "MAX_PENDING_ASSIGNMENTS": 1000,
+    "SOCKET_TIMEOUT": 0.1,
+    "RETRY_AFTER": 30,
+}
+
+
+# Request, query, cache and dispatch metrics (Elevator_app/metrics.py),
+# served at /metrics in Prometheus text format.
+
+ELEVATOR_METRICS = {
+    "ENABLED": True,
+}
+
+
+# Request history archival (Elevator_app/archive.py), run by the
+# archive_requests command. Completed requests move to the archive table
+# after ARCHIVE_AFTER_DAYS and are deleted from it after RETENTION_DAYS;
+# their daily aggregates are kept.
+
+ELEVATOR_ARCHIVE = {
+    "ARCHIVE_AFTER_DAYS": 7,
+    "RETENTION_DAYS": 90,
+    "BATCH_SIZE": 1000,
+}
+
+
+# Event log of elevator state transitions (Elevator_app/events.py).
+# Every change is appended to PATH as a JSONL line; a snapshot of the
+# replayed state is written next to it every SNAPSHOT_EVERY events.
+
+ELEVATOR_EVENT_LOG = {
+    "ENABLED": False,
+    "PATH": BASE_DIR / "elevator_events.jsonl",
+    "SNAPSHOT_EVERY": 100000,
+    "FSYNC": False,
+}
+
+
+# Hail de-duplication (Elevator_app/dedup.py). A hail repeating a pending one
+# for the same floors and building within MERGE_WINDOW_SECONDS (off when
+# unset or 0) is merged into it; an Idempotency-Key is answered with its request for
+# IDEMPOTENCY_KEY_TTL seconds. Without Redis, at most MEMORY_ENTRIES recent
+# hails are remembered per process.
+
+ELEVATOR_DEDUP = {
+    "MERGE_WINDOW_SECONDS": 10,
+    "IDEMPOTENCY_KEY_TTL": 86400,
+    "MEMORY_ENTRIES": 100000,
+}
+
+
+# Responses are rendered by orjson (Elevator_app/renderers.py), byte for byte
+# as DRF's JSONRenderer would.
+
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "Elevator_app.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
+
+
+# Serialization fast path (Elevator_app/serializers.py). With FAST_PATH on,
+# get_user_requests and the list routes build their answers from .values()
+# rows instead of model instances, and the list routes stream them in
+# STREAM_BATCH_SIZE row pieces. The output is unchanged.
+
+ELEVATOR_SERIALIZATION = {
+    "FAST_PATH": False,
+    "STREAM_BATCH_SIZE": 1000,
+}
+
+
+# Predictive parking (Elevator_app/forecast.py). With ENABLED, the ticker
+# (run_elevators) parks idle cars where hails are forecast in the current
+# SLOT_MINUTES slot of the day, once that adds up to MIN_DEMAND hails. The
+# forecast starts from the last HISTORY_DAYS of requests, and each older day
+# weighs DECAY times less.
+
+ELEVATOR_PARKING = {
+    "ENABLED": False,
+    "SLOT_MINUTES": 15,
+    "DECAY": 0.9,
+    "HISTORY_DAYS": 28,
+    "MIN_DEMAND": 1.0,
+}
@@ -1,6 +1,22 @@
+import logging
+
 from django.apps import AppConfig
+from django.db import DatabaseError
+
+logger = logging.getLogger(__name__)
 
 
 class ElevatorAppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "Elevator_app"
+
+    def ready(self):
+        # A journal left by a crashed process is replayed before anything
+        # is served from the database it corrects.
+        from Elevator_app.state import recover_journal
+
+        try:
+            recover_journal()
+        except DatabaseError:
+            # Before the first migrate, say; the store recovers it on first use.
+            logger.warning("Could not recover the elevator state journal yet.", exc_info=True)
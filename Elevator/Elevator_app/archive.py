@@ -0,0 +1,188 @@
+"""
+Archival of completed request history.
+
+`move_elevator` only marks requests complete, so without archival the
+`UserRequest` table grows for ever. `archive_completed` moves completed
+requests created before a cutoff into `ArchivedUserRequest` and folds each
+one into the daily aggregates (`DailyElevatorTrips`, `DailyFloorPairTrips`)
+on the way. Every batch is a short transaction of its own: its rows are
+locked with SKIP LOCKED (so cars being served are never waited on), copied,
+counted and deleted together, so a batch is archived and counted exactly
+once and an interrupted run loses nothing. `prune_archive` then deletes
+archived requests past their retention, also in batches; the aggregates are
+kept.
+
+The archive_requests management command runs both with the cutoffs from
+ELEVATOR_ARCHIVE. Run one at a time.
+"""
+import datetime
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from Elevator_app.cache import get_cache
+from Elevator_app.models import (
+    ArchivedUserRequest,
+    DailyElevatorTrips,
+    DailyFloorPairTrips,
+    Elevator,
+    UserRequest,
+)
+
+ARCHIVED_FIELDS = ("requested_floor", "current_floor", "destination_floor", "created_at")
+
+
+def archive_setting(name, default):
+    return getattr(settings, "ELEVATOR_ARCHIVE", {}).get(name, default)
+
+
+def archive_completed(before, batch_size=1000, max_batches=None, pause=0.0):
+    """
+    Moves completed requests created before `before` to the archive, at most
+    `batch_size` per transaction, sleeping `pause` seconds between batches.
+    Returns (requests archived, batches).
+    """
+    archived = batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = _archive_batch(before, batch_size)
+        if not moved:
+            break
+        archived += moved
+        batches += 1
+        if pause:
+            time.sleep(pause)
+    return archived, batches
+
+
+def _archive_batch(before, batch_size):
+    with transaction.atomic():
+        rows = list(
+            UserRequest.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(is_complete=True, created_at__lt=before)
+            .order_by("pk")
+            .values("pk", "elevator_id", "elevator__building_id", *ARCHIVED_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return 0
+        # Ids are kept, so a row that is somehow already archived (and
+        # counted) is neither copied nor counted again, only deleted.
+        archived = set(
+            ArchivedUserRequest.objects.filter(
+                pk__in=[row["pk"] for row in rows]
+            ).values_list("pk", flat=True)
+        )
+        fresh = [row for row in rows if row["pk"] not in archived]
+        ArchivedUserRequest.objects.bulk_create(
+            [
+                ArchivedUserRequest(
+                    id=row["pk"],
+                    elevator_id=row["elevator_id"],
+                    building_id=row["elevator__building_id"],
+                    **{field: row[field] for field in ARCHIVED_FIELDS},
+                )
+                for row in fresh
+            ]
+        )
+        add_to_aggregates(fresh)
+        UserRequest.objects.filter(pk__in=[row["pk"] for row in rows]).delete()
+        # The cars' request lists changed, so their ETags must too.
+        Elevator.objects.filter(pk__in={row["elevator_id"] for row in rows}).update(
+            version=F("version") + 1
+        )
+    # Cached request lists may still show the archived requests.
+    get_cache().invalidate(
+        *{
+            row["elevator_id"]: Elevator(
+                pk=row["elevator_id"], building_id=row["elevator__building_id"]
+            )
+            for row in rows
+        }.values()
+    )
+    return len(rows)
+
+
+def trip_day(created_at):
+    return created_at.astimezone(datetime.timezone.utc).date()
+
+
+def add_to_aggregates(rows):
+    """
+    Counts `rows` (completed requests as dicts) into the daily trips of
+    their car and of their floor pair.
+    """
+    car_trips = Counter()
+    buildings = {}
+    pair_trips = Counter()
+    for row in rows:
+        day = trip_day(row["created_at"])
+        building = row["elevator__building_id"]
+        car_trips[(day, row["elevator_id"])] += 1
+        buildings[(day, row["elevator_id"])] = building
+        if row["requested_floor"] is not None and row["destination_floor"] is not None:
+            pair_trips[
+                (day, row["requested_floor"], row["destination_floor"], building)
+            ] += 1
+    _increment(
+        DailyElevatorTrips,
+        ("day", "elevator_id"),
+        car_trips,
+        lambda key: {"building_id": buildings[key]},
+    )
+    _increment(
+        DailyFloorPairTrips,
+        ("day", "requested_floor", "destination_floor", "building_id"),
+        pair_trips,
+    )
+
+
+def _increment(model, key_fields, counts, defaults=None):
+    """
+    Adds `counts[key]` to the trips of the `model` row identified by each key
+    (values of `key_fields`), creating the rows that do not exist yet.
+    """
+    # One query for the candidates, matching on the first two key fields, and
+    # narrowed to the exact keys here.
+    if not counts:
+        return
+    candidates = model.objects.select_for_update().filter(
+        **{
+            f"{field}__in": {key[position] for key in counts}
+            for position, field in enumerate(key_fields[:2])
+        }
+    )
+    existing = {}
+    for row in candidates:
+        key = tuple(getattr(row, field) for field in key_fields)
+        if key in counts:
+            row.trips += counts[key]
+            existing[key] = row
+    model.objects.bulk_update(existing.values(), ["trips"])
+    model.objects.bulk_create(
+        model(
+            **dict(zip(key_fields, key)),
+            trips=count,
+            **(defaults(key) if defaults else {}),
+        )
+        for key, count in counts.items()
+        if key not in existing
+    )
+
+
+def prune_archive(before, batch_size=1000):
+    """
+    Deletes archived requests created before `before`, `batch_size` per
+    statement. Returns how many were deleted.
+    """
+    pruned = 0
+    while True:
+        pks = list(
+            ArchivedUserRequest.objects.filter(created_at__lt=before)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not pks:
+            return pruned
+        pruned += ArchivedUserRequest.objects.filter(pk__in=pks).delete()[0]
@@ -0,0 +1,206 @@
+"""
+Async variants of the read endpoints, for high-concurrency polling.
+
+`get_user_requests`, `get_next_floor` and `check_direction` are also served
+at `/async/elevators/<pk>/<action>/` by plain async views. Served through the
+ASGI application they read with Django's async ORM and the async Redis
+client, so a poll waiting on the database or the cache does not hold a
+worker thread while it waits. The answers are computed by the same functions
+as the DRF actions in `views` and are byte-for-byte the same.
+"""
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed, JsonResponse
+from rest_framework import status
+from rest_framework.utils.urls import replace_query_param
+
+from Elevator_app.cache import get_async_cache
+from Elevator_app.dispatch import dispatch_setting, get_strategy, strategy_for
+from Elevator_app.models import Elevator
+from Elevator_app.renderers import FastJSONRenderer
+from Elevator_app.state import ElevatorState, aget_store
+from Elevator_app.views import (
+    direction_result,
+    elevator_buildings,
+    next_floor_result,
+    not_modified,
+    parse_user_request_query,
+    pending_query,
+    unavailable_result,
+    user_request_query,
+    user_request_result,
+    version_etag,
+    with_etag,
+)
+
+
+def render(data, status_code=status.HTTP_200_OK):
+    # Rendered as DRF renders the synchronous actions' responses.
+    return HttpResponse(
+        FastJSONRenderer().render(data), status=status_code, content_type="application/json"
+    )
+
+
+def not_found():
+    return render({"detail": "Not found."}, status.HTTP_404_NOT_FOUND)
+
+
+async def load_elevator(pk, store):
+    if store is not None:
+        elevator = store.get(pk)
+    else:
+        elevator = await Elevator.objects.filter(pk=pk).afirst()
+    if elevator is None:
+        raise Http404
+    return elevator
+
+
+async def pending_requests(elevator, strategy):
+    if isinstance(elevator, ElevatorState):
+        return elevator.queue(strategy.lookahead)
+    return [user_request async for user_request in pending_query(elevator, strategy)]
+
+
+async def building_of(pk, store):
+    if store is not None:
+        state = store.get(pk)
+        return state.building_id if state is not None else None
+    if pk not in elevator_buildings:
+        elevator_buildings[pk] = (
+            await Elevator.objects.filter(pk=pk).values_list("building_id", flat=True).afirst()
+        )
+    return elevator_buildings[pk]
+
+
+async def elevator_strategy(pk, store):
+    # See views.elevator_strategy.
+    if not dispatch_setting("BUILDING_STRATEGIES", {}):
+        return get_strategy()
+    return strategy_for(await building_of(pk, store))
+
+
+async def cached_answer(pk, name, compute, store, variant=None):
+    cache = get_async_cache()
+    building = await building_of(pk, store) if cache.available else None
+    return await cache.get_or_set(pk, name, compute, variant=variant, building=building)
+
+
+async def read_etag(pk, store, strategy=None):
+    if strategy is not None and strategy.time_dependent:
+        return None
+    if store is not None:
+        return version_etag(store.version(pk), strategy)
+    return version_etag(await database_version(pk, store), strategy)
+
+
+async def database_version(pk, store):
+    async def load():
+        version = await Elevator.objects.filter(pk=pk).values_list("version", flat=True).afirst()
+        return None if version is None else str(version)
+
+    return await cached_answer(pk, "version", load, store)
+
+
+async def request_list_etag(pk, store):
+    # See views.request_list_etag.
+    if store is None:
+        return await read_etag(pk, store)
+    version = store.version(pk)
+    if version is None:
+        return None
+    return version_etag(f"{version}.{await database_version(pk, store)}")
+
+
+async def next_floor_answer(pk, store):
+    elevator = await load_elevator(pk, store)
+    strategy = strategy_for(elevator.building_id)
+    return next_floor_result(elevator, await pending_requests(elevator, strategy), strategy)
+
+
+async def direction_answer(pk, store):
+    elevator = await load_elevator(pk, store)
+    unavailable = unavailable_result(elevator)
+    if unavailable:
+        return unavailable
+    strategy = strategy_for(elevator.building_id)
+    return direction_result(elevator, await pending_requests(elevator, strategy), strategy)
+
+
+async def user_request_page(pk, options):
+    if not await Elevator.objects.filter(pk=pk).aexists():
+        raise Http404
+    rows = [row async for row in user_request_query(pk, options)]
+    return user_request_result(rows, options)
+
+
+async def get_user_requests(request, pk):
+    """
+    Async variant of ElevatorViewSet.get_user_requests, with the same query
+    parameters and pagination headers.
+    Example: GET /async/elevators/1/get_user_requests/?is_complete=false
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    options, error = parse_user_request_query(request.GET)
+    if error:
+        return render({"error": error}, status.HTTP_400_BAD_REQUEST)
+    store = await aget_store()
+    etag = await request_list_etag(pk, store)
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    variant = "&".join(f"{name}={value}" for name, value in sorted(request.GET.items()))
+    try:
+        page = await cached_answer(
+            pk, "requests", lambda: user_request_page(pk, options), store, variant=variant
+        )
+    except Http404:
+        return not_found()
+    response = render(page["results"])
+    if page["next_cursor"]:
+        next_url = replace_query_param(
+            request.build_absolute_uri(), "cursor", page["next_cursor"]
+        )
+        response["X-Next-Cursor"] = page["next_cursor"]
+        response["Link"] = f'<{next_url}>; rel="next"'
+    return with_etag(response, etag)
+
+
+async def get_next_floor(request, pk):
+    """
+    Async variant of ElevatorViewSet.get_next_floor.
+    Example: GET /async/elevators/1/get_next_floor/
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    store = await aget_store()
+    etag = await read_etag(pk, store, await elevator_strategy(pk, store))
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    try:
+        status_code, payload = await cached_answer(
+            pk, "next_floor", lambda: next_floor_answer(pk, store), store
+        )
+    except Http404:
+        return not_found()
+    return with_etag(JsonResponse(payload, status=status_code), etag)
+
+
+async def check_direction(request, pk):
+    """
+    Async variant of ElevatorViewSet.check_direction.
+    Example: GET /async/elevators/1/check_direction/
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    store = await aget_store()
+    etag = await read_etag(pk, store, await elevator_strategy(pk, store))
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    try:
+        status_code, payload = await cached_answer(
+            pk, "direction", lambda: direction_answer(pk, store), store
+        )
+    except Http404:
+        return not_found()
+    return with_etag(JsonResponse(payload, status=status_code), etag)
@@ -0,0 +1,380 @@
+"""
+Redis read-through cache for per-elevator answers.
+
+Each elevator has a few cached entries (its serialized request list, its
+next-floor and direction answers and the version its ETags are made of) under
+`building:{<building>}:elevator:<pk>:<name>`. The braces make the building a
+Redis Cluster hash tag, so every key of one site lives on one shard and
+sites sharing a cluster do not contend for each other's slots. Entries that
+vary with query parameters (request-list pages) are fields of a Redis hash at
+that key, so one DEL still drops every variant. Views read them through
+`ElevatorCache.get_or_set` and drop them with `invalidate` whenever that
+elevator's queue or state changes, so entries never outlive a mutation; the
+TTL only bounds answers that drift with time. On a miss a short `SET NX` lock
+lets one caller recompute while the others wait briefly for its result
+instead of all hitting the database.
+
+Every entry is stamped with its elevator's generation, a counter under the
+same hash tag that `invalidate` increments, and is only served while the
+stamp is current. An answer computed before an invalidation and stored after
+it is therefore never served, and neither is the ETag version cached with it.
+
+If Redis is unreachable the cache steps aside for RETRY_AFTER seconds and
+every read goes straight to the database. Invalidations made meanwhile are
+kept and replayed before the cache serves anything again.
+
+`AsyncElevatorCache` is the same cache over a `redis.asyncio` client, for the
+async read views. The two caches of a process share their `CacheHealth`, so
+either one replays the invalidations the other could not send.
+"""
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+
+import redis
+import redis.asyncio
+from django.conf import settings
+
+from Elevator_app.metrics import record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+CACHED_ANSWERS = ("requests", "next_floor", "direction", "version")
+
+
+def cache_setting(name, default):
+    return getattr(settings, "ELEVATOR_CACHE", {}).get(name, default)
+
+
+class CacheHealth:
+    """
+    When Redis was last seen down and the invalidations it has not seen yet,
+    shared by the sync and async caches of a process: an invalidation either
+    one fails to send is replayed before the other serves a read.
+    """
+
+    def __init__(self):
+        self.down_until = 0.0
+        # (pk, building) of invalidations Redis has not seen yet.
+        self.unsent = set()
+        self.lock = threading.Lock()
+
+
+class ElevatorCache:
+    def __init__(
+        self,
+        client=None,
+        ttl=60,
+        lock_timeout=5,
+        lock_wait=0.5,
+        retry_after=30,
+        health=None,
+    ):
+        self.client = client
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.lock_wait = lock_wait
+        self.retry_after = retry_after
+        self.health = health or CacheHealth()
+
+    @staticmethod
+    def key(pk, name, building=None):
+        building = "default" if building is None else building
+        return f"building:{{{building}}}:elevator:{pk}:{name}"
+
+    @property
+    def available(self):
+        return self.client is not None and time.monotonic() >= self.health.down_until
+
+    def _mark_down(self):
+        logger.warning("Redis unavailable, serving elevator reads from the database.")
+        self.health.down_until = time.monotonic() + self.retry_after
+
+    def _call(self, method, *args, **kwargs):
+        try:
+            return getattr(self.client, method)(*args, **kwargs)
+        except redis.RedisError:
+            self._mark_down()
+            raise
+
+    @staticmethod
+    def _current(cached, generation):
+        # (value, generation): the value only if stamped with the generation.
+        generation = int(generation or 0)
+        if cached is not None:
+            stamp, _, value = cached.decode().partition(":")
+            if int(stamp) == generation:
+                return value, generation
+        return None, generation
+
+    def _read(self, key, variant, generation_key):
+        # The entry and its generation share a hash tag, so MGET works on a
+        # cluster too.
+        if variant is None:
+            return self._current(*self._call("mget", [key, generation_key]))
+        cached = self._call("hget", key, variant)
+        return self._current(cached, self._call("get", generation_key))
+
+    def _write(self, key, variant, value):
+        # Jitter keeps entries written together from expiring together.
+        ttl = self.ttl + random.randint(0, self.ttl // 10)
+        if variant is None:
+            self._call("set", key, value, ex=ttl)
+        else:
+            self._call("hset", key, variant, value)
+            self._call("expire", key, ttl)
+
+    def get_or_set(self, pk, name, compute, variant=None, building=None):
+        """
+        Returns the cached value for `name` (and `variant`, if given) on
+        elevator `pk` of `building`, computing and storing it on a miss.
+        `compute` must return a JSON-serializable value.
+        """
+        if self.health.unsent:
+            self.invalidate()
+        if not self.available or self.health.unsent:
+            record_cache_lookup(name, "bypass")
+            return compute()
+        key = self.key(pk, name, building)
+        lock_key = f"{key}:lock" if variant is None else f"{key}:{variant}:lock"
+        generation_key = self.key(pk, "generation", building)
+        try:
+            cached, generation = self._read(key, variant, generation_key)
+            if cached is not None:
+                record_cache_lookup(name, "hit")
+                return json.loads(cached)
+            if not self._call("set", lock_key, 1, nx=True, ex=self.lock_timeout):
+                cached = self._wait_for(key, variant, generation_key)
+                if cached is not None:
+                    record_cache_lookup(name, "hit")
+                    return json.loads(cached)
+        except redis.RedisError:
+            record_cache_lookup(name, "bypass")
+            return compute()
+        record_cache_lookup(name, "miss")
+        value = compute()
+        try:
+            # Stamped with the generation read before computing: if the
+            # elevator was invalidated meanwhile, the entry is never served.
+            self._write(key, variant, f"{generation}:{json.dumps(value)}")
+            self._call("delete", lock_key)
+        except redis.RedisError:
+            pass
+        return value
+
+    def _wait_for(self, key, variant, generation_key):
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            time.sleep(0.02)
+            cached, _ = self._read(key, variant, generation_key)
+            if cached is not None:
+                return cached
+        return None
+
+    def lookup(self, key):
+        """
+        Value stored under `key` by `remember`, or None if there is none or
+        Redis is unavailable.
+        """
+        if not self.available:
+            return None
+        try:
+            return self._call("get", key)
+        except redis.RedisError:
+            return None
+
+    def remember(self, key, value, ttl):
+        """
+        Stores `value` under `key` for `ttl` seconds. Returns whether it was
+        stored.
+        """
+        if not self.available:
+            return False
+        try:
+            self._call("set", key, value, ex=ttl)
+        except redis.RedisError:
+            return False
+        return True
+
+    def _take_unsent(self, elevators):
+        # The invalidations to send now: `elevators` and any not sent yet.
+        with self.health.lock:
+            targets = self.health.unsent | {
+                (elevator.pk, elevator.building_id) for elevator in elevators
+            }
+            self.health.unsent = set()
+        return targets
+
+    def _keep_unsent(self, targets):
+        with self.health.lock:
+            self.health.unsent |= targets
+
+    def _invalidation(self, targets):
+        # One round trip: bump each generation and drop the entries.
+        pipeline = self.client.pipeline(transaction=False)
+        for pk, building in targets:
+            pipeline.incr(self.key(pk, "generation", building))
+            pipeline.delete(*(self.key(pk, name, building) for name in CACHED_ANSWERS))
+        return pipeline
+
+    def invalidate(self, *elevators):
+        """
+        Drops the cached answers of `elevators` (anything with `pk` and
+        `building_id`) and bumps their generation. Invalidations that do not
+        reach Redis are kept and sent again with the next one, before any
+        read is served from the cache.
+        """
+        if self.client is None:
+            return
+        targets = self._take_unsent(elevators)
+        if not targets:
+            return
+        if not self.available:
+            self._keep_unsent(targets)
+            return
+        try:
+            self._invalidation(targets).execute()
+        except redis.RedisError:
+            self._mark_down()
+            self._keep_unsent(targets)
+
+
+class AsyncElevatorCache(ElevatorCache):
+    """
+    `ElevatorCache` for async views: the same keys, locking and fallback, but
+    every Redis call is awaited instead of blocking the event loop, and
+    `compute` is a coroutine function.
+    """
+
+    async def _call(self, method, *args, **kwargs):
+        try:
+            return await getattr(self.client, method)(*args, **kwargs)
+        except redis.RedisError:
+            self._mark_down()
+            raise
+
+    async def _read(self, key, variant, generation_key):
+        if variant is None:
+            return self._current(*await self._call("mget", [key, generation_key]))
+        cached = await self._call("hget", key, variant)
+        return self._current(cached, await self._call("get", generation_key))
+
+    async def _write(self, key, variant, value):
+        ttl = self.ttl + random.randint(0, self.ttl // 10)
+        if variant is None:
+            await self._call("set", key, value, ex=ttl)
+        else:
+            await self._call("hset", key, variant, value)
+            await self._call("expire", key, ttl)
+
+    async def get_or_set(self, pk, name, compute, variant=None, building=None):
+        if self.health.unsent:
+            await self.invalidate()
+        if not self.available or self.health.unsent:
+            record_cache_lookup(name, "bypass")
+            return await compute()
+        key = self.key(pk, name, building)
+        lock_key = f"{key}:lock" if variant is None else f"{key}:{variant}:lock"
+        generation_key = self.key(pk, "generation", building)
+        try:
+            cached, generation = await self._read(key, variant, generation_key)
+            if cached is not None:
+                record_cache_lookup(name, "hit")
+                return json.loads(cached)
+            if not await self._call("set", lock_key, 1, nx=True, ex=self.lock_timeout):
+                cached = await self._wait_for(key, variant, generation_key)
+                if cached is not None:
+                    record_cache_lookup(name, "hit")
+                    return json.loads(cached)
+        except redis.RedisError:
+            record_cache_lookup(name, "bypass")
+            return await compute()
+        record_cache_lookup(name, "miss")
+        value = await compute()
+        try:
+            await self._write(key, variant, f"{generation}:{json.dumps(value)}")
+            await self._call("delete", lock_key)
+        except redis.RedisError:
+            pass
+        return value
+
+    async def _wait_for(self, key, variant, generation_key):
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.02)
+            cached, _ = await self._read(key, variant, generation_key)
+            if cached is not None:
+                return cached
+        return None
+
+    async def invalidate(self, *elevators):
+        if self.client is None:
+            return
+        targets = self._take_unsent(elevators)
+        if not targets:
+            return
+        if not self.available:
+            self._keep_unsent(targets)
+            return
+        try:
+            await self._invalidation(targets).execute()
+        except redis.RedisError:
+            self._mark_down()
+            self._keep_unsent(targets)
+
+
+_cache = None
+_async_cache = None
+_cache_lock = threading.Lock()
+_health = CacheHealth()
+
+
+def _cache_options():
+    return {
+        "ttl": cache_setting("TTL", 60),
+        "lock_timeout": cache_setting("LOCK_TIMEOUT", 5),
+        "lock_wait": cache_setting("LOCK_WAIT", 0.5),
+        "retry_after": cache_setting("RETRY_AFTER", 30),
+        "health": _health,
+    }
+
+
+def _client(module):
+    if not cache_setting("ENABLED", False):
+        return None
+    return module.Redis.from_url(
+        cache_setting("URL", "redis://localhost:6379/0"),
+        socket_connect_timeout=cache_setting("SOCKET_TIMEOUT", 0.1),
+        socket_timeout=cache_setting("SOCKET_TIMEOUT", 0.1),
+    )
+
+
+def get_cache():
+    """
+    Returns the process-wide cache. With ELEVATOR_CACHE["ENABLED"] off it has
+    no client and every read is computed directly.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ElevatorCache(_client(redis), **_cache_options())
+    return _cache
+
+
+def get_async_cache():
+    """
+    Returns the process-wide cache for async views. Its client opens
+    connections on the event loop serving the ASGI application.
+    """
+    global _async_cache
+    if _async_cache is None:
+        with _cache_lock:
+            if _async_cache is None:
+                _async_cache = AsyncElevatorCache(
+                    _client(redis.asyncio), **_cache_options()
+                )
+    return _async_cache
@@ -0,0 +1,174 @@
+"""
+De-duplication of hails.
+
+Hall buttons get pressed again and gateways retry on timeout, so the same
+hail often arrives more than once. `save_user_request` answers a repeat with
+the original assignment and writes nothing:
+
+- A hail carrying an `Idempotency-Key` header that was already saved gets
+  that request back for IDEMPOTENCY_KEY_TTL seconds. The key is also stored
+  on the request under a unique constraint, so a retry racing the original
+  (or reaching a process that never saw it) still cannot create a second row.
+- A hail for the same floors and building as a pending request made less
+  than MERGE_WINDOW_SECONDS earlier is merged into it. Merging is off unless
+  the window is set, and skipped with destination grouping on, where every
+  hail is a passenger.
+
+Saved hails are remembered in Redis (through the cache's client) while the
+cache is enabled and reachable, otherwise in a bounded in-process table, so
+finding a repeat takes no query. A merge is only made while the remembered
+request is still pending, which costs one indexed read unless the state
+store is enabled.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from Elevator_app.cache import get_cache
+from Elevator_app.dispatch import group_window
+from Elevator_app.models import UserRequest
+from Elevator_app.state import get_store
+
+MAX_IDEMPOTENCY_KEY_LENGTH = 100
+
+
+def dedup_setting(name, default):
+    return getattr(settings, "ELEVATOR_DEDUP", {}).get(name, default)
+
+
+def merge_window():
+    """
+    Seconds within which identical hails are merged, or None when merging
+    is off.
+    """
+    if group_window() is not None:
+        return None
+    return dedup_setting("MERGE_WINDOW_SECONDS", None) or None
+
+
+class MemoryTable:
+    """
+    Keys with an expiry, oldest dropped first beyond `max_entries`.
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + ttl, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+memory = MemoryTable(dedup_setting("MEMORY_ENTRIES", 100000))
+
+
+def idempotency_key(key):
+    return f"idempotency:{key}"
+
+
+def hail_key(building, requested_floor, destination_floor):
+    building = "default" if building is None else building
+    return f"building:{{{building}}}:hail:{requested_floor}:{destination_floor}"
+
+
+def lookup(key):
+    """
+    `(request id, elevator id)` remembered under `key`, or None.
+    """
+    value = get_cache().lookup(key) or memory.get(key)
+    if value is None:
+        return None
+    return tuple(json.loads(value))
+
+
+def remember(key, request_id, elevator_id, ttl):
+    value = json.dumps([request_id, elevator_id])
+    if not get_cache().remember(key, value, ttl):
+        memory.set(key, value, ttl)
+
+
+def remember_hail(user_request, building, key=None):
+    """
+    Remembers a saved hail under its floors and, if given, its idempotency key.
+    """
+    if key is not None:
+        remember(
+            idempotency_key(key),
+            user_request.pk,
+            user_request.elevator_id,
+            dedup_setting("IDEMPOTENCY_KEY_TTL", 86400),
+        )
+    window = merge_window()
+    if window is not None:
+        remember(
+            hail_key(building, user_request.requested_floor, user_request.destination_floor),
+            user_request.pk,
+            user_request.elevator_id,
+            window,
+        )
+
+
+def is_pending(request_id, elevator_id, requested_floor, destination_floor):
+    """
+    Whether request `request_id` for these floors is still queued on car
+    `elevator_id`.
+    """
+    store = get_store()
+    if store is None:
+        return UserRequest.objects.filter(
+            pk=request_id,
+            elevator_id=elevator_id,
+            requested_floor=requested_floor,
+            destination_floor=destination_floor,
+            is_complete=False,
+        ).exists()
+    state = store.get(elevator_id)
+    return state is not None and any(
+        pending.pk == request_id
+        and pending.requested_floor == requested_floor
+        and pending.destination_floor == destination_floor
+        for pending in state.pending
+    )
+
+
+def find_duplicate(building, requested_floor, destination_floor, key=None):
+    """
+    `(request id, elevator id)` of the saved hail that this one repeats, or
+    None if it is new. A hail merged into another keeps answering retries
+    of its `key` with that request.
+    """
+    if key is not None:
+        found = lookup(idempotency_key(key))
+        if found is not None:
+            return found
+    if merge_window() is None:
+        return None
+    found = lookup(hail_key(building, requested_floor, destination_floor))
+    if found is None or not is_pending(*found, requested_floor, destination_floor):
+        return None
+    if key is not None:
+        remember(idempotency_key(key), *found, dedup_setting("IDEMPOTENCY_KEY_TTL", 86400))
+    return found
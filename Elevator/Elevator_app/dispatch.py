@@ -0,0 +1,467 @@
+"""
+Dispatch strategies for the elevator system.
+
+A strategy answers two questions: which car should take a new hail
+(`select_elevator`) and which pending request a car should serve next
+(`next_request`). Strategies only read plain attributes (`current_floor`,
+`direction`, `pending_destination`, `pending_count` on cars and
+`requested_floor`, `destination_floor`, `created_at` on requests), so the
+same code drives the API views and the offline simulator.
+
+With destination grouping (ELEVATOR_DISPATCH["DESTINATION_GROUPING"]), a
+car picking up a passenger also boards every queued request with the same
+pickup and destination floors made within GROUP_WINDOW_SECONDS of it, up to
+the car's `capacity`, and carries the whole group in one move. New hails
+join a car that already has such a group waiting.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+
+from Elevator_app.eta_index import EtaIndex
+
+UP = 1
+DOWN = -1
+IDLE = 0
+
+# Below this many cars, scoring every car beats maintaining an index.
+INDEX_MIN_ELEVATORS = 32
+
+
+def dispatch_setting(name, default):
+    return getattr(settings, "ELEVATOR_DISPATCH", {}).get(name, default)
+
+
+def group_window():
+    """
+    Seconds within which requests with the same floors travel together, or
+    None when destination grouping is off.
+    """
+    if not dispatch_setting("DESTINATION_GROUPING", False):
+        return None
+    return dispatch_setting("GROUP_WINDOW_SECONDS", 30.0)
+
+
+def passenger_group(user_request, pending, capacity, window):
+    """
+    `user_request` and the requests in `pending` boarding with it: same
+    pickup and destination floors, made within `window` seconds of it, at
+    most `capacity` in all.
+    """
+    group = [user_request]
+    for other in pending:
+        if len(group) >= capacity:
+            break
+        if (
+            other is not user_request
+            and other.requested_floor == user_request.requested_floor
+            and other.destination_floor == user_request.destination_floor
+            and abs(_seconds(other.created_at - user_request.created_at)) <= window
+        ):
+            group.append(other)
+    return group
+
+
+def joinable_car(elevators, requested_floor, destination_floor, now, window):
+    """
+    The car among `elevators` (with their queues in `pending`) that has a
+    group for these floors waiting, started less than `window` seconds
+    before `now` and with room left, or None. The oldest such group wins.
+    """
+    best = None
+    for elevator in elevators:
+        waiting = [
+            user_request
+            for user_request in elevator.pending
+            if user_request.requested_floor == requested_floor
+            and user_request.destination_floor == destination_floor
+            and getattr(user_request, "boarded_at", None) is None
+        ]
+        if not waiting or len(waiting) >= elevator.capacity:
+            continue
+        started = min(user_request.created_at for user_request in waiting)
+        if _seconds(now - started) <= window and (best is None or started < best[0]):
+            best = (started, elevator)
+    return best[1] if best else None
+
+
+def target_floor(user_request, current_floor):
+    """
+    Floor a car heads to when serving `user_request` from `current_floor`.
+    A car already at the pickup floor carries the passenger to the destination.
+    """
+    if current_floor == user_request.requested_floor:
+        return user_request.destination_floor
+    return user_request.requested_floor
+
+
+def direction_to(current_floor, next_floor):
+    if next_floor > current_floor:
+        return UP
+    if next_floor < current_floor:
+        return DOWN
+    return IDLE
+
+
+def apply_move(strategy, elevator, pending, now=None, window=None):
+    """
+    Performs one move_elevator step on `elevator` in memory: the car goes to
+    the next floor of the request `strategy` picks, completing that request if
+    the car was at its pickup floor. With a grouping `window`, the rest of the
+    request's group in `pending` is completed with it. Returns the list of
+    completed requests, or None if nothing is pending. The caller persists the
+    change.
+    """
+    user_request = strategy.next_request(elevator, pending, now=now)
+    if user_request is None:
+        return None
+    current_floor = elevator.current_floor
+    completed = []
+    if current_floor == user_request.requested_floor:
+        completed = [user_request]
+        if window is not None:
+            completed = passenger_group(user_request, pending, elevator.capacity, window)
+    elevator.current_floor = target_floor(user_request, current_floor)
+    elevator.direction = direction_to(current_floor, elevator.current_floor)
+    return completed
+
+
+def plan_sweep(strategy, elevator, pending, now=None):
+    """
+    Plans a sweep: the trip of the request `strategy` picks sets the
+    direction, and the car serves every request in `pending` travelling
+    that way whose pickup floor is still ahead, stopping at each pickup and
+    drop-off floor in order. If the car is beyond the first pickup floor it
+    goes there first. Passengers board in queue order while the car has
+    room. Returns the stops as `(floor, boarding, alighting)` lists of
+    requests, or None if the picked request has no direction (or nothing is
+    pending).
+    """
+    first = strategy.next_request(elevator, pending, now=now)
+    if first is None:
+        return None
+    direction = direction_to(first.requested_floor, first.destination_floor)
+    if direction == IDLE:
+        return None
+    origin = elevator.current_floor
+    if direction_to(origin, first.requested_floor) not in (direction, IDLE):
+        origin = first.requested_floor
+    waiting = {}
+    for user_request in pending:
+        if direction_to(
+            user_request.requested_floor, user_request.destination_floor
+        ) == direction and direction_to(origin, user_request.requested_floor) in (
+            direction,
+            IDLE,
+        ):
+            waiting.setdefault(user_request.requested_floor, []).append(user_request)
+    riding = {}
+    stops = []
+    floor = origin
+    load = 0
+    if origin != elevator.current_floor:
+        stops.append((origin, [], []))
+    while waiting or riding:
+        alighting = riding.pop(floor, [])
+        load -= len(alighting)
+        boarding = []
+        for user_request in waiting.pop(floor, []):
+            if load >= elevator.capacity:
+                # Left for a later trip.
+                continue
+            boarding.append(user_request)
+            riding.setdefault(user_request.destination_floor, []).append(user_request)
+            load += 1
+        if boarding or alighting:
+            if stops and stops[-1][0] == floor:
+                stops[-1] = (floor, boarding, alighting)
+            else:
+                stops.append((floor, boarding, alighting))
+        ahead = [
+            stop
+            for stop in (*riding, *waiting)
+            if direction_to(floor, stop) == direction
+        ]
+        if not riding and not ahead:
+            break
+        floor = min(ahead, key=lambda stop: abs(stop - floor))
+    return stops
+
+
+def apply_sweep(strategy, elevator, pending, now=None):
+    """
+    Performs a whole sweep (see `plan_sweep`) on `elevator` in memory: the
+    car ends at the last stop and every passenger who boarded is completed.
+    Returns `(completed requests, stops)`, or None if there is no sweep to
+    make. The caller persists the change.
+    """
+    stops = plan_sweep(strategy, elevator, pending, now=now)
+    if not stops:
+        return None
+    current_floor = elevator.current_floor
+    elevator.current_floor = stops[-1][0]
+    elevator.direction = direction_to(current_floor, elevator.current_floor)
+    completed = [user_request for _, boarding, _ in stops for user_request in boarding]
+    return completed, stops
+
+
+def _seconds(delta):
+    if isinstance(delta, timedelta):
+        return delta.total_seconds()
+    return delta
+
+
+class DispatchStrategy:
+    """
+    Base class for dispatch strategies.
+    `lookahead` is how many pending requests (oldest first) `next_request`
+    needs to see; None means the whole queue. `time_dependent` strategies
+    may pick a different request as time passes without any write.
+    """
+
+    name = None
+    lookahead = None
+    time_dependent = False
+
+    def score(self, elevator, requested_floor, destination_floor):
+        raise NotImplementedError
+
+    def select_elevator(self, elevators, requested_floor, destination_floor):
+        """
+        Returns the candidate with the lowest score, or None if there are none.
+        Ties go to the earliest candidate.
+        """
+        return min(
+            elevators,
+            key=lambda elevator: self.score(elevator, requested_floor, destination_floor),
+            default=None,
+        )
+
+    def next_request(self, elevator, pending, now=None):
+        raise NotImplementedError
+
+    def index(self, elevators):
+        """
+        Returns a structure answering `best(requested_floor)` faster than
+        scoring every car, or None if the strategy has none.
+        """
+        return None
+
+
+class FIFOStrategy(DispatchStrategy):
+    """
+    Serves each car's requests strictly in arrival order and assigns hails to
+    the car whose oldest pending request ends nearest to the hail.
+    """
+
+    name = "fifo"
+    lookahead = 1
+
+    def score(self, elevator, requested_floor, destination_floor):
+        if elevator.pending_destination is not None:
+            return abs(requested_floor - elevator.pending_destination)
+        return abs(requested_floor - elevator.current_floor)
+
+    def next_request(self, elevator, pending, now=None):
+        return pending[0] if pending else None
+
+
+class LookStrategy(DispatchStrategy):
+    """
+    LOOK collective control: a car keeps sweeping in its current direction,
+    picking up the nearest call ahead of it, and reverses only when nothing is
+    left ahead (SCAN that turns at the last call instead of the top floor).
+    A passenger already at their pickup floor is always carried first.
+    """
+
+    name = "look"
+
+    def score(self, elevator, requested_floor, destination_floor):
+        distance = abs(requested_floor - elevator.current_floor)
+        heading = direction_to(elevator.current_floor, requested_floor)
+        if elevator.direction in (IDLE, heading) or elevator.pending_destination is None:
+            return distance
+        # Moving away: the car finishes its sweep before coming back.
+        turnaround = elevator.pending_destination
+        return abs(elevator.current_floor - turnaround) + abs(turnaround - requested_floor)
+
+    def next_request(self, elevator, pending, now=None):
+        if not pending:
+            return None
+        current_floor = elevator.current_floor
+        for user_request in pending:
+            if user_request.requested_floor == current_floor:
+                return user_request
+        direction = elevator.direction or direction_to(
+            current_floor, pending[0].requested_floor
+        )
+        ahead = [
+            user_request
+            for user_request in pending
+            if direction_to(current_floor, user_request.requested_floor) == direction
+        ]
+        candidates = ahead or pending
+        return min(
+            candidates, key=lambda user_request: abs(user_request.requested_floor - current_floor)
+        )
+
+
+class ETAStrategy(DispatchStrategy):
+    """
+    Cost-based scheduling on estimated time to destination. Hails go to the
+    car with the lowest estimated arrival at the pickup floor, counting the
+    stops already queued on it; each car serves the request with the lowest
+    estimated completion time, discounted by how long it has waited so that
+    distant calls are not starved.
+    """
+
+    name = "eta"
+
+    def __init__(self, floor_travel_seconds=None, stop_seconds=None, aging_weight=None):
+        self.floor_travel_seconds = (
+            floor_travel_seconds
+            if floor_travel_seconds is not None
+            else dispatch_setting("FLOOR_TRAVEL_SECONDS", 1.5)
+        )
+        self.stop_seconds = (
+            stop_seconds if stop_seconds is not None else dispatch_setting("STOP_SECONDS", 8.0)
+        )
+        self.aging_weight = (
+            aging_weight if aging_weight is not None else dispatch_setting("AGING_WEIGHT", 0.5)
+        )
+
+    @property
+    def time_dependent(self):
+        return bool(self.aging_weight)
+
+    def travel_time(self, from_floor, to_floor):
+        return abs(from_floor - to_floor) * self.floor_travel_seconds
+
+    def anchor(self, elevator):
+        """
+        Floor the car is projected to be at once its queued work is done.
+        """
+        if elevator.pending_destination is None:
+            return elevator.current_floor
+        return elevator.pending_destination
+
+    def base_cost(self, elevator):
+        """
+        Seconds until the car can head for a new hail from its anchor floor.
+        """
+        if elevator.pending_destination is None:
+            return 0.0
+        # Every queued request costs a pickup and a drop-off stop.
+        queued = 2 * (elevator.pending_count or 0) * self.stop_seconds
+        return self.travel_time(elevator.current_floor, elevator.pending_destination) + queued
+
+    def score(self, elevator, requested_floor, destination_floor):
+        return self.base_cost(elevator) + self.travel_time(self.anchor(elevator), requested_floor)
+
+    def index(self, elevators):
+        return EtaIndex(self, elevators)
+
+    def completion_time(self, current_floor, user_request):
+        pickup = self.travel_time(current_floor, user_request.requested_floor)
+        if current_floor != user_request.requested_floor:
+            pickup += self.stop_seconds
+        return pickup + self.travel_time(
+            user_request.requested_floor, user_request.destination_floor
+        )
+
+    def next_request(self, elevator, pending, now=None):
+        if not pending:
+            return None
+
+        def cost(user_request):
+            waited = 0
+            if now is not None:
+                waited = _seconds(now - user_request.created_at)
+            return (
+                self.completion_time(elevator.current_floor, user_request)
+                - self.aging_weight * waited
+            )
+
+        return min(pending, key=cost)
+
+
+class Projection:
+    """
+    A candidate car plus the load assigned to it earlier in the same batch.
+    """
+
+    __slots__ = (
+        "elevator",
+        "pk",
+        "current_floor",
+        "direction",
+        "pending_destination",
+        "pending_count",
+        "queue_tail",
+    )
+
+    def __init__(self, elevator):
+        self.elevator = elevator
+        self.pk = elevator.pk
+        self.current_floor = elevator.current_floor
+        self.direction = elevator.direction
+        self.pending_destination = elevator.pending_destination
+        self.pending_count = elevator.pending_count or 0
+        self.queue_tail = elevator.queue_tail or 0
+
+    def take(self, destination_floor):
+        """
+        Adds a hail to `destination_floor` to the load; returns its queue position.
+        """
+        if self.pending_destination is None:
+            self.pending_destination = destination_floor
+        self.pending_count += 1
+        self.queue_tail += 1
+        return self.queue_tail
+
+
+def bank_indexes(strategy, projections):
+    """
+    `strategy`'s index over the `projections` of each bank, for a batch of
+    hails to pick cars from as its own hails load them, as
+    `{bank: (index, a car of the bank)}`. None if the strategy has no index
+    or there are fewer than INDEX_MIN_ELEVATORS cars, which a scan serves
+    faster.
+    """
+    if len(projections) < INDEX_MIN_ELEVATORS:
+        return None
+    banks = {}
+    for projection in projections:
+        banks.setdefault(getattr(projection.elevator, "bank_id", None), []).append(projection)
+    indexes = {}
+    for bank, cars in banks.items():
+        index = strategy.index(cars)
+        if index is None:
+            return None
+        indexes[bank] = (index, cars[0].elevator)
+    return indexes
+
+
+STRATEGIES = {
+    strategy.name: strategy for strategy in (FIFOStrategy, LookStrategy, ETAStrategy)
+}
+
+
+def get_strategy(name=None):
+    """
+    Returns a strategy instance by name, defaulting to
+    ELEVATOR_DISPATCH["STRATEGY"] from settings.
+    """
+    name = name or dispatch_setting("STRATEGY", FIFOStrategy.name)
+    try:
+        return STRATEGIES[name]()
+    except KeyError:
+        raise ValueError(f"Unknown dispatch strategy: {name!r}") from None
+
+
+def strategy_for(building):
+    """
+    Returns the strategy of `building` (None for the default pool): its entry
+    in ELEVATOR_DISPATCH["BUILDING_STRATEGIES"] if it has one, else STRATEGY.
+    """
+    return get_strategy(dispatch_setting("BUILDING_STRATEGIES", {}).get(building))
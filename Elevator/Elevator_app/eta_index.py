@@ -0,0 +1,170 @@
+"""
+Indexed lowest-ETA car selection.
+
+`ETAStrategy` scores a car for a hail at floor `f` as a fixed cost for the
+work already queued on it plus travel from its anchor floor (where it will
+be once that work is done): `base + k * |anchor - f|`, with `k` seconds per
+floor. For cars anchored at or below `f` that is `(base - k * anchor) + k * f`,
+and for cars anchored at or above it `(base + k * anchor) - k * f`, so the
+best car is the minimum of the first term over a prefix of floors or of the
+second over a suffix.
+
+`EtaIndex` keeps, for every anchor floor, a heap of the cars anchored there
+by base cost, and a segment tree over floors holding both terms for each
+floor's cheapest car. Re-indexing a car after it changes and finding the
+best car for a hail both take O(log floors + log cars) instead of a scan
+of the bank.
+"""
+import heapq
+import math
+
+_EMPTY = (math.inf, 0)
+
+
+class EtaIndex:
+    def __init__(self, strategy, elevators=()):
+        self.strategy = strategy
+        self.k = strategy.floor_travel_seconds
+        self._entries = {}
+        self._heaps = {}
+        self._counts = {}
+        self._sequence = 0
+        self._size = 1
+        self._low = [_EMPTY, _EMPTY]
+        self._high = [_EMPTY, _EMPTY]
+        for elevator in elevators:
+            self.update(elevator)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, pk):
+        return pk in self._entries
+
+    def update(self, elevator):
+        """
+        Re-indexes `elevator` from its current state; cars in maintenance or
+        with the door open are dropped, as they cannot take hails.
+        """
+        unavailable = getattr(elevator, "in_maintenance", False) or getattr(
+            elevator, "is_door_open", False
+        )
+        if unavailable:
+            self.remove(elevator.pk)
+            return
+        anchor = self.strategy.anchor(elevator)
+        base = self.strategy.base_cost(elevator)
+        previous = self._entries.get(elevator.pk)
+        if previous is not None:
+            self._counts[previous[0]] -= 1
+        self._sequence += 1
+        self._entries[elevator.pk] = (anchor, base, elevator, self._sequence)
+        self._counts[anchor] = self._counts.get(anchor, 0) + 1
+        if anchor >= self._size:
+            self._grow(anchor)
+        heapq.heappush(self._heaps.setdefault(anchor, []), (base, elevator.pk, self._sequence))
+        if previous is not None and previous[0] != anchor:
+            self._refresh(previous[0])
+        self._refresh(anchor)
+
+    def remove(self, pk):
+        previous = self._entries.pop(pk, None)
+        if previous is not None:
+            self._counts[previous[0]] -= 1
+            self._refresh(previous[0])
+
+    def best(self, requested_floor):
+        """
+        The car with the lowest ETA to `requested_floor`, or None if the index
+        is empty. Ties go to the lowest pk.
+        """
+        if not self._entries:
+            return None
+        floor = min(max(requested_floor, 0), self._size - 1)
+        below = self._query(self._low, 0, floor)
+        above = self._query(self._high, floor, self._size - 1)
+        candidates = [
+            self._entries[pk][2] for value, pk in (below, above) if value != math.inf
+        ]
+        return min(
+            candidates,
+            key=lambda elevator: (
+                self.strategy.score(elevator, requested_floor, None),
+                elevator.pk,
+            ),
+        )
+
+    def _live(self, item):
+        entry = self._entries.get(item[1])
+        return entry is not None and entry[3] == item[2]
+
+    def _top(self, floor):
+        # Stale heap entries (the car moved or changed since) are discarded
+        # lazily when they reach the top, and compacted away if they pile up.
+        heap = self._heaps.get(floor)
+        if heap and len(heap) > 2 * self._counts[floor] + 16:
+            heap[:] = [item for item in heap if self._live(item)]
+            heapq.heapify(heap)
+        while heap and not self._live(heap[0]):
+            heapq.heappop(heap)
+        if not heap:
+            self._heaps.pop(floor, None)
+            self._counts.pop(floor, None)
+            return None
+        return heap[0]
+
+    def _refresh(self, floor):
+        top = self._top(floor)
+        if top is None:
+            low = high = _EMPTY
+        else:
+            base, pk, _ = top
+            low = (base - self.k * floor, pk)
+            high = (base + self.k * floor, pk)
+        position = floor + self._size
+        self._low[position] = low
+        self._high[position] = high
+        position //= 2
+        while position:
+            self._low[position] = min(self._low[2 * position], self._low[2 * position + 1])
+            self._high[position] = min(self._high[2 * position], self._high[2 * position + 1])
+            position //= 2
+
+    def _grow(self, floor):
+        size = self._size
+        while size <= floor:
+            size *= 2
+        self._size = size
+        self._low = [_EMPTY] * (2 * size)
+        self._high = [_EMPTY] * (2 * size)
+        for indexed_floor in list(self._heaps):
+            self._refresh(indexed_floor)
+
+    def _query(self, tree, left, right):
+        best = _EMPTY
+        left += self._size
+        right += self._size + 1
+        while left < right:
+            if left & 1:
+                best = min(best, tree[left])
+                left += 1
+            if right & 1:
+                right -= 1
+                best = min(best, tree[right])
+            left //= 2
+            right //= 2
+        return best
+
+
+def best_of(indexes, requested_floor):
+    """
+    The car with the lowest ETA to `requested_floor` across `indexes` (one
+    per bank, say), or None if they are all empty.
+    """
+    candidates = [
+        (index.strategy.score(elevator, requested_floor, None), elevator.pk, elevator)
+        for index in indexes
+        for elevator in (index.best(requested_floor),)
+        if elevator is not None
+    ]
+    return min(candidates, key=lambda candidate: candidate[:2], default=(None,) * 3)[2]
@@ -0,0 +1,521 @@
+"""
+Append-only event log of elevator state transitions.
+
+When ELEVATOR_EVENT_LOG["ENABLED"] is set, every change to a car is appended
+to a JSONL file as it is made: cars being created, changed or removed
+("car", "removed"), hails together with the car they were assigned to
+("hail"), moves with the requests they completed ("move"), and door and
+maintenance toggles ("door", "maintenance"). Each line is a compact JSON
+array, `[milliseconds since the epoch, type, *fields]`, with the fields of
+its type listed in EVENT_FIELDS.
+
+Events are appended once the transaction that makes the change commits
+(straight away outside a transaction, as with the state store), so a change
+that is rolled back is never logged. The commit hooks of transactions
+committing at about the same time run in no set order, so two writes to one
+car that race can be logged in the opposite order to their commits; only
+with the state store, whose writes are serialized by its lock, do the
+events of a car always follow commit order. A line is written with a single
+`write` to a file opened for appending, so several processes can share one
+log.
+
+`replay` rebuilds the in-memory state of every car (`ElevatorState`s with
+their pending requests) from the latest snapshot and the events after it.
+Every SNAPSHOT_EVERY events a process writes a new snapshot in the
+background; `write_snapshot` can also be called directly (see the
+replay_events command). `read_events` and `follow` let analytics consume the
+log without touching the database.
+"""
+import datetime
+import gc
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+
+from Elevator_app.models import Elevator, UserRequest
+from Elevator_app.state import STATE_FIELDS, ElevatorState, PendingRequest
+
+logger = logging.getLogger(__name__)
+
+EVENT_FIELDS = {
+    "car": (
+        "elevator_id",
+        "building_id",
+        "bank_id",
+        "lowest_floor",
+        "highest_floor",
+        "current_floor",
+        "direction",
+        "is_door_open",
+        "in_maintenance",
+        "capacity",
+    ),
+    "removed": ("elevator_id",),
+    "hail": ("elevator_id", "request_id", "requested_floor", "destination_floor", "queue_position"),
+    "move": ("elevator_id", "current_floor", "direction", "completed"),
+    "door": ("elevator_id", "is_door_open"),
+    "maintenance": ("elevator_id", "in_maintenance"),
+}
+
+
+def event_log_setting(name, default):
+    return getattr(settings, "ELEVATOR_EVENT_LOG", {}).get(name, default)
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def timestamp_ms(moment):
+    return int(moment.timestamp() * 1000)
+
+
+def from_ms(milliseconds):
+    return datetime.datetime.fromtimestamp(milliseconds / 1000, tz=datetime.timezone.utc)
+
+
+def car_event(elevator):
+    """
+    `elevator` is an `ElevatorState`, or an `Elevator` with its bank loaded.
+    """
+    if isinstance(elevator, ElevatorState):
+        lowest, highest = elevator.lowest_floor, elevator.highest_floor
+    else:
+        bank = elevator.bank
+        lowest, highest = (bank.lowest_floor, bank.highest_floor) if bank else (None, None)
+    return [
+        now_ms(),
+        "car",
+        elevator.pk,
+        elevator.building_id,
+        elevator.bank_id,
+        lowest,
+        highest,
+        elevator.current_floor,
+        elevator.direction,
+        elevator.is_door_open,
+        elevator.in_maintenance,
+        elevator.capacity,
+    ]
+
+
+def removed_event(pk):
+    return [now_ms(), "removed", pk]
+
+
+def hail_event(user_request):
+    return [
+        timestamp_ms(user_request.created_at),
+        "hail",
+        user_request.elevator_id,
+        user_request.pk,
+        user_request.requested_floor,
+        user_request.destination_floor,
+        user_request.queue_position,
+    ]
+
+
+def move_event(elevator, completed=()):
+    return [
+        now_ms(),
+        "move",
+        elevator.pk,
+        elevator.current_floor,
+        elevator.direction,
+        [user_request.pk for user_request in completed],
+    ]
+
+
+def door_event(elevator, completed=()):
+    return [now_ms(), "door", elevator.pk, elevator.is_door_open]
+
+
+def maintenance_event(elevator, completed=()):
+    return [now_ms(), "maintenance", elevator.pk, elevator.in_maintenance]
+
+
+_encoder = json.JSONEncoder(separators=(",", ":"))
+
+
+def encode(events):
+    line = _encoder.encode
+    return "".join(line(event) + "\n" for event in events).encode()
+
+
+class EventLog:
+    def __init__(self, path, snapshot_every=100000, fsync=False):
+        self.path = str(path)
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self._fd = None
+        self._lock = threading.Lock()
+        self._since_snapshot = 0
+        self._snapshotting = False
+
+    def append(self, events):
+        data = encode(events)
+        if not data:
+            return
+        with self._lock:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            view = memoryview(data)
+            while view:
+                view = view[os.write(self._fd, view):]
+            if self.fsync:
+                os.fsync(self._fd)
+            self._since_snapshot += data.count(b"\n")
+            if (
+                self.snapshot_every
+                and self._since_snapshot >= self.snapshot_every
+                and not self._snapshotting
+            ):
+                self._since_snapshot = 0
+                self._snapshotting = True
+                threading.Thread(
+                    target=self._snapshot, name="elevator-event-snapshot", daemon=True
+                ).start()
+
+    def _snapshot(self):
+        try:
+            write_snapshot(self.path)
+        except Exception:
+            logger.exception("Elevator event snapshot failed.")
+        finally:
+            self._snapshotting = False
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_event_log():
+    """
+    Returns the process-wide event log, or None when it is disabled.
+    """
+    global _log
+    if not event_log_setting("ENABLED", False):
+        return None
+    path = str(event_log_setting("PATH", "elevator_events.jsonl"))
+    if _log is None or _log.path != path:
+        with _log_lock:
+            if _log is None or _log.path != path:
+                _log = EventLog(
+                    path,
+                    snapshot_every=event_log_setting("SNAPSHOT_EVERY", 100000),
+                    fsync=event_log_setting("FSYNC", False),
+                )
+    return _log
+
+
+def record(events):
+    """
+    Appends `events` (any iterable, only consumed when the log is enabled)
+    when the current transaction commits.
+    """
+    log = get_event_log()
+    if log is not None:
+        events = list(events)
+        transaction.on_commit(lambda: log.append(events))
+
+
+def record_cars(pks):
+    """
+    Records the current row of every car in `pks`, or its removal if it no
+    longer exists, after a change made outside the endpoints, once it is
+    committed.
+    """
+    log = get_event_log()
+    if log is None or not pks:
+        return
+
+    def append():
+        elevators = {
+            elevator.pk: elevator
+            for elevator in Elevator.objects.select_related("bank").filter(pk__in=pks)
+        }
+        log.append(
+            car_event(elevators[pk]) if pk in elevators else removed_event(pk) for pk in pks
+        )
+
+    transaction.on_commit(append)
+
+
+def _decode(lines):
+    try:
+        return json.loads(b"[" + b",".join(lines) + b"]")
+    except ValueError:
+        # A crash mid-write can leave a torn line in the middle of the log.
+        events = []
+        for line in lines:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                logger.warning("Skipping unreadable event log line.")
+                events.append(None)
+        return events
+
+
+def _batches(path, offset, size=1 << 22):
+    """
+    Yields (offset after the batch, lines, events) for batches of complete
+    lines from byte `offset`, decoding each batch with one `json.loads`. An
+    unreadable line's event is None. A torn last line (a write still in
+    progress) is left for the next read.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as log:
+        log.seek(offset)
+        rest = b""
+        while True:
+            chunk = log.read(size)
+            if not chunk:
+                return
+            chunk = rest + chunk
+            end = chunk.rfind(b"\n") + 1
+            rest = chunk[end:]
+            if not end:
+                continue
+            offset += end
+            lines = chunk[: end - 1].split(b"\n")
+            yield offset, lines, _decode(lines)
+
+
+def read_events(path, offset=0):
+    """
+    Yields (offset after the event, event) for every event in the log from
+    byte `offset`, each event a dict of "time" (milliseconds since the
+    epoch), "type" and the fields of its type. Pass the last offset back in
+    to resume.
+    """
+    for end, lines, events in _batches(path, offset):
+        offset = end - sum(len(line) + 1 for line in lines)
+        for line, event in zip(lines, events):
+            offset += len(line) + 1
+            if event is not None:
+                yield offset, {
+                    "time": event[0],
+                    "type": event[1],
+                    **dict(zip(EVENT_FIELDS[event[1]], event[2:])),
+                }
+
+
+def follow(path, offset=0, poll_interval=1.0):
+    """
+    Like `read_events`, but keeps waiting for new events at the end of the log.
+    """
+    while True:
+        for offset, event in read_events(path, offset):
+            yield offset, event
+        time.sleep(poll_interval)
+
+
+def snapshot_path(path):
+    return f"{path}.snapshot"
+
+
+def _car_state(car):
+    (pk, building, bank, lowest, highest, floor, direction, door, maintenance, capacity, pending) = car
+    state = ElevatorState(
+        pk, floor, direction, door, maintenance, building, bank, lowest, highest, capacity
+    )
+    state.pending.extend(
+        PendingRequest(request_id, requested, destination, created, position)
+        for request_id, requested, destination, created, position in pending
+    )
+    return state
+
+
+def _car_row(state):
+    return [
+        state.pk,
+        state.building_id,
+        state.bank_id,
+        state.lowest_floor,
+        state.highest_floor,
+        state.current_floor,
+        state.direction,
+        state.is_door_open,
+        state.in_maintenance,
+        state.capacity,
+        [
+            [
+                request.pk,
+                request.requested_floor,
+                request.destination_floor,
+                timestamp_ms(request.created_at),
+                request.queue_position,
+            ]
+            for request in state.pending
+        ],
+    ]
+
+
+def load_snapshot(path):
+    """
+    Returns (states by car, log offset they cover) from the latest snapshot
+    of the log at `path`, or ({}, 0) if there is none. Pending requests'
+    `created_at` are left in milliseconds.
+    """
+    try:
+        with open(snapshot_path(path), encoding="utf-8") as snapshot:
+            data = json.load(snapshot)
+    except FileNotFoundError:
+        return {}, 0
+    return {car[0]: _car_state(car) for car in data["cars"]}, data["offset"]
+
+
+def write_snapshot(path):
+    """
+    Replays the log at `path` and writes its state as the new snapshot.
+    Returns the replay.
+    """
+    result = replay(path)
+    temporary = f"{snapshot_path(path)}.{os.getpid()}.{threading.get_ident()}"
+    with open(temporary, "w", encoding="utf-8") as snapshot:
+        json.dump(
+            {
+                "offset": result.offset,
+                "cars": [_car_row(state) for state in result.states.values()],
+            },
+            snapshot,
+            separators=(",", ":"),
+        )
+    # Readers only ever see a complete snapshot.
+    os.replace(temporary, snapshot_path(path))
+    return result
+
+
+@contextmanager
+def paused_gc():
+    """
+    Disables the cyclic garbage collector for the block. For offline
+    replays only: the decoded events are millions of small lists that are
+    never cyclic, so collecting while they are allocated only costs time,
+    but pausing it in a serving process pauses it for every thread.
+    """
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if collecting:
+            gc.enable()
+
+
+class Replay:
+    __slots__ = ("states", "offset", "events")
+
+    def __init__(self, states, offset, events):
+        self.states = states
+        self.offset = offset
+        self.events = events
+
+    @property
+    def pending_count(self):
+        return sum(len(state.pending) for state in self.states.values())
+
+
+def replay(path, use_snapshot=True):
+    """
+    Rebuilds the state of every car from the latest snapshot (unless
+    `use_snapshot` is False) and the events after it. Returns a Replay.
+    """
+    states, offset = load_snapshot(path) if use_snapshot else ({}, 0)
+    offset, count = _apply(states, path, offset)
+    for state in states.values():
+        for request in state.pending:
+            request.created_at = from_ms(request.created_at)
+    return Replay(states, offset, count)
+
+
+def _apply(states, path, offset):
+    """
+    Applies the events after `offset` to `states`, in which pending requests
+    are created with `created_at` in milliseconds, as most are completed
+    before replay ends. Returns (offset replayed to, events applied).
+    """
+    count = 0
+    get = states.get
+    for offset, _, events in _batches(path, offset):
+        count += len(events)
+        for event in events:
+            if event is None:
+                continue
+            kind = event[1]
+            if kind == "move":
+                state = get(event[2])
+                if state is None:
+                    continue
+                state.current_floor = event[3]
+                state.direction = event[4]
+                done = event[5]
+                if done:
+                    pending = state.pending
+                    # Moves almost always complete the request at the head.
+                    if len(done) == 1 and pending and pending[0].pk == done[0]:
+                        pending.popleft()
+                    else:
+                        kept = [request for request in pending if request.pk not in done]
+                        pending.clear()
+                        pending.extend(kept)
+            elif kind == "hail":
+                state = get(event[2])
+                if state is not None:
+                    state.pending.append(
+                        PendingRequest(event[3], event[4], event[5], event[0], event[6])
+                    )
+            elif kind == "door":
+                state = get(event[2])
+                if state is not None:
+                    state.is_door_open = event[3]
+            elif kind == "maintenance":
+                state = get(event[2])
+                if state is not None:
+                    state.in_maintenance = event[3]
+            elif kind == "car":
+                previous = get(event[2])
+                state = ElevatorState(event[2], *event[7:11], *event[3:7], event[11])
+                if previous is not None:
+                    state.pending = previous.pending
+                states[event[2]] = state
+            elif kind == "removed":
+                states.pop(event[2], None)
+    return offset, count
+
+
+def mismatched_cars(states):
+    """
+    Returns the ids of cars whose replayed state or pending requests differ
+    from the database, including cars missing on either side.
+    """
+    pending = {}
+    for elevator_id, pk in UserRequest.objects.filter(is_complete=False).values_list(
+        "elevator_id", "pk"
+    ):
+        pending.setdefault(elevator_id, set()).add(pk)
+    mismatched = set(states)
+    for elevator in Elevator.objects.all():
+        state = states.get(elevator.pk)
+        if (
+            state is not None
+            and all(getattr(state, field) == getattr(elevator, field) for field in STATE_FIELDS)
+            and {request.pk for request in state.pending} == pending.get(elevator.pk, set())
+        ):
+            mismatched.discard(elevator.pk)
+        else:
+            mismatched.add(elevator.pk)
+    return sorted(mismatched)
@@ -0,0 +1,206 @@
+"""
+Demand forecasting and predictive parking of idle cars.
+
+`DemandForecaster` keeps, per building, a histogram of hails per pickup
+floor for every SLOT_MINUTES slot of the day (UTC). Each day's hails weigh
+DECAY times less than the next day's, so the histogram follows changing
+traffic without a window of raw hails to maintain. Adding a hail is O(1):
+every cell stores its weight as of the day it was last written and is aged
+when it is next read or written.
+
+`ParkingPolicy` sends idle cars (door closed, not in maintenance, nothing
+pending) to the floors where the forecast expects hails in the current slot,
+so that in the morning they wait at the lobby instead of wherever their last
+passenger got out.
+
+With ELEVATOR_PARKING["ENABLED"], the ticker (`run_elevators`) parks the
+idle cars of every bank after each tick. Its forecaster starts from the last
+HISTORY_DAYS of requests and archived requests, then catches up with one
+query per tick for the hails saved since (by id).
+"""
+import heapq
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from Elevator_app.dispatch import direction_to
+from Elevator_app.models import ArchivedUserRequest, UserRequest
+
+DAY_SECONDS = 86400
+
+
+def parking_setting(name, default):
+    return getattr(settings, "ELEVATOR_PARKING", {}).get(name, default)
+
+
+class DemandForecaster:
+    """
+    Hails per (building, time-of-day slot, pickup floor), each weighing
+    `decay` times less per day of age. Times are seconds since the epoch, so
+    the simulator's clock works as well as the database's.
+    """
+
+    def __init__(self, slot_seconds=900, decay=0.9):
+        self.slot_seconds = slot_seconds
+        self.decay = decay
+        # (building, slot) -> {floor: [weight, day of the weight]}
+        self._slots = defaultdict(dict)
+        # Id of the last request read by `catch_up`.
+        self.last_pk = None
+
+    def _position(self, at):
+        day, second = divmod(at, DAY_SECONDS)
+        return int(day), int(second // self.slot_seconds)
+
+    def observe(self, building, floor, at):
+        day, slot = self._position(at)
+        cells = self._slots[building, slot]
+        cell = cells.get(floor)
+        if cell is None:
+            cells[floor] = [1.0, day]
+        elif day >= cell[1]:
+            cell[0] = cell[0] * self.decay ** (day - cell[1]) + 1.0
+            cell[1] = day
+        else:
+            # A hail older than the cell counts for less.
+            cell[0] += self.decay ** (cell[1] - day)
+
+    def demand(self, building, at):
+        """
+        {floor: weight} of the hails expected in the slot of `at`.
+        """
+        day, slot = self._position(at)
+        return {
+            floor: weight * self.decay ** max(day - cell_day, 0)
+            for floor, (weight, cell_day) in self._slots.get((building, slot), {}).items()
+        }
+
+    def catch_up(self, history_days=28, chunk_size=2000):
+        """
+        Observes the hails saved since the last call. The first call reads
+        the requests and archived requests of the last `history_days` days.
+        Returns the number of hails observed.
+        """
+        observed = 0
+        if self.last_pk is None:
+            since = timezone.now() - timedelta(days=history_days)
+            archived = ArchivedUserRequest.objects.filter(
+                created_at__gte=since, requested_floor__isnull=False
+            ).values_list("building_id", "requested_floor", "created_at")
+            for building, floor, created_at in archived.iterator(chunk_size=chunk_size):
+                self.observe(building, floor, created_at.timestamp())
+                observed += 1
+            # Later calls read on from here even if the window has no hails.
+            self.last_pk = UserRequest.objects.aggregate(last=Max("pk"))["last"] or 0
+            requests = UserRequest.objects.filter(created_at__gte=since)
+        else:
+            requests = UserRequest.objects.filter(pk__gt=self.last_pk)
+        rows = requests.order_by("pk").values_list(
+            "pk", "elevator__building_id", "requested_floor", "created_at"
+        )
+        for pk, building, floor, created_at in rows.iterator(chunk_size=chunk_size):
+            self.last_pk = pk
+            if floor is not None:
+                self.observe(building, floor, created_at.timestamp())
+                observed += 1
+        return observed
+
+
+def parking_floors(demand, count):
+    """
+    `count` floors to park cars at for `demand` ({floor: weight}). Each car
+    in turn goes to the floor with the most demand per car already sent
+    there, so floors get cars in proportion to their demand.
+    """
+    heap = [(-weight, floor, 1) for floor, weight in demand.items() if weight > 0]
+    heapq.heapify(heap)
+    floors = []
+    while heap and len(floors) < count:
+        score, floor, cars = heapq.heappop(heap)
+        floors.append(floor)
+        heapq.heappush(heap, (score * cars / (cars + 1), floor, cars + 1))
+    return floors
+
+
+class ParkingPolicy:
+    """
+    Where idle cars wait, from `forecaster`'s demand. Nothing is moved while
+    the forecast for the slot adds up to less than `min_demand` hails.
+    """
+
+    def __init__(self, forecaster, min_demand=1.0):
+        self.forecaster = forecaster
+        self.min_demand = min_demand
+
+    def plan(self, idle, building, at, lowest_floor=None, highest_floor=None):
+        """
+        `(car, floor)` for every car in `idle`, all of one bank, that should
+        move to wait for the demand expected at `at`. Cars and floors are
+        paired in floor order, which is the least total travel on a line.
+        """
+        demand = {
+            floor: weight
+            for floor, weight in self.forecaster.demand(building, at).items()
+            if (lowest_floor is None or floor >= lowest_floor)
+            and (highest_floor is None or floor <= highest_floor)
+        }
+        if not idle or sum(demand.values()) < self.min_demand:
+            return []
+        floors = sorted(parking_floors(demand, len(idle)))
+        cars = sorted(idle, key=lambda car: car.current_floor)
+        return [(car, floor) for car, floor in zip(cars, floors) if car.current_floor != floor]
+
+
+def park(policy, idle, at, ranges=None):
+    """
+    Moves the cars in `idle` in memory to where `policy` parks them, bank by
+    bank. `ranges` maps bank ids to their (lowest, highest) floors. Returns
+    the moved cars; the caller persists them.
+    """
+    ranges = ranges or {}
+    banks = defaultdict(list)
+    for car in idle:
+        banks[car.building_id, car.bank_id].append(car)
+    moved = []
+    for (building, bank), cars in banks.items():
+        for car, floor in policy.plan(cars, building, at, *ranges.get(bank, (None, None))):
+            car.direction = direction_to(car.current_floor, floor)
+            car.current_floor = floor
+            moved.append(car)
+    return moved
+
+
+def parking_policy():
+    """
+    A new parking policy with the ELEVATOR_PARKING settings and a forecaster
+    that has seen no hails yet.
+    """
+    return ParkingPolicy(
+        DemandForecaster(
+            slot_seconds=parking_setting("SLOT_MINUTES", 15) * 60,
+            decay=parking_setting("DECAY", 0.9),
+        ),
+        min_demand=parking_setting("MIN_DEMAND", 1.0),
+    )
+
+
+_policy = None
+_policy_lock = threading.Lock()
+
+
+def get_parking_policy():
+    """
+    Returns the process-wide parking policy, or None when parking is disabled.
+    """
+    global _policy
+    if not parking_setting("ENABLED", False):
+        return None
+    if _policy is None:
+        with _policy_lock:
+            if _policy is None:
+                _policy = parking_policy()
+    return _policy
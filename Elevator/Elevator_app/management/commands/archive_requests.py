@@ -0,0 +1,49 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from Elevator_app.archive import archive_completed, archive_setting, prune_archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves completed requests older than ARCHIVE_AFTER_DAYS out of the request "
+        "table into the archive in bounded batches, adding them to the daily trip "
+        "aggregates, then deletes archived requests older than RETENTION_DAYS. "
+        "Safe to interrupt; run one at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--archive-after-days", type=int, default=archive_setting("ARCHIVE_AFTER_DAYS", 7)
+        )
+        parser.add_argument(
+            "--retention-days", type=int, default=archive_setting("RETENTION_DAYS", 90)
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=archive_setting("BATCH_SIZE", 1000)
+        )
+        parser.add_argument(
+            "--max-batches", type=int, default=None, help="Stop archiving after this many batches."
+        )
+        parser.add_argument(
+            "--pause", type=float, default=0.0, help="Seconds to sleep between batches."
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        archived, batches = archive_completed(
+            now - datetime.timedelta(days=options["archive_after_days"]),
+            batch_size=options["batch_size"],
+            max_batches=options["max_batches"],
+            pause=options["pause"],
+        )
+        pruned = prune_archive(
+            now - datetime.timedelta(days=options["retention_days"]),
+            batch_size=options["batch_size"],
+        )
+        self.stdout.write(
+            f"archived {archived} completed requests in {batches} batches; "
+            f"pruned {pruned} archived requests"
+        )
@@ -0,0 +1,79 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from Elevator_app.dispatch import STRATEGIES, get_strategy
+from Elevator_app.simulation import TRAFFIC_PATTERNS, ApiSimulator, traffic
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays simulated building traffic through the elevator endpoints with the "
+        "test client and reports endpoint latency percentiles, queries per call, "
+        "passenger wait and journey times and hails/sec. Each run happens in a "
+        "transaction that is rolled back, so the database is left unchanged."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--elevators", type=int, default=8)
+        parser.add_argument("--floors", type=int, default=20)
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--rate", type=float, default=0.15, help="Hails per simulated second.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--strategy", action="append", choices=sorted(STRATEGIES), dest="strategies"
+        )
+        parser.add_argument(
+            "--pattern", action="append", choices=sorted(TRAFFIC_PATTERNS), dest="patterns"
+        )
+        parser.add_argument(
+            "--json", action="store_true", help="Print one JSON object per run instead of a table."
+        )
+
+    def handle(self, *args, **options):
+        for pattern in options["patterns"] or TRAFFIC_PATTERNS:
+            hails = traffic(
+                pattern,
+                options["requests"],
+                options["floors"],
+                rate=options["rate"],
+                seed=options["seed"],
+            )
+            for name in options["strategies"] or [get_strategy().name]:
+                result = self.run(get_strategy(name), options["elevators"], hails)
+                if options["json"]:
+                    self.stdout.write(json.dumps({"pattern": pattern, **result.as_dict()}))
+                else:
+                    self.report(pattern, result)
+
+    def run(self, strategy, elevators, hails):
+        try:
+            with transaction.atomic():
+                result = ApiSimulator(strategy, elevators=elevators).run(hails)
+                raise Rollback
+        except Rollback:
+            return result
+
+    def report(self, pattern, result):
+        self.stdout.write(
+            f"{pattern} / {result.strategy}: {result.completed}/{result.requests} completed, "
+            f"wait p50/p95/p99 {result.wait_percentiles[50]:.1f}/"
+            f"{result.wait_percentiles[95]:.1f}/{result.wait_percentiles[99]:.1f}s, "
+            f"journey p95 {result.journey_percentiles[95]:.1f}s, "
+            f"{result.requests_per_second:.0f} hails/sec"
+        )
+        self.stdout.write(
+            f"  {'endpoint':<22}{'calls':>8}{'p50 (ms)':>10}{'p95 (ms)':>10}"
+            f"{'p99 (ms)':>10}{'queries':>9}"
+        )
+        for endpoint, stats in result.endpoints.items():
+            row = stats.as_dict()
+            self.stdout.write(
+                f"  {endpoint:<22}{row['calls']:>8}{row['p50_ms']:>10.2f}"
+                f"{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}{row['queries_per_call']:>9.1f}"
+            )
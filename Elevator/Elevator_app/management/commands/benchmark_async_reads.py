@@ -0,0 +1,185 @@
+import asyncio
+import io
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db.backends.signals import connection_created
+
+from Elevator.asgi import application as asgi_application
+from Elevator_app.models import Bank, Building, Elevator, UserRequest
+from Elevator_app.simulation import nearest_rank
+
+READS = ("get_next_floor", "check_direction", "get_user_requests")
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-tests the read endpoints: the synchronous DRF actions through the "
+        "WSGI handler on a fixed pool of worker threads, against the async views "
+        "through the ASGI application on one event loop. Closed-loop clients poll "
+        "as fast as they are answered. --db-latency-ms adds a round trip to every "
+        "query, as a database server over the network would; without it a local "
+        "SQLite file never makes a request wait. The cars are created in a "
+        "throwaway building that is deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", default="8,32,128,256", help="Comma-separated client counts.")
+        parser.add_argument("--calls", type=int, default=20, help="Requests per client per level.")
+        parser.add_argument("--threads", type=int, default=8, help="WSGI worker threads.")
+        parser.add_argument("--elevators", type=int, default=16)
+        parser.add_argument("--p99-ms", type=float, default=250.0, help="Latency target for capacity.")
+        parser.add_argument("--db-latency-ms", type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        latency = options["db_latency_ms"] / 1000
+
+        def round_trip(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def add_round_trip(sender, connection, **kwargs):
+            connection.execute_wrappers.append(round_trip)
+
+        if latency:
+            # Requests query through connections their threads open later.
+            connection_created.connect(add_round_trip, weak=False)
+        try:
+            self.run(options)
+        finally:
+            connection_created.disconnect(add_round_trip)
+
+    def run(self, options):
+        building = Building.objects.create(name=f"benchmark_async_reads-{uuid.uuid4().hex}")
+        try:
+            bank = Bank.objects.create(building=building, name="all", highest_floor=50)
+            elevators = Elevator.objects.bulk_create(
+                Elevator(bank=bank, building=building) for _ in range(options["elevators"])
+            )
+            UserRequest.objects.bulk_create(
+                UserRequest(elevator=elevator, requested_floor=floor, destination_floor=floor + 10)
+                for elevator in elevators
+                for floor in range(1, 6)
+            )
+            paths = [
+                f"/elevators/{elevator.pk}/{read}/" for elevator in elevators for read in READS
+            ]
+            self.report(paths, options)
+        finally:
+            building.delete()
+
+    def report(self, paths, options):
+        self.stdout.write(
+            f"{'clients':>8}{'wsgi req/s':>12}{'wsgi p99 (ms)':>15}"
+            f"{'asgi req/s':>12}{'asgi p99 (ms)':>15}"
+        )
+        target = options["p99_ms"]
+        capacity = {"wsgi": 0, "asgi": 0}
+        wsgi = WSGIHandler()
+        with ThreadPoolExecutor(max_workers=options["threads"]) as pool:
+            for clients in (int(level) for level in options["concurrency"].split(",")):
+                results = {
+                    "wsgi": asyncio.run(
+                        self.load(self.wsgi_call(wsgi, pool), paths, clients, options["calls"])
+                    ),
+                    "asgi": asyncio.run(
+                        self.load(self.asgi_call, [f"/async{path}" for path in paths], clients, options["calls"])
+                    ),
+                }
+                for name, (_, p99, errors) in results.items():
+                    if p99 <= target and not errors:
+                        capacity[name] = max(capacity[name], clients)
+                (wsgi_rate, wsgi_p99, wsgi_errors), (asgi_rate, asgi_p99, asgi_errors) = results.values()
+                self.stdout.write(
+                    f"{clients:>8}{wsgi_rate:>12.0f}{wsgi_p99:>15.1f}"
+                    f"{asgi_rate:>12.0f}{asgi_p99:>15.1f}"
+                )
+                if wsgi_errors or asgi_errors:
+                    self.stdout.write(f"  errors: wsgi {wsgi_errors}, asgi {asgi_errors}")
+        self.stdout.write(
+            f"clients within p99 {target:.0f} ms: wsgi {capacity['wsgi']}, asgi {capacity['asgi']}"
+        )
+
+    async def load(self, call, paths, clients, calls):
+        """
+        Runs `clients` concurrent pollers making `calls` requests each.
+        Returns (requests/sec, p99 latency in ms, non-2xx/4xx responses).
+        """
+        latencies = []
+        errors = 0
+
+        async def client(offset):
+            nonlocal errors
+            for number in range(calls):
+                started = time.perf_counter()
+                status_code = await call(paths[(offset + number) % len(paths)])
+                latencies.append((time.perf_counter() - started) * 1000)
+                errors += status_code >= 500
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client(offset) for offset in range(clients)))
+        elapsed = time.perf_counter() - started
+        return len(latencies) / elapsed, nearest_rank(latencies, 99), errors
+
+    def wsgi_call(self, handler, pool):
+        def request(path):
+            environ = {
+                "REQUEST_METHOD": "GET",
+                "SCRIPT_NAME": "",
+                "PATH_INFO": path,
+                "QUERY_STRING": "",
+                "SERVER_NAME": "localhost",
+                "SERVER_PORT": "80",
+                "SERVER_PROTOCOL": "HTTP/1.1",
+                "HTTP_HOST": "localhost",
+                "wsgi.input": io.BytesIO(),
+                "wsgi.errors": sys.stderr,
+                "wsgi.url_scheme": "http",
+                "wsgi.multithread": True,
+                "wsgi.multiprocess": False,
+                "wsgi.run_once": False,
+                "wsgi.version": (1, 0),
+            }
+            statuses = []
+            body = handler(environ, lambda status, headers: statuses.append(status))
+            try:
+                b"".join(body)
+            finally:
+                # Closing the response fires request_finished, as a server would.
+                body.close()
+            return int(statuses[0].split()[0])
+
+        async def call(path):
+            return await asyncio.get_running_loop().run_in_executor(pool, request, path)
+
+        return call
+
+    async def asgi_call(self, path):
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"host", b"localhost")],
+            "client": ("127.0.0.1", 0),
+            "server": ("localhost", 80),
+        }
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        await asgi_application(scope, receive, send)
+        return messages[0]["status"]
@@ -0,0 +1,96 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from Elevator_app.models import Bank, Building, Elevator, UserRequest
+
+POLLED_READS = ("", "get_user_requests/", "get_next_floor/", "check_direction/")
+
+
+class Command(BaseCommand):
+    help = (
+        "Polls the elevator read endpoints the way a dashboard does, once "
+        "without and once with If-None-Match, and reports the bytes sent and "
+        "the CPU time spent per poll. Every few polls one car's door opens and "
+        "closes, so some ETags change. The cars are created in a throwaway "
+        "building that is deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--elevators", type=int, default=10)
+        parser.add_argument("--requests", type=int, default=50, help="Pending requests per car.")
+        parser.add_argument("--polls", type=int, default=50, help="Polls of every read of every car.")
+        parser.add_argument(
+            "--change-every", type=int, default=10, help="Cycle one car's door every N polls."
+        )
+
+    def handle(self, *args, **options):
+        client = Client(HTTP_HOST="localhost")
+        building = Building.objects.create(name=f"benchmark_conditional_get-{uuid.uuid4().hex}")
+        try:
+            pks = self.create_fleet(building, options["elevators"], options["requests"])
+            self.stdout.write(f"{'polling':<14}{'bytes/poll':>12}{'CPU ms/poll':>13}{'304s':>8}")
+            results = {}
+            for name, conditional in (("plain", False), ("If-None-Match", True)):
+                results[name] = self.poll(client, pks, conditional, options)
+                polled, sent, cpu, unchanged = results[name]
+                self.stdout.write(
+                    f"{name:<14}{sent / polled:>12.0f}{cpu * 1000 / polled:>13.2f}"
+                    f"{unchanged / polled:>8.0%}"
+                )
+        finally:
+            building.delete()
+        plain, conditional = results["plain"], results["If-None-Match"]
+        self.stdout.write(
+            f"saved: {1 - conditional[1] / plain[1]:.0%} of bytes, "
+            f"{1 - conditional[2] / plain[2]:.0%} of CPU time"
+        )
+
+    def create_fleet(self, building, count, requests):
+        bank = Bank.objects.create(building=building, name="all", highest_floor=50)
+        elevators = Elevator.objects.bulk_create(
+            Elevator(bank=bank, building=building, current_floor=number % 50 + 1)
+            for number in range(count)
+        )
+        UserRequest.objects.bulk_create(
+            UserRequest(
+                elevator=elevator,
+                requested_floor=(elevator.current_floor + floor) % 50 + 1,
+                destination_floor=(elevator.current_floor + floor * 7) % 50 + 1,
+                queue_position=floor + 1,
+            )
+            for elevator in elevators
+            for floor in range(requests)
+        )
+        return [elevator.pk for elevator in elevators]
+
+    def poll(self, client, pks, conditional, options):
+        """
+        Polls every read of every car `polls` times. Returns (polls, bytes
+        sent, CPU seconds, 304 answers).
+        """
+        etags = {}
+        polled = sent = unchanged = 0
+        cpu = 0.0
+        for number in range(options["polls"]):
+            if options["change_every"] and number % options["change_every"] == 0:
+                # Opening and closing the door changes the version, not the answers.
+                changed = pks[number % len(pks)]
+                client.post(f"/elevators/{changed}/door_status/")
+                client.post(f"/elevators/{changed}/door_status/")
+            for pk in pks:
+                for read in POLLED_READS:
+                    url = f"/elevators/{pk}/{read}"
+                    headers = {}
+                    if conditional and etags.get(url):
+                        headers["HTTP_IF_NONE_MATCH"] = etags[url]
+                    started = time.process_time()
+                    response = client.get(url, **headers)
+                    cpu += time.process_time() - started
+                    etags[url] = response.get("ETag")
+                    polled += 1
+                    sent += len(response.content)
+                    unchanged += response.status_code == 304
+        return polled, sent, cpu, unchanged
@@ -0,0 +1,62 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from Elevator_app.dispatch import STRATEGIES, get_strategy
+from Elevator_app.simulation import TRAFFIC_PATTERNS, Simulator, traffic
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulates each traffic pattern with passengers served one at a time and "
+        "with destination grouping, and reports stops per passenger, passengers "
+        "delivered per hour and wait and journey times."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--elevators", type=int, default=6)
+        parser.add_argument("--floors", type=int, default=12)
+        parser.add_argument("--requests", type=int, default=5000)
+        parser.add_argument("--rate", type=float, default=0.2, help="Hails per simulated second.")
+        parser.add_argument("--capacity", type=int, default=10)
+        parser.add_argument("--window", type=float, default=30.0, help="Grouping window in seconds.")
+        parser.add_argument("--strategy", choices=sorted(STRATEGIES), default="fifo")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--pattern", action="append", choices=sorted(TRAFFIC_PATTERNS), dest="patterns"
+        )
+        parser.add_argument(
+            "--json", action="store_true", help="Print one JSON object per run instead of a table."
+        )
+
+    def handle(self, *args, **options):
+        if not options["json"]:
+            self.stdout.write(
+                f"{'pattern':<11}{'mode':<10}{'stops/passenger':>17}{'passengers/h':>14}"
+                f"{'avg wait':>10}{'p95 journey':>13}"
+            )
+        for pattern in options["patterns"] or TRAFFIC_PATTERNS:
+            hails = traffic(
+                pattern,
+                options["requests"],
+                options["floors"],
+                rate=options["rate"],
+                seed=options["seed"],
+            )
+            for mode, window in (("single", None), ("grouped", options["window"])):
+                result = Simulator(
+                    get_strategy(options["strategy"]),
+                    elevators=options["elevators"],
+                    capacity=options["capacity"],
+                    group_window=window,
+                ).run(hails)
+                if options["json"]:
+                    self.stdout.write(
+                        json.dumps({"pattern": pattern, "mode": mode, **result.as_dict()})
+                    )
+                    continue
+                self.stdout.write(
+                    f"{pattern:<11}{mode:<10}{result.stops_per_passenger:>17.2f}"
+                    f"{result.passengers_per_hour:>14.0f}{result.avg_wait:>10.1f}"
+                    f"{result.journey_percentiles[95]:>13.1f}"
+                )
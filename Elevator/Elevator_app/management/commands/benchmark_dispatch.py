@@ -0,0 +1,55 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from Elevator_app.dispatch import STRATEGIES, get_strategy
+from Elevator_app.simulation import TRAFFIC_PATTERNS, Simulator, traffic
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulates each traffic pattern through each dispatch strategy and reports "
+        "passenger wait and journey times and requests/sec."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--elevators", type=int, default=8)
+        parser.add_argument("--floors", type=int, default=20)
+        parser.add_argument("--requests", type=int, default=5000)
+        parser.add_argument("--rate", type=float, default=0.15, help="Hails per simulated second.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--strategy", action="append", choices=sorted(STRATEGIES), dest="strategies"
+        )
+        parser.add_argument(
+            "--pattern", action="append", choices=sorted(TRAFFIC_PATTERNS), dest="patterns"
+        )
+        parser.add_argument(
+            "--json", action="store_true", help="Print one JSON object per run instead of a table."
+        )
+
+    def handle(self, *args, **options):
+        if not options["json"]:
+            self.stdout.write(
+                f"{'pattern':<11}{'strategy':<10}{'avg wait':>10}{'p95 wait':>10}"
+                f"{'p99 wait':>10}{'p95 journey':>13}{'stops':>8}{'requests/sec':>14}"
+            )
+        for pattern in options["patterns"] or TRAFFIC_PATTERNS:
+            hails = traffic(
+                pattern,
+                options["requests"],
+                options["floors"],
+                rate=options["rate"],
+                seed=options["seed"],
+            )
+            for name in options["strategies"] or STRATEGIES:
+                result = Simulator(get_strategy(name), elevators=options["elevators"]).run(hails)
+                if options["json"]:
+                    self.stdout.write(json.dumps({"pattern": pattern, **result.as_dict()}))
+                    continue
+                self.stdout.write(
+                    f"{pattern:<11}{result.strategy:<10}{result.avg_wait:>10.1f}"
+                    f"{result.wait_percentiles[95]:>10.1f}{result.wait_percentiles[99]:>10.1f}"
+                    f"{result.journey_percentiles[95]:>13.1f}{result.stops:>8}"
+                    f"{result.requests_per_second:>14.0f}"
+                )
@@ -0,0 +1,118 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from Elevator_app.dispatch import ETAStrategy
+from Elevator_app.models import Bank, Building, Elevator, UserRequest
+from Elevator_app.simulation import SimElevator, SimRequest
+from Elevator_app.views import ElevatorViewSet
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares lowest-ETA car selection by scanning every car with the ETA "
+        "index, for single hails and for batches, at several bank sizes. "
+        "Batches go through batch_hail's dispatch on a scratch building in "
+        "the database, which is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="10,100,1000", help="Comma-separated car counts.")
+        parser.add_argument("--floors", type=int, default=60)
+        parser.add_argument("--hails", type=int, default=2000)
+        parser.add_argument("--batch", type=int, default=500, help="Hails per batch.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'cars':>6}{'scan (us)':>12}{'index (us)':>12}{'update (us)':>13}"
+            f"{'batch scan (ms)':>17}{'batch index (ms)':>18}{'same picks':>12}"
+        )
+        for size in (int(size) for size in options["sizes"].split(",")):
+            self.measure(size, options)
+
+    def fleet(self, size, floors, rng):
+        cars = []
+        for pk in range(1, size + 1):
+            car = SimElevator(pk, current_floor=rng.randint(1, floors))
+            for _ in range(rng.choice((0, 0, 1, 2, 4))):
+                car.pending.append(SimRequest(*rng.sample(range(1, floors + 1), 2), created_at=0))
+            cars.append(car)
+        return cars
+
+    def measure(self, size, options):
+        rng = random.Random(options["seed"])
+        strategy = ETAStrategy()
+        cars = self.fleet(size, options["floors"], rng)
+        floors = [rng.randint(1, options["floors"]) for _ in range(options["hails"])]
+
+        started = time.perf_counter()
+        scanned = [strategy.select_elevator(cars, floor, None) for floor in floors]
+        scan = (time.perf_counter() - started) / len(floors) * 1e6
+
+        index = strategy.index(cars)
+        started = time.perf_counter()
+        indexed = [index.best(floor) for floor in floors]
+        lookup = (time.perf_counter() - started) / len(floors) * 1e6
+
+        started = time.perf_counter()
+        for car in cars:
+            index.update(car)
+        update = (time.perf_counter() - started) / len(cars) * 1e6
+
+        hails = [
+            (tuple(rng.sample(range(1, options["floors"] + 1), 2)), None)
+            for _ in range(options["batch"])
+        ]
+        scanning = ETAStrategy()
+        scanning.index = lambda elevators: None
+        batch_scan, batch_scanned = self.assign(cars, hails, scanning, options["floors"])
+        batch_index, batch_indexed = self.assign(cars, hails, strategy, options["floors"])
+
+        same = scanned == indexed and batch_scanned == batch_indexed
+        self.stdout.write(
+            f"{size:>6}{scan:>12.1f}{lookup:>12.1f}{update:>13.1f}"
+            f"{batch_scan:>17.1f}{batch_index:>18.1f}{str(same):>12}"
+        )
+
+    def assign(self, cars, hails, strategy, floors):
+        """
+        Times dispatching `hails` with `strategy` to a copy of `cars` in a
+        building of its own, and returns `(milliseconds, picks)`.
+        """
+        try:
+            with transaction.atomic():
+                building = Building.objects.create(name="benchmark_eta_index")
+                bank = Bank.objects.create(building=building, name="all", highest_floor=floors)
+                elevators = Elevator.objects.bulk_create(
+                    Elevator(bank=bank, building=building, current_floor=car.current_floor)
+                    for car in cars
+                )
+                UserRequest.objects.bulk_create(
+                    UserRequest(
+                        elevator=elevator,
+                        requested_floor=user_request.requested_floor,
+                        destination_floor=user_request.destination_floor,
+                        queue_position=position,
+                    )
+                    for car, elevator in zip(cars, elevators)
+                    for position, user_request in enumerate(car.pending, 1)
+                )
+                numbers = {elevator.pk: number for number, elevator in enumerate(elevators)}
+                started = time.perf_counter()
+                assigned = ElevatorViewSet().assign_hails(building.pk, hails, strategy=strategy)
+                elapsed = (time.perf_counter() - started) * 1000
+                picks = [
+                    (numbers[elevator.pk], user_request.queue_position)
+                    for elevator, user_request in assigned
+                ]
+                raise Rollback
+        except Rollback:
+            pass
+        return elapsed, picks
@@ -0,0 +1,105 @@
+import os
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from Elevator_app.events import EventLog, paused_gc, replay, write_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Writes a synthetic event log of hails, moves and door and maintenance "
+        "toggles to a temporary file and times replaying it: from the start, "
+        "and from a snapshot taken before its last --tail events."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=2000000)
+        parser.add_argument("--tail", type=int, default=100000, help="Events after the snapshot.")
+        parser.add_argument("--cars", type=int, default=100)
+        parser.add_argument("--floors", type=int, default=60)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "events.jsonl")
+            log = EventLog(path, snapshot_every=0)
+            events = self.generate(options)
+            before = options["events"] - options["tail"]
+            started = time.perf_counter()
+            self.write(log, events, before)
+            snapshot_started = time.perf_counter()
+            write_snapshot(path)
+            snapshot_time = time.perf_counter() - snapshot_started
+            self.write(log, events, options["tail"])
+            write_time = time.perf_counter() - started - snapshot_time
+            log.close()
+            size = os.path.getsize(path)
+
+            with paused_gc():
+                started = time.perf_counter()
+                full = replay(path, use_snapshot=False)
+                full_time = time.perf_counter() - started
+                started = time.perf_counter()
+                tail = replay(path)
+                tail_time = time.perf_counter() - started
+
+        self.stdout.write(
+            f"log: {full.events} events, {size / 1e6:.1f} MB ({size / full.events:.0f} bytes/event), "
+            f"generated and written in {write_time:.2f}s"
+        )
+        self.stdout.write(
+            f"full replay: {full_time:.2f}s ({full.events / full_time:,.0f} events/s), "
+            f"{len(full.states)} cars, {full.pending_count} pending requests"
+        )
+        self.stdout.write(
+            f"snapshot: written in {snapshot_time:.2f}s; replay from it "
+            f"({tail.events} events): {tail_time:.2f}s"
+        )
+        same = all(
+            [request.pk for request in state.pending]
+            == [request.pk for request in tail.states[pk].pending]
+            and state.current_floor == tail.states[pk].current_floor
+            for pk, state in full.states.items()
+        ) and full.states.keys() == tail.states.keys()
+        self.stdout.write(f"snapshot replay matches full replay: {same}")
+
+    def write(self, log, events, count, chunk=10000):
+        while count > 0:
+            size = min(chunk, count)
+            log.append(next(events) for _ in range(size))
+            count -= size
+
+    def generate(self, options):
+        """
+        Yields a plausible stream: every car is created, then hails, moves,
+        and now and then a door or maintenance toggle.
+        """
+        rng = random.Random(options["seed"])
+        floors = options["floors"]
+        now = int(time.time() * 1000) - options["events"]
+        queues = {pk: [] for pk in range(1, options["cars"] + 1)}
+        position = {pk: 1 for pk in queues}
+        request_id = 0
+        for pk in queues:
+            yield [now, "car", pk, None, None, None, None, 1, 0, False, False]
+        while True:
+            now += 1
+            pk = rng.randint(1, options["cars"])
+            roll = rng.random()
+            queue = queues[pk]
+            if roll < 0.4 or not queue:
+                request_id += 1
+                requested, destination = rng.sample(range(1, floors + 1), 2)
+                queue.append((request_id, requested, destination))
+                position[pk] += 1
+                yield [now, "hail", pk, request_id, requested, destination, position[pk]]
+            elif roll < 0.98:
+                done, requested, destination = queue.pop(0)
+                yield [now, "move", pk, destination, 1 if destination > requested else -1, [done]]
+            elif roll < 0.99:
+                yield [now, "door", pk, rng.random() < 0.5]
+            else:
+                yield [now, "maintenance", pk, False]
@@ -0,0 +1,90 @@
+import time
+import uuid
+from statistics import mean
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from Elevator_app.models import Bank, Building, Elevator, UserRequest
+from Elevator_app.simulation import nearest_rank
+
+PER_CAR_READS = ("", "get_next_floor/", "check_direction/")
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares a dashboard refresh done the per-car way (retrieve, "
+        "get_next_floor and check_direction for every car) with one fleet_status "
+        "call, reporting queries and latency per refresh. The cars are created in "
+        "a throwaway building that is deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--elevators", default="10,40,160", help="Comma-separated fleet sizes.")
+        parser.add_argument("--requests", type=int, default=5, help="Pending requests per car.")
+        parser.add_argument("--refreshes", type=int, default=20)
+
+    def handle(self, *args, **options):
+        client = Client(HTTP_HOST="localhost")
+        self.stdout.write(
+            f"{'cars':>6}{'per-car queries':>17}{'per-car p50 (ms)':>18}"
+            f"{'fleet queries':>15}{'fleet p50 (ms)':>16}"
+        )
+        for count in (int(size) for size in options["elevators"].split(",")):
+            building = Building.objects.create(name=f"benchmark_fleet_status-{uuid.uuid4().hex}")
+            try:
+                pks = self.create_fleet(building, count, options["requests"])
+                per_car = self.measure(
+                    options["refreshes"],
+                    lambda: [
+                        client.get(f"/elevators/{pk}/{read}")
+                        for pk in pks
+                        for read in PER_CAR_READS
+                    ],
+                )
+                fleet = self.measure(
+                    options["refreshes"],
+                    lambda: client.get("/elevators/fleet_status/", {"building": building.pk}),
+                )
+            finally:
+                building.delete()
+            self.stdout.write(
+                f"{count:>6}{per_car[0]:>17.0f}{per_car[1]:>18.1f}"
+                f"{fleet[0]:>15.0f}{fleet[1]:>16.1f}"
+            )
+
+    def create_fleet(self, building, count, requests):
+        bank = Bank.objects.create(building=building, name="all", highest_floor=50)
+        elevators = Elevator.objects.bulk_create(
+            Elevator(bank=bank, building=building, current_floor=number % 50 + 1)
+            for number in range(count)
+        )
+        UserRequest.objects.bulk_create(
+            UserRequest(
+                elevator=elevator,
+                requested_floor=(elevator.current_floor + floor) % 50 + 1,
+                destination_floor=(elevator.current_floor + floor * 7) % 50 + 1,
+                queue_position=floor + 1,
+            )
+            for elevator in elevators
+            for floor in range(requests)
+        )
+        return [elevator.pk for elevator in elevators]
+
+    def measure(self, refreshes, refresh):
+        """
+        Runs `refresh` `refreshes` times. Returns (mean queries, p50 latency in ms).
+        """
+        queries = []
+        latencies = []
+        for _ in range(refreshes):
+            # The debug query log is bounded; emptying it keeps every count exact.
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                refresh()
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured))
+        return mean(queries), nearest_rank(latencies, 50)
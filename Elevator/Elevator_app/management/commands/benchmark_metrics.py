@@ -0,0 +1,76 @@
+import time
+from statistics import median
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+
+from Elevator_app.metrics import registry
+from Elevator_app.models import Elevator
+
+MIDDLEWARE = "Elevator_app.metrics.MetricsMiddleware"
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares endpoint latency with metrics recording on and off. Rounds of "
+        "hails, moves and reads alternate between the two so drift affects both "
+        "equally. Runs inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rounds", type=int, default=10)
+        parser.add_argument("--calls", type=int, default=200, help="Hails per round.")
+        parser.add_argument("--elevators", type=int, default=8)
+
+    def handle(self, *args, **options):
+        timings = {True: [], False: []}
+        enabled = registry.enabled
+        try:
+            with transaction.atomic():
+                Elevator.objects.bulk_create(
+                    Elevator() for _ in range(options["elevators"])
+                )
+                for _ in range(options["rounds"]):
+                    for instrumented in (True, False):
+                        timings[instrumented].extend(
+                            self.run_round(instrumented, options["calls"])
+                        )
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            registry.enabled = enabled
+        on = median(timings[True])
+        off = median(timings[False])
+        self.stdout.write(f"{'':<16}{'p50 (ms)':>10}{'calls':>8}")
+        self.stdout.write(f"{'instrumented':<16}{on:>10.3f}{len(timings[True]):>8}")
+        self.stdout.write(f"{'uninstrumented':<16}{off:>10.3f}{len(timings[False]):>8}")
+        self.stdout.write(f"overhead: {on - off:.3f} ms per call ({(on / off - 1) * 100:+.1f}%)")
+
+    def run_round(self, instrumented, calls):
+        registry.enabled = instrumented
+        middleware = [name for name in settings.MIDDLEWARE if name != MIDDLEWARE]
+        if instrumented:
+            middleware.insert(0, MIDDLEWARE)
+        timings = []
+        with override_settings(MIDDLEWARE=middleware):
+            # The client builds its middleware chain on its first request.
+            client = Client(HTTP_HOST="localhost")
+            for call in range(calls):
+                started = time.perf_counter()
+                response = client.post(
+                    "/elevators/save_user_request/",
+                    {"requested_floor": call % 20 + 1, "destination_floor": (call + 7) % 20 + 1},
+                    content_type="application/json",
+                )
+                elevator_id = response.json()["elevator_id"]
+                client.post(f"/elevators/{elevator_id}/move_elevator/")
+                client.get(f"/elevators/{elevator_id}/get_user_requests/")
+                timings.append((time.perf_counter() - started) * 1000 / 3)
+        return timings
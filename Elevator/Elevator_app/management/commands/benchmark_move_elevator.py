@@ -0,0 +1,79 @@
+import time
+from statistics import median
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+
+from Elevator_app.models import Elevator, UserRequest
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Times move_elevator as completed-request history grows. Runs inside a "
+        "transaction that is rolled back, so the database is left unchanged."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--history",
+            default="0,10000,100000,1000000",
+            help="Comma-separated completed-request counts to measure at.",
+        )
+        parser.add_argument("--moves", type=int, default=200)
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options["history"].split(","))
+        client = Client(HTTP_HOST="localhost")
+        self.stdout.write(f"{'completed rows':>15}{'p50 (ms)':>12}{'max (ms)':>12}")
+        try:
+            with transaction.atomic():
+                elevator = Elevator.objects.create()
+                url = f"/elevators/{elevator.pk}/move_elevator/"
+                history = 0
+                for size in sizes:
+                    history = self.fill_history(elevator, history, size, options["batch_size"])
+                    timings = self.time_moves(client, elevator, url, options["moves"])
+                    self.stdout.write(
+                        f"{history:>15}{median(timings):>12.2f}{max(timings):>12.2f}"
+                    )
+                raise Rollback
+        except Rollback:
+            pass
+
+    def fill_history(self, elevator, history, size, batch_size):
+        while history < size:
+            count = min(batch_size, size - history)
+            UserRequest.objects.bulk_create(
+                UserRequest(
+                    elevator=elevator,
+                    requested_floor=1,
+                    destination_floor=2,
+                    is_complete=True,
+                )
+                for _ in range(count)
+            )
+            history += count
+        return history
+
+    def time_moves(self, client, elevator, url, moves):
+        timings = []
+        for position in range(1, moves + 1):
+            UserRequest.objects.create(
+                elevator=elevator,
+                requested_floor=3,
+                destination_floor=5,
+                queue_position=position,
+            )
+            # One move to the pickup floor, one to the destination.
+            for _ in range(2):
+                started = time.perf_counter()
+                response = client.post(url)
+                timings.append((time.perf_counter() - started) * 1000)
+                assert response.status_code == 200, response.content
+        return timings
@@ -0,0 +1,99 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from Elevator_app.dispatch import STRATEGIES, get_strategy
+from Elevator_app.forecast import DAY_SECONDS, DemandForecaster, ParkingPolicy
+from Elevator_app.simulation import TRAFFIC_PATTERNS, Simulator, traffic
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulates up-peak traffic (or each --pattern) through each dispatch "
+        "strategy with idle cars left where they stop and with predictive "
+        "parking, and reports the passenger wait times of both. The forecaster "
+        "learns from the previous day's traffic (another seed) and from every "
+        "hail as it arrives."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--elevators", type=int, default=8)
+        parser.add_argument("--floors", type=int, default=20)
+        parser.add_argument("--requests", type=int, default=5000)
+        parser.add_argument("--rate", type=float, default=0.15, help="Hails per simulated second.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--slot-minutes", type=int, default=15)
+        parser.add_argument("--decay", type=float, default=0.9)
+        parser.add_argument(
+            "--strategy", action="append", choices=sorted(STRATEGIES), dest="strategies"
+        )
+        parser.add_argument(
+            "--pattern", action="append", choices=sorted(TRAFFIC_PATTERNS), dest="patterns"
+        )
+        parser.add_argument(
+            "--json", action="store_true", help="Print one JSON object per run instead of a table."
+        )
+
+    def handle(self, *args, **options):
+        if not options["json"]:
+            self.stdout.write(
+                f"{'pattern':<11}{'strategy':<10}{'avg wait':>10}{'parked':>8}"
+                f"{'p95 wait':>10}{'parked':>8}{'p50 journey':>13}{'parked':>8}"
+                f"{'avg wait change':>17}"
+            )
+        for pattern in options["patterns"] or ["up_peak"]:
+            hails = traffic(
+                pattern,
+                options["requests"],
+                options["floors"],
+                rate=options["rate"],
+                seed=options["seed"],
+            )
+            history = traffic(
+                pattern,
+                options["requests"],
+                options["floors"],
+                rate=options["rate"],
+                seed=options["seed"] + 1,
+            )
+            if not options["json"]:
+                started = time.perf_counter()
+                self.forecaster(history, options)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{pattern}: the forecaster learns {len(history)} hails at "
+                    f"{elapsed / max(len(history), 1) * 1e9:.0f} ns each"
+                )
+            for name in options["strategies"] or STRATEGIES:
+                idle = Simulator(get_strategy(name), elevators=options["elevators"]).run(hails)
+                policy = ParkingPolicy(self.forecaster(history, options))
+                parked = Simulator(
+                    get_strategy(name), elevators=options["elevators"], parking=policy
+                ).run(hails)
+                change = parked.avg_wait / idle.avg_wait - 1 if idle.avg_wait else 0.0
+                if options["json"]:
+                    self.stdout.write(
+                        json.dumps(
+                            {
+                                "pattern": pattern,
+                                "strategy": name,
+                                "idle": idle.as_dict(),
+                                "parked": parked.as_dict(),
+                                "avg_wait_change": round(change, 3),
+                            }
+                        )
+                    )
+                    continue
+                self.stdout.write(
+                    f"{pattern:<11}{name:<10}{idle.avg_wait:>10.1f}{parked.avg_wait:>8.1f}"
+                    f"{idle.wait_percentiles[95]:>10.1f}{parked.wait_percentiles[95]:>8.1f}"
+                    f"{idle.journey_percentiles[50]:>13.1f}{parked.journey_percentiles[50]:>8.1f}"
+                    f"{change:>17.0%}"
+                )
+
+    def forecaster(self, history, options):
+        forecaster = DemandForecaster(options["slot_minutes"] * 60, options["decay"])
+        for at, requested_floor, _ in history:
+            forecaster.observe(None, requested_floor, at - DAY_SECONDS)
+        return forecaster
@@ -0,0 +1,140 @@
+import asyncio
+import time
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+
+from Elevator_app.models import Elevator, UserRequest
+from Elevator_app.streaming import broadcaster, publish_state, websocket_application
+
+
+class Rollback(Exception):
+    pass
+
+
+class Connection:
+    """
+    In-process WebSocket client: feeds ASGI messages in and counts frames out.
+    """
+
+    def __init__(self):
+        self.incoming = asyncio.Queue()
+        self.frames = 0
+        self.bytes = 0
+
+    async def receive(self):
+        return await self.incoming.get()
+
+    async def send(self, message):
+        if message["type"] == "websocket.send":
+            self.frames += 1
+            self.bytes += len(message["text"])
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares CPU time for pushing elevator changes to WebSocket subscribers "
+        "against the equivalent per-second polling of check_direction and "
+        "get_next_floor. Runs in a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--subscribers", type=int, default=5000)
+        parser.add_argument("--elevators", type=int, default=40)
+        parser.add_argument("--seconds", type=int, default=30, help="Simulated duration.")
+        parser.add_argument(
+            "--changes-per-second", type=int, default=20, help="State changes across the bank."
+        )
+        parser.add_argument(
+            "--poll-sample", type=int, default=500, help="Polls timed to extrapolate polling cost."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                elevators = Elevator.objects.bulk_create(
+                    Elevator() for _ in range(options["elevators"])
+                )
+                UserRequest.objects.bulk_create(
+                    UserRequest(elevator=elevator, requested_floor=3, destination_floor=9)
+                    for elevator in elevators
+                )
+                async_to_sync(self.stream)(elevators, options)
+                self.poll(elevators, options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    async def stream(self, elevators, options):
+        connections = [Connection() for _ in range(options["subscribers"])]
+        tasks = []
+        for connection in connections:
+            await connection.incoming.put({"type": "websocket.connect"})
+            tasks.append(
+                asyncio.ensure_future(
+                    websocket_application(
+                        {"type": "websocket", "path": "/ws/elevators/"},
+                        connection.receive,
+                        connection.send,
+                    )
+                )
+            )
+        while broadcaster.subscriber_count < len(connections):
+            await asyncio.sleep(0.01)
+        snapshot_bytes = sum(connection.bytes for connection in connections)
+
+        started = time.process_time()
+        wall_started = time.perf_counter()
+        changes = 0
+        for second in range(options["seconds"]):
+            for change in range(options["changes_per_second"]):
+                elevator = elevators[(second * options["changes_per_second"] + change) % len(elevators)]
+                elevator.current_floor = elevator.current_floor % 20 + 1
+                publish_state(elevator)
+                changes += 1
+            # Let every subscriber drain its frame for this second.
+            while any(
+                subscriber.pending
+                for group in broadcaster.groups.values()
+                for subscriber in group
+            ):
+                await asyncio.sleep(0)
+        cpu = time.process_time() - started
+        wall = time.perf_counter() - wall_started
+
+        for connection in connections:
+            await connection.incoming.put({"type": "websocket.disconnect", "code": 1000})
+        await asyncio.gather(*tasks)
+        frames = sum(connection.frames for connection in connections) - len(connections)
+        pushed_bytes = sum(connection.bytes for connection in connections) - snapshot_bytes
+        self.streaming_cpu = cpu
+        self.stdout.write(
+            f"streaming: {len(connections)} subscribers, {changes} changes, "
+            f"{frames} frames, {pushed_bytes / 1e6:.1f} MB, "
+            f"cpu {cpu:.2f}s, wall {wall:.2f}s"
+        )
+
+    def poll(self, elevators, options):
+        client = Client(HTTP_HOST="localhost")
+        urls = [
+            f"/elevators/{elevator.pk}/{endpoint}/"
+            for elevator in elevators
+            for endpoint in ("check_direction", "get_next_floor")
+        ]
+        sample = options["poll_sample"]
+        sampled_bytes = 0
+        started = time.process_time()
+        for index in range(sample):
+            sampled_bytes += len(client.get(urls[index % len(urls)]).content)
+        per_poll = (time.process_time() - started) / sample
+        polls = options["subscribers"] * len(urls) * options["seconds"]
+        polling_cpu = per_poll * polls
+        self.stdout.write(
+            f"polling:   {polls} polls at {per_poll * 1e6:.0f}us cpu each, "
+            f"{sampled_bytes / sample * polls / 1e6:.1f} MB, cpu {polling_cpu:.2f}s (extrapolated)"
+        )
+        self.stdout.write(
+            f"polling costs {polling_cpu / max(self.streaming_cpu, 1e-9):.0f}x the CPU of streaming"
+        )
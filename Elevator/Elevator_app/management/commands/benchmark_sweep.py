@@ -0,0 +1,83 @@
+import logging
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from Elevator_app.models import Elevator, UserRequest
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Drains one car's queue of random requests with move_elevator, one step "
+        "per call and one sweep per call, and reports the calls, queries and "
+        "writes it took. Runs inside a transaction that is rolled back, so the "
+        "database is left unchanged."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--floors", type=int, default=20)
+        parser.add_argument("--capacity", type=int, default=10)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'mode':<7}{'calls':>7}{'queries':>9}{'writes':>8}{'ms':>9}{'floors visited':>16}"
+        )
+        # The call that finds the queue empty is answered with a 400.
+        request_logger = logging.getLogger("django.request")
+        level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        try:
+            for mode in ("step", "sweep"):
+                try:
+                    with transaction.atomic():
+                        self.run(mode, options)
+                        raise Rollback
+                except Rollback:
+                    pass
+        finally:
+            request_logger.setLevel(level)
+
+    def run(self, mode, options):
+        rng = random.Random(options["seed"])
+        elevator = Elevator.objects.create(capacity=options["capacity"])
+        UserRequest.objects.bulk_create(
+            UserRequest(
+                elevator=elevator,
+                requested_floor=requested_floor,
+                destination_floor=destination_floor,
+                queue_position=position,
+            )
+            for position, (requested_floor, destination_floor) in enumerate(
+                rng.sample(range(1, options["floors"] + 1), 2)
+                for _ in range(options["requests"])
+            )
+        )
+        client = Client(HTTP_HOST="localhost")
+        url = f"/elevators/{elevator.pk}/move_elevator/"
+        calls = floors = 0
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            while True:
+                response = client.post(url, {"mode": mode}, content_type="application/json")
+                if response.status_code != 200:
+                    break
+                calls += 1
+                floors += len(response.json().get("stops", [None]))
+        elapsed = (time.perf_counter() - started) * 1000
+        assert not UserRequest.objects.filter(elevator=elevator, is_complete=False).exists()
+        writes = sum(
+            query["sql"].startswith(("UPDATE", "INSERT", "DELETE")) for query in queries
+        )
+        self.stdout.write(
+            f"{mode:<7}{calls:>7}{len(queries):>9}{writes:>8}{elapsed:>9.0f}{floors:>16}"
+        )
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Elevator_app.events import (
+    event_log_setting,
+    mismatched_cars,
+    paused_gc,
+    replay,
+    write_snapshot,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the state of every car from the event log (the latest snapshot "
+        "and the events after it) and reports how long it took. --snapshot writes "
+        "a new snapshot; --verify compares the result with the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default=None, help="Event log (default ELEVATOR_EVENT_LOG['PATH']).")
+        parser.add_argument(
+            "--no-snapshot", action="store_true", help="Replay the whole log, ignoring the snapshot."
+        )
+        parser.add_argument("--snapshot", action="store_true", help="Write a new snapshot.")
+        parser.add_argument("--verify", action="store_true")
+
+    def handle(self, *args, **options):
+        path = str(options["path"] or event_log_setting("PATH", "elevator_events.jsonl"))
+        started = time.perf_counter()
+        with paused_gc():
+            if options["snapshot"]:
+                result = write_snapshot(path)
+            else:
+                result = replay(path, use_snapshot=not options["no_snapshot"])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"replayed {result.events} events in {elapsed:.2f}s: "
+            f"{len(result.states)} cars, {result.pending_count} pending requests"
+        )
+        if options["verify"]:
+            mismatched = mismatched_cars(result.states)
+            if mismatched:
+                raise CommandError(
+                    f"{len(mismatched)} cars differ from the database: "
+                    + ", ".join(str(pk) for pk in mismatched[:20])
+                )
+            self.stdout.write("replayed state matches the database")
@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+
+from Elevator_app.metrics import serve
+from Elevator_app.state import store_setting
+from Elevator_app.ticker import TickMetrics, tick
+
+
+class Command(BaseCommand):
+    help = (
+        "Drives every elevator that is not in maintenance one move_elevator step "
+        "per tick, committing each tick in one transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=1.0, help="Seconds per tick.")
+        parser.add_argument(
+            "--ticks", type=int, default=None, help="Stop after this many ticks."
+        )
+        parser.add_argument(
+            "--report-every", type=int, default=60, help="Ticks between metric reports."
+        )
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            default=None,
+            help="Serve /metrics, tick metrics included, on this port.",
+        )
+
+    def handle(self, *args, **options):
+        if store_setting("ENABLED", False):
+            raise CommandError(
+                "The state store keeps the cars in the serving process, which "
+                'this command cannot reach; set ELEVATOR_STATE_STORE["TICK_INTERVAL"] '
+                "to tick from that process instead."
+            )
+        self.metrics = TickMetrics()
+        if options["metrics_port"] is not None:
+            serve(options["metrics_port"])
+        try:
+            async_to_sync(self.run)(
+                options["interval"], options["ticks"], options["report_every"]
+            )
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.metrics.summary())
+
+    async def run(self, interval, ticks, report_every):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        # Thread-sensitive so ticks share the command's database connection.
+        run_tick = sync_to_async(tick, thread_sensitive=True)
+        while ticks is None or self.metrics.ticks < ticks:
+            started = time.perf_counter()
+            result = await run_tick()
+            self.metrics.observe(time.perf_counter() - started, result)
+            if report_every and self.metrics.ticks % report_every == 0:
+                self.stdout.write(self.metrics.summary())
+            # Fixed-rate schedule: a slow tick shortens the next sleep
+            # instead of shifting every later tick.
+            next_tick = max(next_tick + interval, loop.time())
+            await asyncio.sleep(next_tick - loop.time())
@@ -0,0 +1,116 @@
+import random
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+
+from Elevator_app.models import Elevator
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends save_user_request and move_elevator calls from concurrent threads "
+        "and checks that no update was lost: each car's version must equal the "
+        "number of writes acknowledged for it. Creates its own elevators in an "
+        "otherwise empty elevator table and deletes them afterwards. Use "
+        "PostgreSQL; SQLite serializes writers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--elevators", type=int, default=4)
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument(
+            "--operations", type=int, default=200, help="Calls made by each thread."
+        )
+        parser.add_argument("--floors", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        if Elevator.objects.exists():
+            raise CommandError(
+                "The elevator table must be empty: hails may be assigned to any car."
+            )
+        pks = [
+            elevator.pk
+            for elevator in Elevator.objects.bulk_create(
+                Elevator() for _ in range(options["elevators"])
+            )
+        ]
+        self.stats = Counter()
+        self.writes = Counter()
+        self.lock = threading.Lock()
+        try:
+            started = time.perf_counter()
+            self.run_workers(pks, options)
+            elapsed = time.perf_counter() - started
+            versions = dict(Elevator.objects.filter(pk__in=pks).values_list("pk", "version"))
+            lost = sum(abs(versions[pk] - self.writes[pk]) for pk in pks)
+        finally:
+            Elevator.objects.filter(pk__in=pks).delete()
+        operations = options["threads"] * options["operations"]
+        self.stdout.write(
+            f"{operations} calls from {options['threads']} threads in {elapsed:.2f}s "
+            f"({operations / elapsed:.0f} calls/s)"
+        )
+        self.stdout.write(
+            f"hails: {self.stats['hails']} moves: {self.stats['moves']} "
+            f"idle moves: {self.stats['idle']} conflicts (409): {self.stats['conflicts']} "
+            f"errors: {self.stats['errors']}"
+        )
+        self.stdout.write(f"lost updates: {lost}")
+
+    def run_workers(self, pks, options):
+        arguments = (pks, options["operations"], options["floors"])
+        if options["threads"] == 1:
+            # Inline, so the run shares the caller's connection and transaction.
+            self.work(*arguments, options["seed"])
+            return
+        threads = [
+            threading.Thread(target=self.work_in_thread, args=(*arguments, options["seed"] + n))
+            for n in range(options["threads"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def work_in_thread(self, *args):
+        try:
+            self.work(*args)
+        finally:
+            connection.close()
+
+    def work(self, pks, operations, floors, seed):
+        rng = random.Random(seed)
+        client = Client(HTTP_HOST="localhost", raise_request_exception=False)
+        stats = Counter()
+        writes = Counter()
+        for _ in range(operations):
+            if rng.random() < 0.5:
+                requested_floor, destination_floor = rng.sample(range(1, floors + 1), 2)
+                response = client.post(
+                    "/elevators/save_user_request/",
+                    {"requested_floor": requested_floor, "destination_floor": destination_floor},
+                    content_type="application/json",
+                )
+                if response.status_code == 201:
+                    stats["hails"] += 1
+                    writes[response.json()["elevator_id"]] += 1
+            else:
+                pk = rng.choice(pks)
+                response = client.post(f"/elevators/{pk}/move_elevator/")
+                if response.status_code == 200:
+                    stats["moves"] += 1
+                    writes[pk] += 1
+                elif response.status_code == 400:
+                    stats["idle"] += 1
+            if response.status_code == 409:
+                stats["conflicts"] += 1
+            elif response.status_code >= 500:
+                stats["errors"] += 1
+        with self.lock:
+            self.stats.update(stats)
+            self.writes.update(writes)
@@ -0,0 +1,141 @@
+import datetime
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from Elevator_app.dispatch import STRATEGIES, dispatch_setting, group_window, strategy_for
+from Elevator_app.forecast import parking_setting
+from Elevator_app.models import Elevator
+from Elevator_app.whatif import compare, export_hails
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports the recorded hails and replays them offline through the current "
+        "dispatch configuration and alternative strategies, car counts, "
+        "destination grouping and predictive parking, one process per configuration. Reports passenger "
+        "wait and journey times, stops and simulated throughput side by side."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--input", help="Replay this export instead of exporting the history.")
+        parser.add_argument("--output", help="Keep the export at this path.")
+        parser.add_argument("--building", type=int, default=None)
+        parser.add_argument("--days", type=int, default=None, help="Only the last N days of hails.")
+        parser.add_argument(
+            "--strategy", action="append", choices=sorted(STRATEGIES), dest="strategies"
+        )
+        parser.add_argument(
+            "--elevators", default=None, help="Comma-separated car counts (default: current)."
+        )
+        parser.add_argument(
+            "--grouping", action="store_true", help="Also replay with destination grouping."
+        )
+        parser.add_argument(
+            "--parking", action="store_true", help="Also replay with predictive parking."
+        )
+        parser.add_argument(
+            "--workers", type=int, default=None, help="Worker processes (default: one per core)."
+        )
+        parser.add_argument(
+            "--json", action="store_true", help="Print one JSON object per run instead of a table."
+        )
+
+    def handle(self, *args, **options):
+        cars = Elevator.objects.all()
+        if options["building"] is not None:
+            cars = cars.filter(building_id=options["building"])
+        configs = self.configs(max(cars.count(), 1), options)
+        path = options["input"] or options["output"]
+        if path is None:
+            descriptor, path = tempfile.mkstemp(suffix=".csv")
+            os.close(descriptor)
+        try:
+            if options["input"] is None:
+                since = None
+                if options["days"] is not None:
+                    since = timezone.now() - datetime.timedelta(days=options["days"])
+                exported = export_hails(path, building=options["building"], since=since)
+                if not options["json"]:
+                    self.stdout.write(f"exported {exported} hails to {path}")
+            if options["workers"] != 1:
+                # Forked workers must not share the database connections.
+                connections.close_all()
+            reports = compare(path, configs, workers=options["workers"])
+        except (OSError, ValueError) as error:
+            raise CommandError(f"Could not replay {path}: {error}")
+        finally:
+            if options["input"] is None and options["output"] is None:
+                os.remove(path)
+        self.write(reports, options["json"])
+
+    def configs(self, current_cars, options):
+        """
+        The current configuration, then every combination of the requested
+        strategies, car counts, grouping and parking that differs from it.
+        """
+        current = {
+            "label": "current",
+            "strategy": strategy_for(options["building"]).name,
+            "elevators": current_cars,
+            "group_window": group_window(),
+            "parking": bool(parking_setting("ENABLED", False)),
+        }
+        counts = [current_cars]
+        if options["elevators"]:
+            try:
+                counts = [int(count) for count in options["elevators"].split(",")]
+            except ValueError:
+                counts = []
+            if not counts or min(counts) < 1:
+                raise CommandError(
+                    f"--elevators takes comma-separated car counts of at least 1, "
+                    f"not {options['elevators']!r}."
+                )
+        windows = [None]
+        if options["grouping"]:
+            windows.append(dispatch_setting("GROUP_WINDOW_SECONDS", 30.0))
+        parkings = [False, True] if options["parking"] else [False]
+        configs = [current]
+        for strategy in options["strategies"] or STRATEGIES:
+            for elevators in counts:
+                for window in windows:
+                    for parking in parkings:
+                        config = {
+                            "strategy": strategy,
+                            "elevators": elevators,
+                            "group_window": window,
+                            "parking": parking,
+                        }
+                        if any(config.items() <= other.items() for other in configs):
+                            continue
+                        grouped = " grouped" if window is not None else ""
+                        parked = " parked" if parking else ""
+                        configs.append(
+                            {"label": f"{strategy}/{elevators}{grouped}{parked}", **config}
+                        )
+        return configs
+
+    def write(self, reports, as_json):
+        baseline = reports[0]["avg_wait"]
+        if as_json:
+            for report in reports:
+                self.stdout.write(json.dumps(report))
+            return
+        self.stdout.write(
+            f"{'configuration':<25}{'avg wait':>10}{'p95 wait':>10}{'p99 wait':>10}"
+            f"{'p95 journey':>13}{'stops/pass':>12}{'pass/hour':>11}{'peak hour':>11}"
+            f"{'vs current':>12}"
+        )
+        for report in reports:
+            change = report["avg_wait"] / baseline - 1 if baseline else 0.0
+            self.stdout.write(
+                f"{report['label']:<25}{report['avg_wait']:>10.1f}{report['p95_wait']:>10.1f}"
+                f"{report['p99_wait']:>10.1f}{report['p95_journey']:>13.1f}"
+                f"{report['stops_per_passenger']:>12.2f}{report['passengers_per_hour']:>11.1f}"
+                f"{report['peak_hour_passengers']:>11}{change:>12.0%}"
+            )
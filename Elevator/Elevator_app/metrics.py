@@ -0,0 +1,362 @@
+"""
+Request, database, cache and dispatch metrics in Prometheus text format.
+
+`MetricsMiddleware` times every request and counts the ORM queries it runs
+(through a database execute wrapper, so no query log is kept), labelled with
+the viewset action that served it. The cache records hits and misses per
+cached answer, and the views time each dispatch decision separately from
+the request around it. `run_elevators` records every tick's latency and
+what it moved; the tick rate is the rate of the tick histogram's count.
+`render` produces the exposition served at `/metrics`, and `serve` exposes
+it from processes that do not run the web application.
+
+Under ASGI the middleware runs on the event loop, so async views are not
+pushed onto a thread by it. Their ORM queries run on worker threads' database
+connections, so they are attributed to the request through a context
+variable rather than a wrapper on the request's own connection.
+
+Metrics live in process memory: with several worker processes each one
+exports its own series, which Prometheus sums across scrape targets.
+Recording an observation is a bisect and an increment under a lock.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+DISPATCH_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+
+def metrics_setting(name, default):
+    return getattr(settings, "ELEVATOR_METRICS", {}).get(name, default)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._series.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            series = sorted(self._series.items())
+        for label_values, value in series:
+            yield f"{self.name}{_labels(self.labels, label_values)} {value}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labels = labels
+        # label values -> [count per bucket (the last one is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, *label_values):
+        series = self._series.get(label_values)
+        return sum(series[0]) if series else 0
+
+    def samples(self):
+        with self._lock:
+            series = sorted(
+                (label_values, (list(counts), total))
+                for label_values, (counts, total) in self._series.items()
+            )
+        for label_values, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.labels, label_values, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, label_values)} {total}"
+            yield f"{self.name}_count{_labels(self.labels, label_values)} {cumulative}"
+
+
+class Registry:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry(enabled=metrics_setting("ENABLED", True))
+
+request_duration = registry.register(
+    Histogram(
+        "elevator_request_duration_seconds",
+        "Time to serve a request, by viewset action.",
+        LATENCY_BUCKETS,
+        labels=("action",),
+    )
+)
+requests_total = registry.register(
+    Counter(
+        "elevator_requests_total",
+        "Requests served, by viewset action and status code.",
+        labels=("action", "status"),
+    )
+)
+request_queries = registry.register(
+    Histogram(
+        "elevator_request_db_queries",
+        "ORM queries run while serving a request, by viewset action.",
+        QUERY_BUCKETS,
+        labels=("action",),
+    )
+)
+request_query_seconds = registry.register(
+    Counter(
+        "elevator_request_db_query_seconds_total",
+        "Time spent in ORM queries, by viewset action.",
+        labels=("action",),
+    )
+)
+cache_lookups = registry.register(
+    Counter(
+        "elevator_cache_lookups_total",
+        "Cached answer lookups, by answer and result (hit, miss or bypass).",
+        labels=("answer", "result"),
+    )
+)
+dispatch_duration = registry.register(
+    Histogram(
+        "elevator_dispatch_duration_seconds",
+        "Time the dispatch strategy takes to decide, by strategy and decision.",
+        DISPATCH_BUCKETS,
+        labels=("strategy", "decision"),
+    )
+)
+tick_duration = registry.register(
+    Histogram(
+        "elevator_tick_duration_seconds",
+        "Time a tick of the elevator bank takes.",
+        LATENCY_BUCKETS,
+    )
+)
+tick_steps = registry.register(
+    Counter(
+        "elevator_tick_steps_total",
+        "Cars moved, requests completed and cars parked by ticks.",
+        labels=("step",),
+    )
+)
+
+
+def render():
+    return registry.render()
+
+
+def record_tick(seconds, moved, completed, parked):
+    if registry.enabled:
+        tick_duration.observe(seconds)
+        tick_steps.inc("moved", amount=moved)
+        tick_steps.inc("completed", amount=completed)
+        tick_steps.inc("parked", amount=parked)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, address=""):
+    """
+    Serves `/metrics` on `port` from a daemon thread, for processes such as
+    `run_elevators` that do not serve the web application. Returns the server.
+    """
+    server = ThreadingHTTPServer((address, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def record_cache_lookup(answer, result):
+    if registry.enabled:
+        cache_lookups.inc(answer, result)
+
+
+class dispatch_timer:
+    """
+    Times a dispatch decision:
+
+        with dispatch_timer(strategy, "select"):
+            elevator = strategy.select_elevator(...)
+    """
+
+    __slots__ = ("strategy", "decision", "started")
+
+    def __init__(self, strategy, decision):
+        self.strategy = strategy
+        self.decision = decision
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if registry.enabled:
+            dispatch_duration.observe(
+                time.perf_counter() - self.started, self.strategy.name, self.decision
+            )
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper counting the queries of one request and the
+    time spent in them.
+    """
+
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+_async_recorder = ContextVar("elevator_query_recorder", default=None)
+
+
+def _record_async_query(execute, sql, params, many, context):
+    recorder = _async_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def _install_async_recorder(sender, connection, **kwargs):
+    if _record_async_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_async_query)
+
+
+class MetricsMiddleware:
+    """
+    Records latency, status and ORM queries of every request under the name
+    of the viewset action (or URL name) that served it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not registry.enabled:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # The connections async requests query through are opened on
+            # worker threads after this point.
+            connection_created.connect(
+                _install_async_recorder, dispatch_uid="elevator_async_query_recorder"
+            )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, recorder)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        token = _async_recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _async_recorder.reset(token)
+        self.record(request, response, time.perf_counter() - started, recorder)
+        return response
+
+    @staticmethod
+    def action(request):
+        match = request.resolver_match
+        if match is None:
+            return "unmatched"
+        actions = getattr(match.func, "actions", None)
+        if actions:
+            return actions.get(request.method.lower(), "other")
+        return match.url_name or match.func.__name__
+
+    def record(self, request, response, elapsed, recorder):
+        action = self.action(request)
+        request_duration.observe(elapsed, action)
+        requests_total.inc(action, response.status_code)
+        request_queries.observe(recorder.count, action)
+        request_query_seconds.inc(action, amount=recorder.seconds)
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("Elevator_app", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="userrequest",
+            index=models.Index(
+                fields=["elevator", "is_complete", "created_at"],
+                name="userrequest_queue_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:01
+
+from django.db import migrations, models
+
+
+def number_pending_requests(apps, schema_editor):
+    """
+    Gives existing pending requests queue positions in their arrival order.
+    """
+    UserRequest = apps.get_model("Elevator_app", "UserRequest")
+    positions = {}
+    pending = UserRequest.objects.filter(is_complete=False).order_by("created_at", "pk")
+    numbered = []
+    for user_request in pending.iterator():
+        positions[user_request.elevator_id] = positions.get(user_request.elevator_id, 0) + 1
+        user_request.queue_position = positions[user_request.elevator_id]
+        numbered.append(user_request)
+    UserRequest.objects.bulk_update(numbered, ["queue_position"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("Elevator_app", "0002_userrequest_queue_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userrequest",
+            name="queue_position",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(number_pending_requests, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="userrequest",
+            index=models.Index(
+                condition=models.Q(("is_complete", False)),
+                fields=["elevator", "queue_position", "created_at"],
+                name="userrequest_pending_idx",
+            ),
+        ),
+    ]
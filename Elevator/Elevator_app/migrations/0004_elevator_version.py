@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("Elevator_app", "0003_userrequest_queue_position"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="elevator",
+            name="version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
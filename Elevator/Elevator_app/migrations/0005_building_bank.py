@@ -0,0 +1,88 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("Elevator_app", "0004_elevator_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Building",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="Bank",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100)),
+                ("lowest_floor", models.IntegerField(default=1)),
+                ("highest_floor", models.IntegerField()),
+                (
+                    "building",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="banks",
+                        to="Elevator_app.building",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="elevator",
+            name="bank",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="elevators",
+                to="Elevator_app.bank",
+            ),
+        ),
+        migrations.AddField(
+            model_name="elevator",
+            name="building",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="elevators",
+                to="Elevator_app.building",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="bank",
+            constraint=models.UniqueConstraint(
+                fields=("building", "name"), name="bank_unique_name"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="bank",
+            constraint=models.CheckConstraint(
+                check=models.Q(("lowest_floor__lte", models.F("highest_floor"))),
+                name="bank_floor_range",
+            ),
+        ),
+    ]
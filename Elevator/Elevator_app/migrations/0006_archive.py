@@ -0,0 +1,94 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("Elevator_app", "0005_building_bank"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedUserRequest",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("elevator_id", models.BigIntegerField()),
+                ("building_id", models.BigIntegerField(blank=True, null=True)),
+                ("requested_floor", models.IntegerField(blank=True, null=True)),
+                ("current_floor", models.IntegerField(blank=True, null=True)),
+                ("destination_floor", models.IntegerField(blank=True, null=True)),
+                ("created_at", models.DateTimeField()),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="DailyElevatorTrips",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("elevator_id", models.BigIntegerField()),
+                ("building_id", models.BigIntegerField(blank=True, null=True)),
+                ("trips", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="DailyFloorPairTrips",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("building_id", models.BigIntegerField(blank=True, null=True)),
+                ("requested_floor", models.IntegerField()),
+                ("destination_floor", models.IntegerField()),
+                ("trips", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="archiveduserrequest",
+            index=models.Index(fields=["created_at"], name="archivedrequest_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="archiveduserrequest",
+            index=models.Index(
+                fields=["elevator_id", "created_at"], name="archivedrequest_car_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="dailyelevatortrips",
+            constraint=models.UniqueConstraint(
+                fields=("day", "elevator_id"), name="dailytrips_unique_car"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="dailyfloorpairtrips",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("building_id__isnull", False)),
+                fields=("day", "building_id", "requested_floor", "destination_floor"),
+                name="dailypairs_unique_pair",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="dailyfloorpairtrips",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("building_id__isnull", True)),
+                fields=("day", "requested_floor", "destination_floor"),
+                name="dailypairs_unique_pool_pair",
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:05
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("Elevator_app", "0006_archive"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="elevator",
+            name="capacity",
+            field=models.PositiveIntegerField(
+                default=10, validators=[django.core.validators.MinValueValidator(1)]
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("Elevator_app", "0007_elevator_capacity"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userrequest",
+            name="idempotency_key",
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name="userrequest",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("idempotency_key__isnull", False)),
+                fields=("idempotency_key",),
+                name="userrequest_unique_idempotency_key",
+            ),
+        ),
+    ]
@@ -1,11 +1,61 @@
+from django.core.validators import MinValueValidator
 from django.db import models
 
+# Order in which a car's pending requests are queued.
+QUEUE_ORDERING = ("queue_position", "created_at")
+
 # Create your models here.
+class Building(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Bank(models.Model):
+    """
+    A group of elevators in one building that serve the same floor range.
+    """
+
+    building = models.ForeignKey(Building, on_delete=models.CASCADE, related_name="banks")
+    name = models.CharField(max_length=100)
+    lowest_floor = models.IntegerField(default=1)
+    highest_floor = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["building", "name"], name="bank_unique_name"),
+            models.CheckConstraint(
+                check=models.Q(lowest_floor__lte=models.F("highest_floor")),
+                name="bank_floor_range",
+            ),
+        ]
+
+    def serves(self, *floors):
+        return all(self.lowest_floor <= floor <= self.highest_floor for floor in floors)
+
+    def __str__(self):
+        return f"{self.building} / {self.name}"
+
+
 class Elevator(models.Model):
+    # Cars without a bank form the default pool used when no building is given.
+    bank = models.ForeignKey(
+        Bank, on_delete=models.CASCADE, related_name="elevators", null=True, blank=True
+    )
+    # Copied from the bank so reads can be routed by building without a join.
+    building = models.ForeignKey(
+        Building, on_delete=models.CASCADE, related_name="elevators", null=True, blank=True
+    )
     current_floor = models.IntegerField(default=1)
     is_door_open = models.BooleanField(default=False)
     in_maintenance = models.BooleanField(default=False)
     direction = models.IntegerField(default=0)
+    # Passengers the car carries at once; a destination group never exceeds it.
+    capacity = models.PositiveIntegerField(default=10, validators=[MinValueValidator(1)])
+    # Bumped on every write, so a read-modify-write can detect that the row
+    # changed underneath it.
+    version = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"Elevator {self.pk}" 
@@ -17,6 +67,100 @@ class UserRequest(models.Model):
     destination_floor = models.IntegerField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     is_complete = models.BooleanField(default=False)
+    queue_position = models.PositiveIntegerField(default=0)
+    # Client-supplied Idempotency-Key of the hail that created the request.
+    idempotency_key = models.CharField(max_length=100, blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["idempotency_key"],
+                condition=models.Q(idempotency_key__isnull=False),
+                name="userrequest_unique_idempotency_key",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["elevator", "is_complete", "created_at"],
+                name="userrequest_queue_idx",
+            ),
+            # Only pending requests are indexed, so finding a car's next stop
+            # does not slow down as completed history grows.
+            models.Index(
+                fields=["elevator", "queue_position", "created_at"],
+                name="userrequest_pending_idx",
+                condition=models.Q(is_complete=False),
+            ),
+        ]
 
     def __str__(self):
-        return f"Request {self.pk} for Elevator {self.elevator.pk}" 
\ No newline at end of file
+        return f"Request {self.pk} for Elevator {self.elevator.pk}" 
+
+
+class ArchivedUserRequest(models.Model):
+    """
+    A completed request moved out of `UserRequest` by the archive_requests
+    command, under its original id. Cars may since have been deleted, so
+    the elevator and building are plain ids, not foreign keys.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    elevator_id = models.BigIntegerField()
+    building_id = models.BigIntegerField(blank=True, null=True)
+    requested_floor = models.IntegerField(blank=True, null=True)
+    current_floor = models.IntegerField(blank=True, null=True)
+    destination_floor = models.IntegerField(blank=True, null=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at"], name="archivedrequest_created_idx"),
+            models.Index(fields=["elevator_id", "created_at"], name="archivedrequest_car_idx"),
+        ]
+
+
+class DailyElevatorTrips(models.Model):
+    """
+    Completed trips per car per day (UTC, by request creation), kept after
+    the archived requests themselves expire.
+    """
+
+    day = models.DateField()
+    elevator_id = models.BigIntegerField()
+    building_id = models.BigIntegerField(blank=True, null=True)
+    trips = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "elevator_id"], name="dailytrips_unique_car"),
+        ]
+
+
+class DailyFloorPairTrips(models.Model):
+    """
+    Completed trips per (requested floor, destination floor) per building
+    per day.
+    """
+
+    day = models.DateField()
+    building_id = models.BigIntegerField(blank=True, null=True)
+    requested_floor = models.IntegerField()
+    destination_floor = models.IntegerField()
+    trips = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # NULLs never conflict in a unique index, so the default pool (no
+        # building) needs a constraint of its own.
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "building_id", "requested_floor", "destination_floor"],
+                name="dailypairs_unique_pair",
+                condition=models.Q(building_id__isnull=False),
+            ),
+            models.UniqueConstraint(
+                fields=["day", "requested_floor", "destination_floor"],
+                name="dailypairs_unique_pool_pair",
+                condition=models.Q(building_id__isnull=True),
+            ),
+        ]
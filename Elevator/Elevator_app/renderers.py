@@ -0,0 +1,61 @@
+"""
+JSON rendering through orjson.
+
+`FastJSONRenderer` is the default DRF renderer (see REST_FRAMEWORK in the
+settings). It produces the same bytes as DRF's `JSONRenderer` with the
+default settings (compact, unescaped Unicode, U+2028 and U+2029 escaped), in
+a fraction of the time, for everything the API returns. Floats are the one
+difference: orjson writes exponents without padding (`1e16`, not `1e+16`),
+and none of the responses contain floats. Indented output (the browsable API,
+or `Accept: application/json; indent=4`) and a missing orjson fall back to
+`JSONRenderer`.
+"""
+from itertools import islice
+
+from rest_framework.utils import encoders
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    def __init__(self):
+        self._default = encoders.JSONEncoder().default
+
+    @property
+    def fast(self):
+        return orjson is not None and self.compact and not self.ensure_ascii
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or not self.fast:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # Datetimes go through DRF's encoder, which writes UTC as "Z".
+            ret = orjson.dumps(
+                data, default=self._default, option=orjson.OPT_PASSTHROUGH_DATETIME
+            )
+        except orjson.JSONEncodeError:
+            # E.g. integers beyond 64 bits.
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+    def stream(self, rows, batch_size=1000):
+        """
+        Yields the rendering of the list of `rows` (any iterable) in pieces of
+        `batch_size` rows: the same bytes as rendering the whole list, without
+        holding it.
+        """
+        rows = iter(rows)
+        separator = b"["
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            yield separator + self.render(batch)[1:-1]
+            separator = b","
+        yield b"[]" if separator == b"[" else b"]"
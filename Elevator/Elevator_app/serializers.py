@@ -1,12 +1,159 @@
-from rest_framework import serializers
-from Elevator_app.models import Elevator,UserRequest
+import threading
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from Elevator_app.models import Bank, Building, Elevator, UserRequest
+
+# Fields whose representation of a column value is the value itself.
+PLAIN_FIELDS = (serializers.IntegerField, serializers.CharField, serializers.BooleanField)
+
+
+def serialization_setting(name, default):
+    return getattr(settings, "ELEVATOR_SERIALIZATION", {}).get(name, default)
+
+
+def fast_path_enabled():
+    return serialization_setting("FAST_PATH", False)
+
+
+class BuildingSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Building
+        fields = '__all__'
+
+
+class BankSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Bank
+        fields = '__all__'
+
+    def validate(self, attrs):
+        lowest = attrs.get("lowest_floor", getattr(self.instance, "lowest_floor", 1))
+        highest = attrs.get("highest_floor", getattr(self.instance, "highest_floor", None))
+        if highest is not None and lowest > highest:
+            raise serializers.ValidationError("lowest_floor must not be above highest_floor.")
+        return attrs
+
 
 class ElevatorSerializer(serializers.ModelSerializer):
     class Meta:
         model = Elevator
         fields = '__all__'
+        # The building always follows the bank.
+        read_only_fields = ("version", "building")
 
 class UserRequestSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserRequest
-        fields = '__all__'
\ No newline at end of file
+        exclude = ("idempotency_key",)
+
+    def __init__(self, *args, **kwargs):
+        # Optional `fields` keeps only the named fields in the output.
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
+class ValuesSerializer:
+    """
+    The output of a ModelSerializer built from `.values()` rows instead of
+    model instances, without going through a serializer field per value.
+    `columns` are (output name, column, serializer field or None when the
+    column value is output as is), in the serializer's field order.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.lookups = [column for _, column, _ in columns]
+
+    @classmethod
+    def for_serializer(cls, serializer):
+        """
+        The ValuesSerializer of `serializer`, or None if one of its fields is
+        not a plain model column, in which case it must serialize instances.
+        """
+        model = serializer.Meta.model
+        columns = []
+        for field in serializer.fields.values():
+            if field.write_only:
+                continue
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                return None
+            if not model_field.concrete:
+                return None
+            if type(field) in PLAIN_FIELDS or (
+                type(field) is serializers.PrimaryKeyRelatedField and field.pk_field is None
+            ):
+                columns.append((field.field_name, field.source, None))
+            elif type(field) is serializers.DateTimeField:
+                columns.append((field.field_name, field.source, field))
+            else:
+                return None
+        return cls(columns)
+
+    @staticmethod
+    def _converter(field):
+        """
+        `field.to_representation`, with the output format and time zone
+        looked up once instead of for every value.
+        """
+        output_format = getattr(field, "format", api_settings.DATETIME_FORMAT)
+        field_timezone = field.timezone if hasattr(field, "timezone") else field.default_timezone()
+        if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+            return field.to_representation
+
+        def to_representation(value):
+            if isinstance(value, str) or value.tzinfo is None:
+                return field.to_representation(value)
+            value = value.astimezone(field_timezone).isoformat()
+            return value[:-6] + "Z" if value.endswith("+00:00") else value
+
+        return to_representation
+
+    def serialize(self, rows):
+        """
+        An iterator over the representations of `rows`. The time zone is
+        the one current when it is called, even if it is consumed later.
+        """
+        columns = [
+            (name, column, None if field is None else self._converter(field))
+            for name, column, field in self.columns
+        ]
+
+        def representations():
+            for row in rows:
+                data = {}
+                for name, column, convert in columns:
+                    value = row[column]
+                    data[name] = value if convert is None or value is None else convert(value)
+                yield data
+
+        return representations()
+
+
+_values_serializers = {}
+_values_serializers_lock = threading.Lock()
+
+
+def values_serializer(serializer_class, fields=None):
+    """
+    The ValuesSerializer of `serializer_class` (restricted to `fields`, for
+    serializers that take them), or None if it has none. Built once per
+    process.
+    """
+    # Fields are output in the serializer's order whatever order they are
+    # asked for in.
+    key = (serializer_class, None if fields is None else tuple(sorted(set(fields))))
+    if key not in _values_serializers:
+        kwargs = {} if fields is None else {"fields": fields}
+        with _values_serializers_lock:
+            _values_serializers[key] = ValuesSerializer.for_serializer(
+                serializer_class(**kwargs)
+            )
+    return _values_serializers[key]
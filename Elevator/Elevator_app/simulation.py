@@ -0,0 +1,491 @@
+"""
+Offline discrete-event simulator for the dispatch strategies.
+
+Cars and requests are plain in-memory objects exposing the same attributes
+as the `Elevator` and `UserRequest` models, so a strategy from
+`Elevator_app.dispatch` runs here unchanged. A move follows the
+`move_elevator` rule: a car travels to the pickup floor of the request its
+strategy chooses, then carries the passenger to the destination. With a
+`group_window`, cars board and carry destination groups as the endpoints do
+with destination grouping enabled. With a `parking` policy, every hail is
+fed to its forecaster and cars left idle are parked where it expects the
+next hails, as the ticker does.
+
+`ApiSimulator` replays the same traffic through the real endpoints with the
+Django test client instead, adding per-endpoint latency and query counts to
+the passenger metrics.
+"""
+import heapq
+import logging
+import random
+import time
+from statistics import mean
+
+from django.conf import settings
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from Elevator_app.dispatch import (
+    IDLE,
+    direction_to,
+    dispatch_setting,
+    joinable_car,
+    passenger_group,
+    target_floor,
+)
+from Elevator_app.models import UserRequest
+
+LOBBY = 1
+
+
+def nearest_rank(values, percentile):
+    """
+    Nearest-rank percentile of `values`; 0.0 if there are none.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+class SimRequest:
+    __slots__ = (
+        "requested_floor",
+        "destination_floor",
+        "created_at",
+        "boarded_at",
+        "completed_at",
+    )
+
+    def __init__(self, requested_floor, destination_floor, created_at):
+        self.requested_floor = requested_floor
+        self.destination_floor = destination_floor
+        self.created_at = created_at
+        self.boarded_at = None
+        self.completed_at = None
+
+
+class SimElevator:
+    def __init__(self, pk, current_floor=1, capacity=10):
+        self.pk = pk
+        self.current_floor = current_floor
+        self.capacity = capacity
+        self.direction = IDLE
+        self.is_door_open = False
+        self.in_maintenance = False
+        self.pending = []
+        self.moving = False
+        self.stops = 0
+
+    @property
+    def pending_destination(self):
+        return self.pending[0].destination_floor if self.pending else None
+
+    @property
+    def pending_count(self):
+        return len(self.pending)
+
+    @property
+    def queue_tail(self):
+        return len(self.pending)
+
+
+class EndpointStats:
+    """
+    Wall-clock latency and query count of every call to one endpoint.
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self.queries = []
+
+    def observe(self, seconds, queries):
+        self.latencies.append(seconds)
+        self.queries.append(queries)
+
+    def as_dict(self):
+        return {
+            "calls": len(self.latencies),
+            "p50_ms": round(nearest_rank(self.latencies, 50) * 1000, 3),
+            "p95_ms": round(nearest_rank(self.latencies, 95) * 1000, 3),
+            "p99_ms": round(nearest_rank(self.latencies, 99) * 1000, 3),
+            "queries_per_call": round(mean(self.queries), 2) if self.queries else 0.0,
+        }
+
+
+class SimulationResult:
+    """
+    Passenger wait (hail to boarding) and journey (hail to arrival) times in
+    simulated seconds, stops per delivered passenger, passengers delivered
+    per simulated hour, and hails processed per wall-clock second.
+    """
+
+    def __init__(self, strategy, requests, stops, elapsed, endpoints=None):
+        completed = [request for request in requests if request.completed_at is not None]
+        waits = [r.boarded_at - r.created_at for r in completed]
+        journeys = [r.completed_at - r.created_at for r in completed]
+        self.strategy = strategy
+        self.requests = len(requests)
+        self.completed = len(completed)
+        self.stops = stops
+        self.avg_wait = mean(waits) if completed else 0.0
+        self.avg_travel = (
+            mean(r.completed_at - r.boarded_at for r in completed) if completed else 0.0
+        )
+        self.stops_per_passenger = stops / len(completed) if completed else 0.0
+        span = (
+            max(r.completed_at for r in completed) - min(r.created_at for r in requests)
+            if completed
+            else 0.0
+        )
+        self.passengers_per_hour = len(completed) * 3600 / span if span else 0.0
+        self.wait_percentiles = {p: nearest_rank(waits, p) for p in (50, 95, 99)}
+        self.journey_percentiles = {p: nearest_rank(journeys, p) for p in (50, 95, 99)}
+        self.requests_per_second = len(requests) / elapsed if elapsed else float("inf")
+        self.endpoints = endpoints or {}
+
+    def as_dict(self):
+        result = {
+            "strategy": self.strategy,
+            "requests": self.requests,
+            "completed": self.completed,
+            "stops": self.stops,
+            "stops_per_passenger": round(self.stops_per_passenger, 3),
+            "passengers_per_hour": round(self.passengers_per_hour, 1),
+            "avg_wait": round(self.avg_wait, 2),
+            "avg_travel": round(self.avg_travel, 2),
+            **{f"p{p}_wait": round(v, 2) for p, v in self.wait_percentiles.items()},
+            **{f"p{p}_journey": round(v, 2) for p, v in self.journey_percentiles.items()},
+            "requests_per_second": round(self.requests_per_second, 1),
+        }
+        if self.endpoints:
+            result["endpoints"] = {
+                name: stats.as_dict() for name, stats in self.endpoints.items()
+            }
+        return result
+
+
+class Simulator:
+    """
+    Runs a list of hails `(time, requested_floor, destination_floor)` through
+    a strategy on `elevators` cars and reports wait and travel times in
+    simulated seconds. With a `group_window` (seconds), passengers with the
+    same floors are grouped up to each car's `capacity`. A `parking` policy
+    (see `forecast.ParkingPolicy`) parks idle cars; hail times are its clock.
+    """
+
+    def __init__(
+        self,
+        strategy,
+        elevators=8,
+        floor_travel_seconds=None,
+        stop_seconds=None,
+        capacity=10,
+        group_window=None,
+        parking=None,
+    ):
+        self.strategy = strategy
+        self.cars = [SimElevator(pk, capacity=capacity) for pk in range(1, elevators + 1)]
+        self.group_window = group_window
+        self.parking = parking
+        self.floor_travel_seconds = (
+            floor_travel_seconds
+            if floor_travel_seconds is not None
+            else dispatch_setting("FLOOR_TRAVEL_SECONDS", 1.5)
+        )
+        self.stop_seconds = (
+            stop_seconds if stop_seconds is not None else dispatch_setting("STOP_SECONDS", 8.0)
+        )
+        self._events = []
+        self._sequence = 0
+        # Cars on their way to park: pk -> (car, from floor, floor, started).
+        self._parking = {}
+
+    def _push(self, at, kind, payload):
+        self._sequence += 1
+        heapq.heappush(self._events, (at, self._sequence, kind, payload))
+
+    def _queue(self, car):
+        lookahead = self.strategy.lookahead
+        if lookahead is None or self.group_window is not None:
+            return car.pending
+        return car.pending[:lookahead]
+
+    def _dispatch(self, car, now):
+        user_request = self.strategy.next_request(car, self._queue(car), now=now)
+        if user_request is None:
+            car.moving = False
+            car.direction = IDLE
+            if self.parking is not None:
+                self._park(now)
+            return
+        next_floor = target_floor(user_request, car.current_floor)
+        riders = []
+        if car.current_floor == user_request.requested_floor:
+            riders = [user_request]
+            if self.group_window is not None:
+                riders = passenger_group(
+                    user_request, car.pending, car.capacity, self.group_window
+                )
+        for rider in riders:
+            if rider.boarded_at is None:
+                rider.boarded_at = now
+        duration = (
+            abs(next_floor - car.current_floor) * self.floor_travel_seconds + self.stop_seconds
+        )
+        car.direction = direction_to(car.current_floor, next_floor)
+        car.moving = True
+        self._push(now + duration, "arrive", (car, riders, next_floor))
+
+    def _assign(self, user_request):
+        car = None
+        if self.group_window is not None:
+            car = joinable_car(
+                self.cars,
+                user_request.requested_floor,
+                user_request.destination_floor,
+                user_request.created_at,
+                self.group_window,
+            )
+        if car is None:
+            car = self.strategy.select_elevator(
+                self.cars, user_request.requested_floor, user_request.destination_floor
+            )
+        car.pending.append(user_request)
+        return car
+
+    def _arrive(self, payload, now):
+        car, riders, next_floor = payload
+        car.current_floor = next_floor
+        car.stops += 1
+        for rider in riders:
+            rider.completed_at = now
+            car.pending.remove(rider)
+        self._dispatch(car, now)
+
+    def _park(self, now):
+        # Parking takes the travel time but no stop, and is not a passenger stop.
+        idle = [car for car in self.cars if not car.moving and not car.pending]
+        for car, floor in self.parking.plan(idle, None, now):
+            car.direction = direction_to(car.current_floor, floor)
+            car.moving = True
+            payload = (car, car.current_floor, floor, now)
+            self._parking[car.pk] = payload
+            duration = abs(floor - car.current_floor) * self.floor_travel_seconds
+            self._push(now + duration, "park", payload)
+
+    def _interrupt(self, car, now):
+        # A hail stops a parking car at the floor it has reached.
+        _, from_floor, floor, started = self._parking.pop(car.pk)
+        travelled = min(int((now - started) / self.floor_travel_seconds), abs(floor - from_floor))
+        car.current_floor = from_floor + direction_to(from_floor, floor) * travelled
+        car.moving = False
+
+    def _parked(self, payload, now):
+        car, _, floor, _ = payload
+        if self._parking.get(car.pk) is not payload:
+            return
+        del self._parking[car.pk]
+        car.current_floor = floor
+        self._dispatch(car, now)
+
+    def _result(self, requests, elapsed):
+        return SimulationResult(
+            self.strategy.name, requests, sum(car.stops for car in self.cars), elapsed
+        )
+
+    def _hail(self, payload, now):
+        user_request = SimRequest(*payload, created_at=now)
+        if self.parking is not None:
+            self.parking.forecaster.observe(None, user_request.requested_floor, now)
+        car = self._assign(user_request)
+        if car.pk in self._parking:
+            self._interrupt(car, now)
+        if not car.moving:
+            self._dispatch(car, now)
+        return user_request
+
+    def _step(self, kind, payload, now):
+        # Every event but a hail.
+        if kind == "park":
+            self._parked(payload, now)
+        else:
+            self._arrive(payload, now)
+
+    def run(self, hails):
+        requests = []
+        for at, requested_floor, destination_floor in hails:
+            self._push(at, "hail", (requested_floor, destination_floor))
+        started = time.perf_counter()
+        while self._events:
+            now, _, kind, payload = heapq.heappop(self._events)
+            if kind == "hail":
+                requests.append(self._hail(payload, now))
+            else:
+                self._step(kind, payload, now)
+        return self._result(requests, time.perf_counter() - started)
+
+
+class ApiSimulator(Simulator):
+    """
+    Runs the simulation through the elevator endpoints: hails are posted to
+    `save_user_request` and cars are driven with `move_elevator`, so the
+    dispatch decisions are the ones the API makes with `strategy` configured.
+    Every call's latency and query count is recorded per endpoint.
+
+    It starts by calling `initialize_elevators`, which replaces every
+    elevator in the database; callers run it in a transaction they roll back.
+    Simulated time only drives the event order: requests are stamped with
+    wall-clock `created_at`, so the ETA strategy's aging sees real time.
+    """
+
+    def __init__(self, strategy, elevators=8, floor_travel_seconds=None, stop_seconds=None):
+        super().__init__(strategy, elevators, floor_travel_seconds, stop_seconds)
+        self.client = Client(HTTP_HOST="localhost")
+        self.endpoints = {}
+        self._open = {}
+
+    def _call(self, endpoint, path, data=None):
+        # The debug query log is bounded; emptying it keeps every count exact.
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = self.client.post(path, data, content_type="application/json")
+            elapsed = time.perf_counter() - started
+        self.endpoints.setdefault(endpoint, EndpointStats()).observe(elapsed, len(queries))
+        return response
+
+    def _assign(self, user_request):
+        response = self._call(
+            "save_user_request",
+            "/elevators/save_user_request/",
+            {
+                "requested_floor": user_request.requested_floor,
+                "destination_floor": user_request.destination_floor,
+            },
+        )
+        assigned = response.json()
+        car = self._cars[assigned["elevator_id"]]
+        self._open[car.pk][assigned["request_id"]] = user_request
+        return car
+
+    def _dispatch(self, car, now):
+        response = self._call("move_elevator", f"/elevators/{car.pk}/move_elevator/")
+        if response.status_code != 200:
+            car.moving = False
+            car.direction = IDLE
+            return
+        moved = response.json()
+        open_requests = self._open[car.pk]
+        completed = [
+            open_requests.pop(pk)
+            for pk in UserRequest.objects.filter(
+                pk__in=list(open_requests), is_complete=True
+            ).values_list("pk", flat=True)
+        ]
+        for user_request in completed:
+            user_request.boarded_at = now
+        duration = (
+            abs(moved["current_floor"] - moved["previous_floor"]) * self.floor_travel_seconds
+            + self.stop_seconds
+        )
+        car.direction = direction_to(moved["previous_floor"], moved["current_floor"])
+        car.moving = True
+        self._push(now + duration, "arrive", (car, completed, moved["current_floor"]))
+
+    def _arrive(self, payload, now):
+        car, completed, next_floor = payload
+        car.current_floor = next_floor
+        car.stops += 1
+        for user_request in completed:
+            user_request.completed_at = now
+        self._dispatch(car, now)
+
+    def _result(self, requests, elapsed):
+        result = super()._result(requests, elapsed)
+        result.endpoints = self.endpoints
+        return result
+
+    def run(self, hails):
+        dispatch = {
+            **getattr(settings, "ELEVATOR_DISPATCH", {}),
+            "STRATEGY": self.strategy.name,
+            "FLOOR_TRAVEL_SECONDS": self.floor_travel_seconds,
+            "STOP_SECONDS": self.stop_seconds,
+        }
+        # An idle car answers move_elevator with a 400, which is not news here.
+        request_logger = logging.getLogger("django.request")
+        level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        try:
+            # Simulated passengers with the same floors are different people,
+            # not repeated presses, so none of their hails are merged.
+            dedup = {**getattr(settings, "ELEVATOR_DEDUP", {}), "MERGE_WINDOW_SECONDS": 0}
+            with override_settings(ELEVATOR_DISPATCH=dispatch, ELEVATOR_DEDUP=dedup):
+                return self._run(hails)
+        finally:
+            request_logger.setLevel(level)
+
+    def _run(self, hails):
+        response = self._call(
+            "initialize_elevators",
+            "/elevators/initialize_elevators/",
+            {"number_of_elevators": len(self.cars)},
+        )
+        self.cars = [
+            SimElevator(elevator["elevator_id"]) for elevator in response.json()["elevators"]
+        ]
+        self._cars = {car.pk: car for car in self.cars}
+        self._open = {car.pk: {} for car in self.cars}
+        return super().run(hails)
+
+def random_traffic(count, floors, rate=0.15, seed=0):
+    """
+    `count` hails between random distinct floors, arriving as a Poisson
+    process of `rate` hails per second. Reproducible from `seed`.
+    """
+    rng = random.Random(seed)
+    at = 0.0
+    hails = []
+    for _ in range(count):
+        at += rng.expovariate(rate)
+        requested_floor, destination_floor = rng.sample(range(1, floors + 1), 2)
+        hails.append((at, requested_floor, destination_floor))
+    return hails
+
+
+# Share of hails going up from the lobby, down to the lobby and between
+# other floors in each named traffic pattern.
+TRAFFIC_PATTERNS = {
+    "up_peak": (0.85, 0.05, 0.10),
+    "down_peak": (0.05, 0.85, 0.10),
+    "lunch": (0.45, 0.45, 0.10),
+    "random": (0.0, 0.0, 1.0),
+}
+
+
+def traffic(pattern, count, floors, rate=0.15, seed=0):
+    """
+    `count` hails following a named pattern from TRAFFIC_PATTERNS (morning
+    up-peak, evening down-peak, two-way lunch traffic or uniform inter-floor
+    traffic), arriving as a Poisson process. Reproducible from `seed`.
+    """
+    if pattern not in TRAFFIC_PATTERNS:
+        raise ValueError(f"Unknown traffic pattern: {pattern!r}")
+    if pattern == "random":
+        return random_traffic(count, floors, rate=rate, seed=seed)
+    incoming, outgoing, _ = TRAFFIC_PATTERNS[pattern]
+    rng = random.Random(seed)
+    at = 0.0
+    hails = []
+    for _ in range(count):
+        at += rng.expovariate(rate)
+        roll = rng.random()
+        if roll < incoming:
+            hails.append((at, LOBBY, rng.randint(LOBBY + 1, floors)))
+        elif roll < incoming + outgoing:
+            hails.append((at, rng.randint(LOBBY + 1, floors), LOBBY))
+        else:
+            hails.append((at, *rng.sample(range(LOBBY + 1, floors + 1), 2)))
+    return hails
@@ -0,0 +1,519 @@
+"""
+In-process elevator state store with write-behind persistence.
+
+When ELEVATOR_STATE_STORE["ENABLED"] is set, the endpoints read and mutate
+per-elevator `ElevatorState` objects held in memory instead of reloading the
+`Elevator` row and its `UserRequest` queue on every call. Mutations are
+appended to a journal file before they are applied, and a background thread
+flushes the batched changes to the database every FLUSH_INTERVAL seconds in
+one transaction, truncating the journal once the commit succeeds. A process
+that starts with a non-empty journal (i.e. after a crash) replays it into the
+database from `AppConfig.ready()`, before serving anything, so no
+acknowledged change is lost. A running store holds a lock on the journal,
+so other processes (management commands, say) leave it alone.
+
+The store is authoritative for the process that owns it, so it should only
+be enabled when a single process serves the elevator endpoints. A second
+process starting a store on the same journal raises ImproperlyConfigured
+instead of flushing its own copy of the cars over the first one's, so
+anything that moves cars while the store is on, the ticker included, must
+run in the serving process: with TICK_INTERVAL set, the first `get_store`
+call starts a ticker thread next to the flush thread.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import deque
+from itertools import count
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F
+
+from Elevator_app.cache import get_cache
+from Elevator_app.models import QUEUE_ORDERING, Elevator, UserRequest
+
+logger = logging.getLogger(__name__)
+
+STATE_FIELDS = ("current_floor", "direction", "is_door_open", "in_maintenance")
+
+
+def store_setting(name, default):
+    return getattr(settings, "ELEVATOR_STATE_STORE", {}).get(name, default)
+
+
+class PendingRequest:
+    __slots__ = ("pk", "requested_floor", "destination_floor", "created_at", "queue_position")
+
+    def __init__(self, pk, requested_floor, destination_floor, created_at, queue_position=0):
+        self.pk = pk
+        self.requested_floor = requested_floor
+        self.destination_floor = destination_floor
+        self.created_at = created_at
+        self.queue_position = queue_position
+
+
+class ElevatorState:
+    """
+    Current state of one car. Exposes the same attributes as `Elevator` so the
+    dispatch strategies and view logic work on either.
+    """
+
+    __slots__ = (
+        "pk",
+        "current_floor",
+        "direction",
+        "is_door_open",
+        "in_maintenance",
+        "building_id",
+        "bank_id",
+        "lowest_floor",
+        "highest_floor",
+        "capacity",
+        "version",
+        "pending",
+    )
+
+    def __init__(
+        self,
+        pk,
+        current_floor,
+        direction,
+        is_door_open,
+        in_maintenance,
+        building_id=None,
+        bank_id=None,
+        lowest_floor=None,
+        highest_floor=None,
+        capacity=10,
+        version=0,
+    ):
+        self.pk = pk
+        self.current_floor = current_floor
+        self.direction = direction
+        self.is_door_open = is_door_open
+        self.in_maintenance = in_maintenance
+        self.building_id = building_id
+        self.bank_id = bank_id
+        # Floor range of the car's bank; None for cars in the default pool.
+        self.lowest_floor = lowest_floor
+        self.highest_floor = highest_floor
+        self.capacity = capacity
+        # Changes whenever anything the read endpoints answer about the car
+        # may have changed; see `StateStore.version`.
+        self.version = version
+        self.pending = deque()
+
+    @property
+    def pending_destination(self):
+        return self.pending[0].destination_floor if self.pending else None
+
+    @property
+    def pending_count(self):
+        return len(self.pending)
+
+    @property
+    def queue_tail(self):
+        return self.pending[-1].queue_position if self.pending else 0
+
+    def queue(self, lookahead=None):
+        if lookahead is None:
+            return list(self.pending)
+        return [self.pending[index] for index in range(min(lookahead, len(self.pending)))]
+
+
+class StateStore:
+    def __init__(self, journal_path, flush_interval=1.0, fsync=True):
+        self.journal_path = str(journal_path)
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._states = {}
+        self._dirty = set()
+        self._completed = set()
+        self._lock = threading.RLock()
+        self._journal = None
+        self._banks = {}
+        # bank -> {strategy key: index}; buildings may use different strategies.
+        self._indexes = {}
+        self._stopped = threading.Event()
+        self._thread = None
+        self._claim = None
+        # State versions are drawn from one counter, so a car reloaded from
+        # the database never reuses a version; the epoch tells this store's
+        # versions apart from those of earlier processes.
+        self._versions = count(1)
+        self.epoch = uuid.uuid4().hex[:8]
+
+    @property
+    def lock(self):
+        """
+        Held while reading and mutating a state so read-modify-write
+        sequences from concurrent requests do not interleave.
+        """
+        return self._lock
+
+    def get(self, pk):
+        try:
+            return self._states.get(int(pk))
+        except (TypeError, ValueError):
+            return None
+
+    def all(self):
+        return list(self._states.values())
+
+    def version(self, pk):
+        """
+        Version tag of car `pk`'s state, or None if there is no such car.
+        """
+        state = self.get(pk)
+        return None if state is None else f"{self.epoch}.{state.version}"
+
+    def banks(self, building=None, floors=()):
+        """
+        Banks of `building` serving every floor in `floors`; the default pool
+        (bank None) when no building is given.
+        """
+        if building is None:
+            return [None]
+        return [
+            bank
+            for bank, (bank_building, lowest, highest) in self._banks.items()
+            if bank_building == building
+            and all(lowest <= floor <= highest for floor in floors)
+        ]
+
+    def index(self, strategy, bank=None):
+        """
+        Returns `strategy`'s index over the cars of `bank` (see
+        `DispatchStrategy.index`), built on first use and kept current as the
+        store changes them, or None if the strategy has none.
+        """
+        key = (strategy.name, tuple(vars(strategy).items()))
+        with self._lock:
+            indexes = self._indexes.setdefault(bank, {})
+            if key not in indexes:
+                indexes[key] = strategy.index(
+                    [state for state in self._states.values() if state.bank_id == bank]
+                )
+            return indexes[key]
+
+    def _reindex(self, state):
+        for index in self._indexes.get(state.bank_id, {}).values():
+            if index is not None:
+                index.update(state)
+
+    def load(self):
+        """
+        Rebuilds every state from the database: one query for the cars and one
+        for all pending requests.
+        """
+        with self._lock:
+            states = {
+                elevator.pk: self._state(elevator)
+                for elevator in Elevator.objects.select_related("bank")
+            }
+            pending = UserRequest.objects.filter(is_complete=False).order_by(*QUEUE_ORDERING)
+            for user_request in pending:
+                state = states.get(user_request.elevator_id)
+                if state is not None:
+                    state.pending.append(self._pending(user_request))
+            self._states = states
+            self._banks = {}
+            for state in states.values():
+                self._add_bank(state)
+            self._indexes = {}
+            self._dirty.clear()
+            self._completed.clear()
+
+    def refresh(self, pk):
+        """
+        Reloads one car after it was changed outside the store, or drops it if
+        it no longer exists.
+        """
+        with self._lock:
+            previous = self._states.pop(pk, None)
+            self._dirty.discard(pk)
+            if previous is not None:
+                for index in self._indexes.get(previous.bank_id, {}).values():
+                    if index is not None:
+                        index.remove(pk)
+            elevator = Elevator.objects.select_related("bank").filter(pk=pk).first()
+            if elevator is None:
+                return
+            state = self._state(elevator)
+            for user_request in UserRequest.objects.filter(
+                elevator_id=pk, is_complete=False
+            ).order_by(*QUEUE_ORDERING):
+                state.pending.append(self._pending(user_request))
+            self._states[pk] = state
+            self._add_bank(state)
+            self._reindex(state)
+
+    def _state(self, elevator):
+        bank = elevator.bank
+        return ElevatorState(
+            elevator.pk,
+            elevator.current_floor,
+            elevator.direction,
+            elevator.is_door_open,
+            elevator.in_maintenance,
+            building_id=elevator.building_id,
+            bank_id=elevator.bank_id,
+            lowest_floor=bank.lowest_floor if bank else None,
+            highest_floor=bank.highest_floor if bank else None,
+            capacity=elevator.capacity,
+            version=next(self._versions),
+        )
+
+    def _add_bank(self, state):
+        if state.bank_id is not None:
+            self._banks[state.bank_id] = (
+                state.building_id,
+                state.lowest_floor,
+                state.highest_floor,
+            )
+
+    @staticmethod
+    def _pending(user_request):
+        return PendingRequest(
+            user_request.pk,
+            user_request.requested_floor,
+            user_request.destination_floor,
+            user_request.created_at,
+            user_request.queue_position,
+        )
+
+    def add_request(self, state, user_request):
+        """
+        Queues a request that has already been inserted into the database.
+        """
+        with self._lock:
+            state.pending.append(self._pending(user_request))
+            state.version = next(self._versions)
+            self._reindex(state)
+
+    def commit(self, state, completed=()):
+        """
+        Records a mutation of `state` (and the requests it completed): the
+        journal entry is written first, then the change is queued for the
+        next flush.
+        """
+        with self._lock:
+            completed_pks = [user_request.pk for user_request in completed]
+            self._write_journal(
+                {
+                    "elevator": state.pk,
+                    **{field: getattr(state, field) for field in STATE_FIELDS},
+                    "completed": completed_pks,
+                }
+            )
+            for user_request in completed:
+                try:
+                    state.pending.remove(user_request)
+                except ValueError:
+                    pass
+            state.version = next(self._versions)
+            self._dirty.add(state.pk)
+            self._completed.update(completed_pks)
+            self._reindex(state)
+
+    def _write_journal(self, entry):
+        if self._journal is None:
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._journal.write(json.dumps(entry) + "\n")
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+    def claim_journal(self):
+        """
+        Takes the journal's lock for the life of this store. False if another
+        process's store holds it.
+        """
+        if self._claim is not None or fcntl is None:
+            return True
+        claim = open(f"{self.journal_path}.lock", "a")
+        try:
+            fcntl.flock(claim, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            claim.close()
+            return False
+        self._claim = claim
+        return True
+
+    def release_journal(self):
+        if self._claim is not None:
+            self._claim.close()
+            self._claim = None
+
+    def _truncate_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        open(self.journal_path, "w", encoding="utf-8").close()
+
+    @staticmethod
+    def _persist(states, completed):
+        with transaction.atomic():
+            if states:
+                Elevator.objects.bulk_update(
+                    [Elevator(pk=pk, **values) for pk, values in states.items()],
+                    STATE_FIELDS,
+                )
+                Elevator.objects.filter(pk__in=states).update(version=F("version") + 1)
+            if completed:
+                UserRequest.objects.filter(pk__in=completed).update(is_complete=True)
+
+    def flush(self):
+        """
+        Writes every pending change in one transaction and clears the journal.
+        Returns the number of elevators written.
+        """
+        with self._lock:
+            if not self._dirty and not self._completed:
+                return 0
+            states = {
+                pk: {field: getattr(self._states[pk], field) for field in STATE_FIELDS}
+                for pk in self._dirty
+                if pk in self._states
+            }
+            self._persist(states, self._completed)
+            # Request lists and car details are read from the database, which
+            # only changes here.
+            get_cache().invalidate(*[self._states[pk] for pk in states])
+            for pk in states:
+                self._states[pk].version = next(self._versions)
+            self._dirty.clear()
+            self._completed.clear()
+            self._truncate_journal()
+            return len(states)
+
+    def recover(self):
+        """
+        Replays a journal left behind by a previous process into the database.
+        Entries hold absolute values, so replaying twice is harmless; a torn
+        last line from a crash mid-write is skipped. A journal claimed by a
+        running store is not a leftover and is left alone.
+        """
+        if not os.path.exists(self.journal_path) or not self.claim_journal():
+            return 0
+        states = {}
+        completed = set()
+        with open(self.journal_path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logger.warning("Skipping unreadable state journal entry.")
+                    continue
+                states[entry["elevator"]] = {field: entry[field] for field in STATE_FIELDS}
+                completed.update(entry["completed"])
+        with self._lock:
+            self._persist(states, completed)
+            self._truncate_journal()
+        return len(states)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if not self.claim_journal():
+            raise ImproperlyConfigured(
+                f"Another process is running a state store on {self.journal_path}; "
+                "the store is only safe with a single serving process."
+            )
+        self._thread = threading.Thread(
+            target=self._run, name="elevator-state-flush", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stopped.set()
+        self.flush()
+        self.release_journal()
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                # The journal still holds the batch; it is retried next tick.
+                logger.exception("Elevator state flush failed.")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def new_store():
+    return StateStore(
+        store_setting("JOURNAL", "elevator_state.journal"),
+        flush_interval=store_setting("FLUSH_INTERVAL", 1.0),
+        fsync=store_setting("FSYNC", True),
+    )
+
+
+def recover_journal():
+    """
+    Replays a journal left behind by a crashed process into the database,
+    unless the store is disabled or a running store owns the journal.
+    Called from `AppConfig.ready()`. Returns the number of cars recovered.
+    """
+    if not store_setting("ENABLED", False):
+        return 0
+    store = new_store()
+    try:
+        return store.recover()
+    finally:
+        store.release_journal()
+
+
+def get_store():
+    """
+    Returns the process-wide store, or None when it is disabled. The first
+    call loads the state and starts flushing; it raises ImproperlyConfigured
+    if another process already runs a store on the journal.
+    """
+    global _store
+    if not store_setting("ENABLED", False):
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = new_store()
+                # Claims the journal. Anything left to replay was written
+                # since ready() or could not be replayed then.
+                store.recover()
+                store.load()
+                store.start()
+                _store = store
+                interval = store_setting("TICK_INTERVAL", None)
+                if interval:
+                    # Imported here: the ticker reaches the store through
+                    # this module.
+                    from Elevator_app.ticker import start_ticker
+
+                    start_ticker(interval)
+    return _store
+
+
+async def aget_store():
+    """
+    `get_store` for async code. Only the first call, which loads the store,
+    leaves the event loop.
+    """
+    if not store_setting("ENABLED", False):
+        return None
+    if _store is not None:
+        return _store
+    return await sync_to_async(get_store)()
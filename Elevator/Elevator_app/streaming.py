@@ -0,0 +1,339 @@
+"""
+Real-time elevator state over WebSockets.
+
+Clients connect to `ws/buildings/<id>/elevators/` on the ASGI application
+(or `ws/elevators/` for the default pool of cars outside any building) and
+first receive a snapshot of every car there, then a frame whenever a car's
+floor, direction, door or maintenance state changes or it is assigned a
+hail. Each frame is a JSON array of events.
+
+Subscribers are grouped per building and only receive that building's
+events, and each event is serialized once per publish, not once per
+subscriber. A slow consumer never makes the publisher wait or buffer without
+bound: undelivered state events are coalesced per elevator, so the consumer
+receives the latest state of every car once it catches up. Assignments are
+not coalesced, since each one is a different passenger; they wait in a
+buffer of MAX_PENDING_ASSIGNMENTS per subscriber, and a consumer that lets
+it overflow is disconnected (close code 1013) rather than sent a stream
+with gaps.
+
+Views run in worker threads, so `publish` hands events to the event loop with
+`call_soon_threadsafe`. With ELEVATOR_STREAMING["REDIS_URL"] set, events are
+published on a Redis channel instead, and every ASGI process relays that
+channel to its own subscribers, so moves made by another process (the
+`run_elevators` ticker, other workers) reach every client. Without it, events
+only reach subscribers connected to the publishing process.
+"""
+import asyncio
+import json
+import logging
+import re
+import time
+from collections import deque
+
+import redis
+import redis.asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from Elevator_app.models import Elevator
+from Elevator_app.state import get_store
+
+logger = logging.getLogger(__name__)
+
+STREAM_PATH = "/ws/elevators/"
+BUILDING_STREAM_PATH = re.compile(r"^/ws/buildings/(?P<building>[0-9]+)/elevators/$")
+DEFAULT_BUILDING = None
+# Sent to a consumer whose assignment buffer overflowed ("try again later").
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+def streaming_setting(name, default):
+    return getattr(settings, "ELEVATOR_STREAMING", {}).get(name, default)
+
+
+def state_event(elevator):
+    return {
+        "type": "state",
+        "elevator_id": elevator.pk,
+        "current_floor": elevator.current_floor,
+        "direction": elevator.direction,
+        "is_door_open": elevator.is_door_open,
+        "in_maintenance": elevator.in_maintenance,
+    }
+
+
+def assignment_event(elevator_id, requested_floor, destination_floor):
+    return {
+        "type": "assignment",
+        "elevator_id": elevator_id,
+        "requested_floor": requested_floor,
+        "destination_floor": destination_floor,
+    }
+
+
+class Subscriber:
+    __slots__ = ("states", "assignments", "max_assignments", "overflowed", "ready")
+
+    def __init__(self, max_assignments=1000):
+        self.states = {}
+        self.assignments = deque()
+        self.max_assignments = max_assignments
+        self.overflowed = False
+        self.ready = asyncio.Event()
+
+    @property
+    def pending(self):
+        return len(self.states) + len(self.assignments)
+
+    def offer(self, key, payload):
+        if self.overflowed:
+            return
+        if key[0] == "state":
+            # Replacing an undelivered state is the backpressure: memory per
+            # subscriber is bounded by the number of cars.
+            self.states.pop(key, None)
+            self.states[key] = payload
+        elif len(self.assignments) < self.max_assignments:
+            self.assignments.append(payload)
+        else:
+            self.overflowed = True
+            self.states.clear()
+            self.assignments.clear()
+        self.ready.set()
+
+    async def next_frame(self):
+        """
+        The undelivered events as one frame, or None once the subscriber has
+        fallen too far behind to be sent every assignment.
+        """
+        await self.ready.wait()
+        self.ready.clear()
+        if self.overflowed:
+            return None
+        payloads = [*self.assignments, *self.states.values()]
+        self.assignments.clear()
+        self.states.clear()
+        return "[" + ",".join(payloads) + "]"
+
+
+class RedisRelay:
+    """
+    Carries published events between processes over a Redis pub/sub channel.
+    """
+
+    def __init__(self, url, channel, socket_timeout=0.1, retry_after=30):
+        self.url = url
+        self.channel = channel
+        self.socket_timeout = socket_timeout
+        self.retry_after = retry_after
+        self._client = None
+        self._down_until = 0.0
+
+    def send(self, message):
+        """
+        Publishes `message`. Returns False if Redis is unreachable, and for
+        RETRY_AFTER seconds after that without trying.
+        """
+        if time.monotonic() < self._down_until:
+            return False
+        if self._client is None:
+            self._client = redis.Redis.from_url(
+                self.url,
+                socket_connect_timeout=self.socket_timeout,
+                socket_timeout=self.socket_timeout,
+            )
+        try:
+            self._client.publish(self.channel, message)
+        except redis.RedisError:
+            logger.warning("Redis unavailable, live updates reach this process only.")
+            self._down_until = time.monotonic() + self.retry_after
+            return False
+        return True
+
+    async def messages(self):
+        """
+        Yields every message published on the channel, reconnecting while
+        Redis is unreachable.
+        """
+        while True:
+            # No read timeout: the channel can be quiet for any length of time.
+            client = redis.asyncio.Redis.from_url(
+                self.url, socket_connect_timeout=self.socket_timeout
+            )
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    yield message["data"]
+            except redis.RedisError:
+                logger.warning("Redis unavailable, live updates are not relayed.")
+                await asyncio.sleep(1.0)
+            finally:
+                await pubsub.aclose()
+                await client.aclose()
+
+
+def stream_relay():
+    url = streaming_setting("REDIS_URL", None)
+    if not url:
+        return None
+    return RedisRelay(
+        url,
+        streaming_setting("CHANNEL", "elevator:events"),
+        socket_timeout=streaming_setting("SOCKET_TIMEOUT", 0.1),
+        retry_after=streaming_setting("RETRY_AFTER", 30),
+    )
+
+
+class Broadcaster:
+    def __init__(self, relay=None):
+        self.loop = None
+        self.groups = {}
+        self.relay = relay
+        self._relaying = None
+
+    def subscribe(self, building=DEFAULT_BUILDING):
+        self.loop = asyncio.get_running_loop()
+        if self.relay is not None and (self._relaying is None or self._relaying.done()):
+            self._relaying = asyncio.ensure_future(self._relay())
+        subscriber = Subscriber(streaming_setting("MAX_PENDING_ASSIGNMENTS", 1000))
+        self.groups.setdefault(building, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber, building=DEFAULT_BUILDING):
+        group = self.groups.get(building)
+        if group is not None:
+            group.discard(subscriber)
+            if not group:
+                del self.groups[building]
+
+    @property
+    def subscriber_count(self):
+        return sum(len(group) for group in self.groups.values())
+
+    def publish(self, events, building=DEFAULT_BUILDING):
+        """
+        Sends events to the subscribers of `building`, in every process when
+        there is a relay. Safe to call from any thread; without a relay, a
+        no-op when nobody is subscribed in this process.
+        """
+        message = {"building": building, "events": events}
+        if self.relay is not None and self.relay.send(json.dumps(message)):
+            return
+        self._deliver(events, building)
+
+    async def _relay(self):
+        async for message in self.relay.messages():
+            message = json.loads(message)
+            self._deliver(message["events"], message["building"])
+
+    def _deliver(self, events, building):
+        loop = self.loop
+        if loop is None or loop.is_closed() or building not in self.groups:
+            return
+        encoded = [
+            ((event["type"], event["elevator_id"]), json.dumps(event)) for event in events
+        ]
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._fan_out(building, encoded)
+        else:
+            loop.call_soon_threadsafe(self._fan_out, building, encoded)
+
+    def _fan_out(self, building, encoded):
+        for subscriber in self.groups.get(building, ()):
+            for key, payload in encoded:
+                subscriber.offer(key, payload)
+
+
+broadcaster = Broadcaster(stream_relay())
+
+
+def publish_state(*elevators):
+    by_building = {}
+    for elevator in elevators:
+        by_building.setdefault(elevator.building_id, []).append(state_event(elevator))
+    for building, events in by_building.items():
+        broadcaster.publish(events, building=building)
+
+
+def publish_assignments(assignments, building=DEFAULT_BUILDING):
+    """
+    `assignments` is a list of (elevator_id, requested_floor, destination_floor)
+    for cars of `building`.
+    """
+    if assignments:
+        broadcaster.publish(
+            [assignment_event(*assignment) for assignment in assignments], building=building
+        )
+
+
+@sync_to_async
+def snapshot(building=DEFAULT_BUILDING):
+    # With the state store the database lags by up to a flush interval, and
+    # the events of moves made in between were published before this
+    # subscriber joined.
+    store = get_store()
+    if store is not None:
+        with store.lock:
+            events = [
+                state_event(state)
+                for state in sorted(store.all(), key=lambda state: state.pk)
+                if state.building_id == building
+            ]
+    else:
+        events = [
+            state_event(elevator)
+            for elevator in Elevator.objects.filter(building=building).order_by("pk")
+        ]
+    return "[" + ",".join(json.dumps(event) for event in events) + "]"
+
+
+def stream_building(path):
+    """
+    Returns the building a stream path subscribes to, or False for an
+    unknown path.
+    """
+    if path == STREAM_PATH:
+        return DEFAULT_BUILDING
+    match = BUILDING_STREAM_PATH.match(path)
+    return int(match["building"]) if match else False
+
+
+async def websocket_application(scope, receive, send):
+    """
+    ASGI application for WebSocket connections.
+    """
+    message = await receive()
+    if message["type"] != "websocket.connect":
+        return
+    building = stream_building(scope["path"])
+    if building is False:
+        await send({"type": "websocket.close", "code": 4404})
+        return
+    await send({"type": "websocket.accept"})
+    subscriber = broadcaster.subscribe(building)
+    await send({"type": "websocket.send", "text": await snapshot(building)})
+
+    async def pump():
+        while True:
+            frame = await subscriber.next_frame()
+            if frame is None:
+                broadcaster.unsubscribe(subscriber, building)
+                await send({"type": "websocket.close", "code": SLOW_CONSUMER_CLOSE_CODE})
+                return
+            await send({"type": "websocket.send", "text": frame})
+
+    sender = asyncio.ensure_future(pump())
+    try:
+        while True:
+            message = await receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    finally:
+        broadcaster.unsubscribe(subscriber, building)
+        sender.cancel()
@@ -1,3 +1,2129 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import json
+import os
+import random
+import tempfile
+from io import StringIO
+from unittest import mock, skipIf
+from urllib.request import urlopen
 
-# Create your tests here.
+import redis
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.apps import apps
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.test import (
+    AsyncRequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from Elevator.asgi import AsyncReadsHandler
+from Elevator_app.archive import archive_completed
+from Elevator_app.cache import AsyncElevatorCache, ElevatorCache
+from Elevator_app import dedup, forecast, metrics
+from Elevator_app.events import read_events, replay, write_snapshot
+from Elevator_app.forecast import DAY_SECONDS, DemandForecaster, ParkingPolicy, parking_floors
+from Elevator_app.dispatch import (
+    UP,
+    ETAStrategy,
+    LookStrategy,
+    get_strategy,
+    passenger_group,
+    plan_sweep,
+)
+from Elevator_app.renderers import FastJSONRenderer
+from Elevator_app.models import (
+    ArchivedUserRequest,
+    Bank,
+    Building,
+    DailyElevatorTrips,
+    DailyFloorPairTrips,
+    Elevator,
+    UserRequest,
+)
+from Elevator_app.simulation import (
+    ApiSimulator,
+    SimElevator,
+    SimRequest,
+    Simulator,
+    nearest_rank,
+    random_traffic,
+    traffic,
+)
+from Elevator_app.state import StateStore
+from Elevator_app.streaming import (
+    Broadcaster,
+    RedisRelay,
+    Subscriber,
+    publish_assignments,
+    publish_state,
+    state_event,
+    websocket_application,
+)
+from Elevator_app.ticker import TickResult, start_ticker, tick
+from Elevator_app.whatif import Histogram, ReplaySimulator, compare, export_hails, read_hails
+from Elevator_app.views import ElevatorViewSet
+
+
+class SaveUserRequestTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def hail(self, requested_floor, destination_floor):
+        return self.client.post(
+            "/elevators/save_user_request/",
+            {"requested_floor": requested_floor, "destination_floor": destination_floor},
+            format="json",
+        )
+
+    def test_assigns_nearest_elevator(self):
+        near = Elevator.objects.create(current_floor=5)
+        Elevator.objects.create(current_floor=1)
+        response = self.hail(6, 2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["elevator_id"], near.pk)
+
+    def test_scores_busy_elevator_from_oldest_pending_destination(self):
+        busy = Elevator.objects.create(current_floor=1)
+        idle = Elevator.objects.create(current_floor=4)
+        UserRequest.objects.create(elevator=busy, requested_floor=1, destination_floor=9)
+        response = self.hail(10, 1)
+        self.assertEqual(response.json()["elevator_id"], busy.pk)
+        response = self.hail(3, 1)
+        self.assertEqual(response.json()["elevator_id"], idle.pk)
+
+    def test_query_count_is_flat_in_elevator_count(self):
+        for count in (1, 8, 64):
+            Elevator.objects.all().delete()
+            elevators = Elevator.objects.bulk_create(
+                Elevator(current_floor=floor % 10 + 1) for floor in range(count)
+            )
+            for elevator in elevators:
+                UserRequest.objects.create(
+                    elevator=elevator, requested_floor=1, destination_floor=2
+                )
+            # The previous round's hail is not a duplicate to check.
+            dedup.memory.clear()
+            # Savepoint pair around one annotated fetch of the candidates,
+            # the version claim and the insert.
+            with self.assertNumQueries(5):
+                self.assertEqual(self.hail(3, 7).status_code, 201)
+
+
+class DedupTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.elevator = Elevator.objects.create()
+        dedup.memory.clear()
+
+    def hail(self, requested_floor=2, destination_floor=6, **headers):
+        return self.client.post(
+            "/elevators/save_user_request/",
+            {"requested_floor": requested_floor, "destination_floor": destination_floor},
+            format="json",
+            **headers,
+        )
+
+    def test_retried_key_returns_the_saved_request_without_queries(self):
+        first = self.hail(HTTP_IDEMPOTENCY_KEY="hail-1")
+        self.assertEqual(first.status_code, 201)
+        with self.assertNumQueries(0):
+            retry = self.hail(3, 9, HTTP_IDEMPOTENCY_KEY="hail-1")
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json()["request_id"], first.json()["request_id"])
+        self.assertEqual(UserRequest.objects.count(), 1)
+
+    def test_batch_hails_merge_into_saved_hails_and_are_remembered(self):
+        first = self.hail().json()
+        response = self.client.post(
+            "/elevators/batch_hail/",
+            {
+                "requests": [
+                    {"requested_floor": 2, "destination_floor": 6},
+                    {"requested_floor": 4, "destination_floor": 1},
+                ]
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        merged, saved = response.json()["results"]
+        self.assertEqual(
+            merged,
+            {
+                "index": 0,
+                "elevator_id": first["elevator_id"],
+                "request_id": first["request_id"],
+                "duplicate": True,
+            },
+        )
+        retry = self.hail(4, 1)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json()["request_id"], saved["request_id"])
+        self.assertEqual(UserRequest.objects.count(), 2)
+
+    def test_key_not_remembered_here_is_caught_by_the_constraint(self):
+        saved = UserRequest.objects.create(
+            elevator=self.elevator, requested_floor=2, destination_floor=6, idempotency_key="hail-1"
+        )
+        response = self.hail(HTTP_IDEMPOTENCY_KEY="hail-1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["request_id"], saved.pk)
+        self.assertEqual(UserRequest.objects.count(), 1)
+        self.assertEqual(self.hail(HTTP_IDEMPOTENCY_KEY="x" * 101).status_code, 400)
+
+    def test_identical_pending_hails_are_merged(self):
+        first = self.hail()
+        # Checking that the request is still pending is the only query.
+        with self.assertNumQueries(1):
+            repeat = self.hail()
+        self.assertEqual(repeat.status_code, 200)
+        self.assertEqual(repeat.json()["request_id"], first.json()["request_id"])
+        self.assertEqual(self.hail(2, 7).status_code, 201)
+
+        UserRequest.objects.filter(pk=first.json()["request_id"]).update(is_complete=True)
+        self.assertEqual(self.hail().status_code, 201)
+
+    @override_settings(ELEVATOR_DEDUP={"MERGE_WINDOW_SECONDS": 0})
+    def test_merging_can_be_disabled(self):
+        self.assertEqual(self.hail().status_code, 201)
+        self.assertEqual(self.hail().status_code, 201)
+
+    @override_settings(ELEVATOR_DEDUP={})
+    def test_merging_is_off_unless_configured(self):
+        self.assertEqual(self.hail().status_code, 201)
+        self.assertEqual(self.hail().status_code, 201)
+
+
+class QueuePositionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.elevator = Elevator.objects.create()
+
+    def test_hails_are_numbered_after_the_queue_tail(self):
+        UserRequest.objects.create(
+            elevator=self.elevator, requested_floor=1, destination_floor=2, queue_position=4
+        )
+        self.client.post(
+            "/elevators/save_user_request/",
+            {"requested_floor": 3, "destination_floor": 4},
+            format="json",
+        )
+        self.client.post(
+            "/elevators/batch_hail/",
+            {"requests": [{"requested_floor": 5, "destination_floor": 6}] * 2},
+            format="json",
+        )
+        positions = UserRequest.objects.order_by("pk").values_list("queue_position", flat=True)
+        self.assertEqual(list(positions), [4, 5, 6, 7])
+
+    def test_next_stop_follows_queue_position(self):
+        UserRequest.objects.create(
+            elevator=self.elevator, requested_floor=9, destination_floor=2, queue_position=2
+        )
+        UserRequest.objects.create(
+            elevator=self.elevator, requested_floor=4, destination_floor=2, queue_position=1
+        )
+        response = self.client.get(f"/elevators/{self.elevator.pk}/get_next_floor/")
+        self.assertEqual(response.json()["next_floor"], 4)
+
+
+class TickerTests(TestCase):
+    def setUp(self):
+        self.first = Elevator.objects.create(current_floor=1)
+        self.second = Elevator.objects.create(current_floor=6)
+        self.parked = Elevator.objects.create(current_floor=2, in_maintenance=True)
+        for elevator in (self.first, self.second, self.parked):
+            UserRequest.objects.create(elevator=elevator, requested_floor=3, destination_floor=8)
+
+    def test_tick_moves_every_available_elevator_with_a_constant_query_count(self):
+        tick()
+        # Savepoint pair, cars, pending queues, one bulk car update and one
+        # request update.
+        with self.assertNumQueries(6):
+            result = tick()
+        self.assertEqual((result.moved, result.completed), (2, 2))
+        self.first.refresh_from_db()
+        self.parked.refresh_from_db()
+        self.assertEqual(self.first.current_floor, 8)
+        self.assertEqual(self.parked.current_floor, 2)
+        self.assertEqual(UserRequest.objects.filter(is_complete=False).count(), 1)
+
+    def test_run_elevators_reports_tick_metrics(self):
+        out = StringIO()
+        ticks = metrics.tick_duration.count()
+        moves = metrics.tick_steps.value("moved")
+        call_command("run_elevators", interval=0, ticks=3, report_every=0, stdout=out)
+        self.assertIn("ticks=3", out.getvalue())
+        self.assertEqual(metrics.tick_duration.count(), ticks + 3)
+        self.assertEqual(metrics.tick_steps.value("moved"), moves + 4)
+        self.assertIn("elevator_tick_duration_seconds_count", APIClient().get("/metrics").content.decode())
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.current_floor, 8)
+
+
+    @override_settings(ELEVATOR_STATE_STORE={"ENABLED": True})
+    def test_run_elevators_refuses_to_run_beside_the_state_store(self):
+        with self.assertRaises(CommandError):
+            call_command("run_elevators", interval=0, ticks=1, stdout=StringIO())
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.current_floor, 1)
+
+    def test_in_process_ticker_ticks_and_records_metrics(self):
+        ticks = metrics.tick_duration.count()
+        # SystemExit ends the thread after its first tick.
+        with mock.patch("Elevator_app.ticker.tick", side_effect=[TickResult(2, 1, 0), SystemExit]):
+            start_ticker(0).join(timeout=5)
+        self.assertEqual(metrics.tick_duration.count(), ticks + 1)
+
+
+class ParkingTests(TestCase):
+    def test_forecaster_never_reads_hails_older_than_its_history(self):
+        elevator = Elevator.objects.create()
+        UserRequest.objects.create(elevator=elevator, requested_floor=1, destination_floor=5)
+        UserRequest.objects.update(created_at=timezone.now() - datetime.timedelta(days=60))
+        forecaster = DemandForecaster()
+        self.assertEqual(forecaster.catch_up(history_days=28), 0)
+        self.assertEqual(forecaster.catch_up(history_days=28), 0)
+        UserRequest.objects.create(elevator=elevator, requested_floor=3, destination_floor=5)
+        self.assertEqual(forecaster.catch_up(history_days=28), 1)
+
+    def test_forecaster_decays_each_day_of_history(self):
+        forecaster = DemandForecaster(slot_seconds=900, decay=0.5)
+        morning = 8 * 3600
+        forecaster.observe(None, 1, morning)
+        forecaster.observe(None, 1, morning + 60)
+        forecaster.observe(None, 1, DAY_SECONDS + morning)
+        forecaster.observe(None, 4, DAY_SECONDS + morning + 900)
+        # A late hail from the day before weighs half.
+        forecaster.observe(None, 1, morning + 120)
+        self.assertEqual(forecaster.demand(None, DAY_SECONDS + morning + 300), {1: 2.5})
+        self.assertEqual(forecaster.demand(None, 2 * DAY_SECONDS + morning), {1: 1.25})
+        self.assertEqual(forecaster.demand(7, morning), {})
+
+    def test_parking_floors_follow_the_share_of_demand(self):
+        self.assertEqual(sorted(parking_floors({1: 8.0, 5: 2.0, 9: 0.0}, 5)), [1, 1, 1, 1, 5])
+        self.assertEqual(parking_floors({}, 3), [])
+
+    def test_plan_pairs_cars_with_floors_in_order(self):
+        forecaster = DemandForecaster()
+        for floor in (1, 1, 12, 12):
+            forecaster.observe(None, floor, 100)
+        cars = [SimElevator(1, current_floor=15), SimElevator(2, current_floor=3)]
+
+        def plan(min_demand=2, **floors):
+            policy = ParkingPolicy(forecaster, min_demand=min_demand)
+            return [(car.pk, floor) for car, floor in policy.plan(cars, None, 200, **floors)]
+
+        self.assertEqual(plan(), [(2, 1), (1, 12)])
+        # Only floors the bank serves count, and too little demand moves nothing.
+        self.assertEqual(plan(lowest_floor=10), [(2, 12), (1, 12)])
+        self.assertEqual(plan(highest_floor=10), [(2, 1), (1, 1)])
+        self.assertEqual(plan(min_demand=5), [])
+
+    def test_tick_parks_idle_cars_where_hails_are_expected(self):
+        busy = Elevator.objects.create(current_floor=5)
+        idle = Elevator.objects.create(current_floor=9)
+        maintained = Elevator.objects.create(current_floor=7, in_maintenance=True)
+        for _ in range(3):
+            UserRequest.objects.create(
+                elevator=busy, requested_floor=1, destination_floor=6, is_complete=True
+            )
+        UserRequest.objects.create(elevator=busy, requested_floor=5, destination_floor=8)
+        now = timezone.now()
+        with override_settings(ELEVATOR_PARKING={"ENABLED": True}), mock.patch.object(
+            forecast, "_policy", None
+        ):
+            result = tick(now=now)
+            policy = forecast.get_parking_policy()
+            self.assertEqual(policy.forecaster.last_pk, UserRequest.objects.latest("pk").pk)
+            UserRequest.objects.create(elevator=busy, requested_floor=3, destination_floor=1)
+            tick(now=now)
+            self.assertIn(3, policy.forecaster.demand(None, now.timestamp()))
+        self.assertEqual((result.moved, result.parked), (1, 1))
+        idle.refresh_from_db()
+        maintained.refresh_from_db()
+        self.assertEqual((idle.current_floor, idle.version), (1, 1))
+        self.assertEqual(maintained.current_floor, 7)
+
+    def test_parking_shortens_up_peak_waits_in_simulation(self):
+        hails = traffic("up_peak", 400, 15, seed=3)
+        forecaster = DemandForecaster()
+        for at, requested_floor, _ in traffic("up_peak", 400, 15, seed=4):
+            forecaster.observe(None, requested_floor, at - DAY_SECONDS)
+        idle = Simulator(get_strategy("eta"), elevators=4).run(hails)
+        parked = Simulator(
+            get_strategy("eta"), elevators=4, parking=ParkingPolicy(forecaster)
+        ).run(hails)
+        self.assertEqual(parked.completed, len(hails))
+        self.assertLess(parked.avg_wait, idle.avg_wait)
+
+
+class ConcurrencyTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.elevator = Elevator.objects.create(current_floor=1)
+
+    def test_toggles_of_unknown_cars_are_not_found(self):
+        for action in ("door_status", "toggle_maintenance"):
+            self.assertEqual(self.client.post(f"/elevators/999/{action}/").status_code, 404)
+
+    def race(self, target, concurrent):
+        """
+        Patches `target` so that the first time it is called, `concurrent`
+        runs to completion in between the caller's read and its write.
+        """
+        original = mock.patch(target).get_original()[0]
+        calls = []
+
+        def interleaved(*args, **kwargs):
+            calls.append(args)
+            result = original(*args, **kwargs)
+            if len(calls) == 1:
+                concurrent()
+            return result
+
+        patcher = mock.patch(target, side_effect=interleaved)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return calls
+
+    def test_concurrent_moves_do_not_lose_updates_or_complete_twice(self):
+        first = UserRequest.objects.create(
+            elevator=self.elevator, requested_floor=1, destination_floor=4, queue_position=1
+        )
+        second = UserRequest.objects.create(
+            elevator=self.elevator, requested_floor=4, destination_floor=6, queue_position=2
+        )
+        url = f"/elevators/{self.elevator.pk}/move_elevator/"
+        calls = self.race(
+            "Elevator_app.views.pending_requests", lambda: self.client.post(url)
+        )
+        response = self.client.post(url)
+        self.assertEqual(response.json()["current_floor"], 6)
+        # The stale first attempt was retried on the state left by the other move.
+        self.assertEqual(len(calls), 3)
+        self.elevator.refresh_from_db()
+        self.assertEqual((self.elevator.current_floor, self.elevator.version), (6, 2))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertTrue(first.is_complete and second.is_complete)
+
+    def test_concurrent_hails_get_distinct_queue_positions(self):
+        def hail():
+            return self.client.post(
+                "/elevators/save_user_request/",
+                {"requested_floor": 3, "destination_floor": 7},
+                format="json",
+            )
+
+        self.race("Elevator_app.views.available_elevators", hail)
+        self.assertEqual(hail().status_code, 201)
+        positions = UserRequest.objects.order_by("pk").values_list("queue_position", flat=True)
+        self.assertEqual(list(positions), [1, 2])
+
+    def test_a_failed_claim_leaves_no_version_bumped(self):
+        other = Elevator.objects.create(current_floor=10)
+        original = mock.patch("Elevator_app.views.claim_elevators").get_original()[0]
+        calls = []
+
+        def claim(elevators):
+            calls.append(elevators)
+            if len(calls) == 1:
+                # Another writer moves the second car before the claim.
+                Elevator.objects.filter(pk=other.pk).update(version=F("version") + 1)
+            return original(elevators)
+
+        hails = [
+            {"requested_floor": 1, "destination_floor": 5},
+            {"requested_floor": 10, "destination_floor": 2},
+        ]
+        with mock.patch("Elevator_app.views.claim_elevators", side_effect=claim):
+            response = self.client.post("/elevators/batch_hail/", {"requests": hails}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(calls), 2)
+        self.elevator.refresh_from_db()
+        other.refresh_from_db()
+        # Claimed once by the retry, not also by the attempt that conflicted.
+        self.assertEqual((self.elevator.version, other.version), (1, 2))
+
+    def test_gives_up_with_conflict_after_repeated_collisions(self):
+        UserRequest.objects.create(elevator=self.elevator, requested_floor=1, destination_floor=4)
+        with mock.patch("Elevator_app.views.save_elevator", return_value=False) as save:
+            response = self.client.post(f"/elevators/{self.elevator.pk}/move_elevator/")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(save.call_count, 5)
+        self.assertFalse(UserRequest.objects.get().is_complete)
+
+    def test_stress_command_finds_no_lost_updates(self):
+        self.elevator.delete()
+        out = StringIO()
+        call_command("stress_elevators", threads=1, operations=40, stdout=out)
+        self.assertIn("lost updates: 0", out.getvalue())
+
+
+# The workers use connections of their own, so their writes must be committed.
+@skipIf(connection.vendor == "sqlite", "SQLite serializes writers and locks shared in-memory tables.")
+class ConcurrentStressTests(TransactionTestCase):
+    def test_concurrent_writers_lose_no_updates(self):
+        out = StringIO()
+        call_command("stress_elevators", threads=8, operations=25, stdout=out)
+        report = out.getvalue()
+        self.assertIn("lost updates: 0", report)
+        self.assertIn("errors: 0", report)
+        self.assertRegex(report, r"hails: [1-9]")
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.elevator = Elevator.objects.create()
+        self.old = timezone.now() - datetime.timedelta(days=30)
+
+    def trips(self, count, requested_floor=2, destination_floor=9, created_at=None, is_complete=True):
+        requests = UserRequest.objects.bulk_create(
+            UserRequest(
+                elevator=self.elevator,
+                requested_floor=requested_floor,
+                destination_floor=destination_floor,
+                is_complete=is_complete,
+            )
+            for _ in range(count)
+        )
+        UserRequest.objects.filter(pk__in=[request.pk for request in requests]).update(
+            created_at=created_at or self.old
+        )
+
+    def test_moves_old_completed_requests_and_counts_them(self):
+        self.trips(5)
+        self.trips(2, requested_floor=9, destination_floor=1)
+        self.trips(3, is_complete=False)
+        self.trips(4, created_at=timezone.now())
+        archived, batches = archive_completed(
+            timezone.now() - datetime.timedelta(days=7), batch_size=3
+        )
+        self.assertEqual((archived, batches), (7, 3))
+        self.assertEqual(UserRequest.objects.count(), 7)
+        self.assertEqual(ArchivedUserRequest.objects.count(), 7)
+        self.assertEqual(
+            list(DailyElevatorTrips.objects.values_list("day", "elevator_id", "trips")),
+            [(self.old.date(), self.elevator.pk, 7)],
+        )
+        self.assertEqual(
+            sorted(
+                DailyFloorPairTrips.objects.values_list(
+                    "requested_floor", "destination_floor", "trips"
+                )
+            ),
+            [(2, 9, 5), (9, 1, 2)],
+        )
+
+    def test_later_runs_add_to_the_aggregates_and_prune_the_archive(self):
+        self.trips(2)
+        call_command("archive_requests", stdout=StringIO())
+        self.trips(3)
+        out = StringIO()
+        call_command("archive_requests", "--retention-days", "10", "--max-batches", "1", stdout=out)
+        self.assertEqual(
+            out.getvalue().strip(),
+            "archived 3 completed requests in 1 batches; pruned 5 archived requests",
+        )
+        self.assertFalse(ArchivedUserRequest.objects.exists())
+        self.assertEqual(DailyElevatorTrips.objects.get().trips, 5)
+        self.assertEqual(DailyFloorPairTrips.objects.get().trips, 5)
+
+    def test_requests_already_archived_are_deleted_but_not_counted_again(self):
+        self.trips(3)
+        first = UserRequest.objects.order_by("pk").first()
+        ArchivedUserRequest.objects.create(
+            id=first.pk,
+            elevator_id=self.elevator.pk,
+            requested_floor=first.requested_floor,
+            destination_floor=first.destination_floor,
+            created_at=first.created_at,
+        )
+        archived, _ = archive_completed(timezone.now())
+        self.assertEqual(archived, 3)
+        self.assertFalse(UserRequest.objects.exists())
+        self.assertEqual(ArchivedUserRequest.objects.count(), 3)
+        self.assertEqual(DailyElevatorTrips.objects.get().trips, 2)
+        self.assertEqual(DailyFloorPairTrips.objects.get().trips, 2)
+
+
+class MetricsTests(TestCase):
+    def test_records_action_latency_queries_and_dispatch_timing(self):
+        elevator = Elevator.objects.create()
+        client = APIClient()
+        moves = metrics.request_duration.count("move_elevator")
+        selects = metrics.dispatch_duration.count("fifo", "select")
+        bypasses = metrics.cache_lookups.value("next_floor", "bypass")
+        client.post(
+            "/elevators/save_user_request/",
+            {"requested_floor": 1, "destination_floor": 3},
+            format="json",
+        )
+        client.post(f"/elevators/{elevator.pk}/move_elevator/")
+        client.get(f"/elevators/{elevator.pk}/get_next_floor/")
+        self.assertEqual(metrics.request_duration.count("move_elevator"), moves + 1)
+        self.assertEqual(metrics.request_queries.count("move_elevator"), moves + 1)
+        self.assertEqual(metrics.dispatch_duration.count("fifo", "select"), selects + 1)
+        self.assertEqual(metrics.cache_lookups.value("next_floor", "bypass"), bypasses + 1)
+
+        response = client.get("/metrics")
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+        body = response.content.decode()
+        self.assertIn("# TYPE elevator_request_duration_seconds histogram", body)
+        self.assertIn('elevator_requests_total{action="move_elevator",status="200"}', body)
+        self.assertIn('elevator_dispatch_duration_seconds_count{strategy="fifo",decision="select"}', body)
+
+    def test_serves_the_registry_outside_the_web_application(self):
+        server = metrics.serve(0, "127.0.0.1")
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        with urlopen(f"http://127.0.0.1:{server.server_port}/metrics") as response:
+            self.assertEqual(response.headers["Content-Type"], metrics.CONTENT_TYPE)
+            self.assertIn(b"# TYPE elevator_tick_duration_seconds histogram", response.read())
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram("latency", "Latency.", (0.1, 1.0), labels=("path",))
+        for value in (0.05, 0.5, 0.5, 3.0):
+            histogram.observe(value, 'a"b')
+        self.assertEqual(
+            list(histogram.samples()),
+            [
+                'latency_bucket{path="a\\"b",le="0.1"} 1',
+                'latency_bucket{path="a\\"b",le="1.0"} 3',
+                'latency_bucket{path="a\\"b",le="+Inf"} 4',
+                'latency_sum{path="a\\"b"} 4.05',
+                'latency_count{path="a\\"b"} 4',
+            ],
+        )
+
+
+class AsyncReadTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.elevator = Elevator.objects.create(current_floor=4)
+        for floor in (2, 8, 9):
+            UserRequest.objects.create(
+                elevator=self.elevator, requested_floor=floor, destination_floor=floor + 1
+            )
+
+    def test_answers_match_the_sync_endpoints(self):
+        pk = self.elevator.pk
+        for path in (
+            f"{pk}/get_next_floor/",
+            f"{pk}/check_direction/",
+            f"{pk}/get_user_requests/",
+            f"{pk}/get_user_requests/?limit=2&fields=requested_floor",
+            f"{pk}/get_user_requests/?limit=0",
+            "999/get_next_floor/",
+            "999/get_user_requests/",
+        ):
+            expected = self.client.get(f"/elevators/{path}")
+            response = self.client.get(f"/async/elevators/{path}")
+            self.assertEqual(
+                (response.status_code, response.content),
+                (expected.status_code, expected.content),
+                path,
+            )
+            self.assertEqual(response.get("X-Next-Cursor"), expected.get("X-Next-Cursor"))
+        self.assertEqual(self.client.post(f"/async/elevators/{pk}/get_next_floor/").status_code, 405)
+
+    async def test_served_by_async_views_with_metrics(self):
+        served = metrics.requests_total.value("async_check_direction", 200)
+        response = await self.async_client.get(
+            f"/async/elevators/{self.elevator.pk}/check_direction/"
+        )
+        self.assertEqual(response.json()["direction"], "down")
+        self.assertEqual(metrics.requests_total.value("async_check_direction", 200), served + 1)
+
+    async def test_async_reads_handler_only_runs_the_metrics_middleware(self):
+        served = metrics.requests_total.value("async_get_next_floor", 200)
+        handler = AsyncReadsHandler()
+        request = AsyncRequestFactory().get(f"/async/elevators/{self.elevator.pk}/get_next_floor/")
+        response = await handler.get_response_async(request)
+        self.assertEqual(json.loads(response.content)["next_floor"], 2)
+        self.assertFalse(hasattr(request, "session"))
+        self.assertEqual(metrics.requests_total.value("async_get_next_floor", 200), served + 1)
+        response = await handler.get_response_async(AsyncRequestFactory().get("/async/other/"))
+        self.assertEqual(response.status_code, 404)
+
+
+class StreamingTests(TestCase):
+    def connect(self, path="/ws/elevators/"):
+        return ApplicationCommunicator(websocket_application, {"type": "websocket", "path": path})
+
+    async def test_streams_snapshot_then_changes(self):
+        elevator = await Elevator.objects.acreate(current_floor=3)
+        communicator = self.connect()
+        await communicator.send_input({"type": "websocket.connect"})
+        self.assertEqual((await communicator.receive_output())["type"], "websocket.accept")
+        snapshot = json.loads((await communicator.receive_output())["text"])
+        self.assertEqual(snapshot[0]["current_floor"], 3)
+        elevator.current_floor = 7
+        publish_state(elevator)
+        frame = json.loads((await communicator.receive_output())["text"])
+        self.assertEqual(frame, [dict(snapshot[0], current_floor=7)])
+        await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+        await communicator.wait()
+
+    def test_snapshot_comes_from_the_state_store_before_it_flushes(self):
+        elevator = Elevator.objects.create(current_floor=3)
+        UserRequest.objects.create(elevator=elevator, requested_floor=3, destination_floor=8)
+        handle, journal_path = tempfile.mkstemp(suffix=".journal")
+        os.close(handle)
+        self.addCleanup(os.remove, journal_path)
+        store = StateStore(journal_path, fsync=False)
+        store.load()
+        with mock.patch("Elevator_app.views.get_store", return_value=store):
+            APIClient().post(f"/elevators/{elevator.pk}/move_elevator/")
+
+        async def connect():
+            communicator = self.connect()
+            await communicator.send_input({"type": "websocket.connect"})
+            await communicator.receive_output()
+            snapshot = json.loads((await communicator.receive_output())["text"])
+            await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+            await communicator.wait()
+            return snapshot
+
+        with mock.patch("Elevator_app.streaming.get_store", return_value=store):
+            snapshot = async_to_sync(connect)()
+        self.assertEqual(snapshot[0]["current_floor"], 8)
+        elevator.refresh_from_db()
+        self.assertEqual(elevator.current_floor, 3)
+
+    async def test_building_streams_only_carry_that_building(self):
+        building = await Building.objects.acreate(name="North")
+        bank = await Bank.objects.acreate(building=building, name="Low", highest_floor=10)
+        car = await Elevator.objects.acreate(bank=bank, building=building, current_floor=2)
+        pool_car = await Elevator.objects.acreate(current_floor=5)
+        communicator = self.connect(f"/ws/buildings/{building.pk}/elevators/")
+        await communicator.send_input({"type": "websocket.connect"})
+        await communicator.receive_output()
+        snapshot = json.loads((await communicator.receive_output())["text"])
+        self.assertEqual([event["elevator_id"] for event in snapshot], [car.pk])
+        publish_state(pool_car, car)
+        frame = json.loads((await communicator.receive_output())["text"])
+        self.assertEqual([event["elevator_id"] for event in frame], [car.pk])
+        await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+        await communicator.wait()
+
+    async def test_rejects_unknown_paths(self):
+        communicator = self.connect("/ws/other/")
+        await communicator.send_input({"type": "websocket.connect"})
+        self.assertEqual((await communicator.receive_output())["code"], 4404)
+
+    async def test_slow_subscriber_receives_coalesced_latest_state(self):
+        subscriber = Subscriber()
+        for floor in range(1, 100):
+            subscriber.offer(("state", 1), json.dumps({"current_floor": floor}))
+        subscriber.offer(("state", 2), json.dumps({"current_floor": 5}))
+        subscriber.offer(("assignment", 1), json.dumps({"requested_floor": 3}))
+        subscriber.offer(("assignment", 1), json.dumps({"requested_floor": 4}))
+        frame = json.loads(await subscriber.next_frame())
+        self.assertEqual(
+            frame,
+            [{"requested_floor": 3}, {"requested_floor": 4}, {"current_floor": 99}, {"current_floor": 5}],
+        )
+
+    @override_settings(ELEVATOR_STREAMING={"MAX_PENDING_ASSIGNMENTS": 2})
+    async def test_subscriber_overflowing_its_assignments_is_closed(self):
+        communicator = self.connect()
+        await communicator.send_input({"type": "websocket.connect"})
+        await communicator.receive_output()
+        await communicator.receive_output()
+        publish_assignments([(1, floor, 9) for floor in range(3)])
+        self.assertEqual(
+            await communicator.receive_output(), {"type": "websocket.close", "code": 1013}
+        )
+        await communicator.send_input({"type": "websocket.disconnect", "code": 1013})
+        await communicator.wait()
+
+    async def test_events_published_by_another_process_are_relayed(self):
+        relay = QueueRelay()
+        server = Broadcaster(relay)
+        elevator = await Elevator.objects.acreate(current_floor=3)
+        with mock.patch("Elevator_app.streaming.broadcaster", server):
+            communicator = self.connect()
+            await communicator.send_input({"type": "websocket.connect"})
+            await communicator.receive_output()
+            await communicator.receive_output()
+            # The ticker's process has no subscribers of its own.
+            elevator.current_floor = 7
+            Broadcaster(relay).publish([state_event(elevator)])
+            frame = json.loads((await communicator.receive_output())["text"])
+            self.assertEqual(frame[0]["current_floor"], 7)
+            await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+            await communicator.wait()
+        server._relaying.cancel()
+
+    def test_publishing_falls_back_to_this_process_when_redis_is_down(self):
+        relay = RedisRelay("redis://127.0.0.1:1/0", "elevator:events")
+        server = Broadcaster(relay)
+        with mock.patch.object(server, "_deliver") as deliver, self.assertLogs(
+            "Elevator_app.streaming", "WARNING"
+        ):
+            server.publish([{"type": "state", "elevator_id": 1}])
+        deliver.assert_called_once()
+        self.assertFalse(relay.send("{}"))
+
+
+class QueueRelay:
+    """
+    In-memory stand-in for the Redis pub/sub relay between processes.
+    """
+
+    def __init__(self):
+        self.queue = asyncio.Queue()
+
+    def send(self, message):
+        self.queue.put_nowait(message)
+        return True
+
+    async def messages(self):
+        while True:
+            yield await self.queue.get()
+
+
+class BulkEndpointTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_initialize_elevators_bulk_creates_in_one_transaction(self):
+        Elevator.objects.create()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                "/elevators/initialize_elevators/", {"number_of_elevators": 50}, format="json"
+            )
+        inserts = [query for query in queries if query["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(len(response.json()["elevators"]), 50)
+        self.assertEqual(Elevator.objects.count(), 50)
+
+    def test_batch_hail_assigns_in_one_pass_and_reports_partial_failures(self):
+        low = Elevator.objects.create(current_floor=1)
+        high = Elevator.objects.create(current_floor=10)
+        hails = [
+            {"requested_floor": 2, "destination_floor": 5},
+            {"requested_floor": 0, "destination_floor": 5},
+            {"requested_floor": 9, "destination_floor": 1},
+            "lobby",
+        ]
+        # Savepoint pair around the candidate fetch, one version claim for
+        # every assigned car in a savepoint of its own and a single bulk INSERT.
+        with self.assertNumQueries(7):
+            response = self.client.post(
+                "/elevators/batch_hail/", {"requests": hails}, format="json"
+            )
+        self.assertEqual(response.status_code, 207)
+        results = response.json()["results"]
+        self.assertEqual(results[0]["elevator_id"], low.pk)
+        self.assertEqual(results[2]["elevator_id"], high.pk)
+        self.assertIn("error", results[1])
+        self.assertIn("error", results[3])
+        self.assertEqual(UserRequest.objects.count(), 2)
+
+    def test_batch_hail_accounts_for_load_added_earlier_in_batch(self):
+        first = Elevator.objects.create(current_floor=1)
+        second = Elevator.objects.create(current_floor=2)
+        hails = [{"requested_floor": 1, "destination_floor": 20}] * 2
+        response = self.client.post("/elevators/batch_hail/", {"requests": hails}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [result["elevator_id"] for result in response.json()["results"]],
+            [first.pk, second.pk],
+        )
+
+    @override_settings(ELEVATOR_DISPATCH={"STRATEGY": "eta"})
+    def test_batch_hail_over_a_large_bank_picks_as_a_scan_does(self):
+        rng = random.Random(4)
+        for _ in range(40):
+            elevator = Elevator.objects.create(current_floor=rng.randint(1, 30))
+            for position in range(1, rng.choice((0, 1, 2, 4)) + 1):
+                UserRequest.objects.create(
+                    elevator=elevator,
+                    requested_floor=rng.randint(1, 30),
+                    destination_floor=rng.randint(1, 30),
+                    queue_position=position,
+                )
+        hails = [(tuple(rng.sample(range(1, 31), 2)), None) for _ in range(100)]
+        scanning = ETAStrategy()
+        scanning.index = lambda elevators: None
+        picks = []
+        for strategy in (ETAStrategy(), scanning):
+            with transaction.atomic():
+                assigned = ElevatorViewSet().assign_hails(None, hails, strategy=strategy)
+                transaction.set_rollback(True)
+            picks.append(
+                [(elevator.pk, user_request.queue_position) for elevator, user_request in assigned]
+            )
+        self.assertEqual(picks[0], picks[1])
+
+
+class GetUserRequestsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.elevator = Elevator.objects.create()
+        self.url = f"/elevators/{self.elevator.pk}/get_user_requests/"
+        UserRequest.objects.bulk_create(
+            UserRequest(
+                elevator=self.elevator,
+                requested_floor=floor,
+                destination_floor=floor + 1,
+                is_complete=floor % 2 == 0,
+            )
+            for floor in range(1, 8)
+        )
+
+    def test_cursor_walks_every_page_once(self):
+        seen = []
+        response = self.client.get(self.url, {"limit": 3})
+        while True:
+            seen.extend(item["requested_floor"] for item in response.json())
+            if "X-Next-Cursor" not in response:
+                break
+            self.assertIn('rel="next"', response["Link"])
+            response = self.client.get(
+                self.url, {"limit": 3, "cursor": response["X-Next-Cursor"]}
+            )
+        self.assertEqual(seen, list(range(1, 8)))
+
+    def test_filters_and_sparse_fields(self):
+        response = self.client.get(
+            self.url, {"is_complete": "false", "fields": "requested_floor,destination_floor"}
+        )
+        self.assertEqual(
+            response.json(),
+            [
+                {"requested_floor": floor, "destination_floor": floor + 1}
+                for floor in (1, 3, 5, 7)
+            ],
+        )
+        response = self.client.get(self.url, {"created_before": "2000-01-01T00:00:00Z"})
+        self.assertEqual(response.json(), [])
+
+    def test_rejects_invalid_parameters(self):
+        for params in (
+            {"limit": "0"},
+            {"limit": "\u00b2"},
+            {"cursor": "nonsense"},
+            {"is_complete": "maybe"},
+            {"created_after": "yesterday"},
+            {"created_after": "2023-02-30T00:00:00"},
+            {"created_before": "2023-01-01T25:00:00"},
+            {"fields": "password"},
+        ):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+            self.assertEqual(
+                self.client.get(f"/async{self.url}", params).status_code, 400, params
+            )
+
+
+class FleetStatusTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def fleet(self, **params):
+        return self.client.get("/elevators/fleet_status/", params)
+
+    def listed(self, **params):
+        return [car["elevator_id"] for car in self.fleet(**params).json()["elevators"]]
+
+    def add_cars(self, count, **fields):
+        elevators = Elevator.objects.bulk_create(
+            Elevator(current_floor=number % 9 + 1, direction=UP, **fields)
+            for number in range(count)
+        )
+        UserRequest.objects.bulk_create(
+            UserRequest(
+                elevator=elevator,
+                requested_floor=floor,
+                destination_floor=floor + 3,
+                queue_position=position,
+            )
+            for elevator in elevators
+            for position, floor in enumerate((7, 2, 5), start=1)
+        )
+        return elevators
+
+    def test_matches_the_per_car_answers(self):
+        for strategy in ("fifo", "look"):
+            with self.subTest(strategy=strategy), override_settings(
+                ELEVATOR_DISPATCH={"STRATEGY": strategy}
+            ):
+                Elevator.objects.all().delete()
+                self.add_cars(3)
+                self.add_cars(1, in_maintenance=True)
+                self.add_cars(1, is_door_open=True)
+                idle = Elevator.objects.create()
+                cars = self.fleet().json()["elevators"]
+                self.assertEqual(len(cars), 6)
+                for car in cars:
+                    pk = car["elevator_id"]
+                    next_floor = self.client.get(f"/elevators/{pk}/get_next_floor/").json()
+                    direction = self.client.get(f"/elevators/{pk}/check_direction/").json()
+                    self.assertEqual(car["next_floor"], next_floor.get("next_floor"))
+                    self.assertEqual(car["direction"], direction.get("direction"))
+                    self.assertEqual(car["queue_depth"], 0 if pk == idle.pk else 3)
+
+    def test_query_count_is_constant(self):
+        for count in (1, 8, 40):
+            Elevator.objects.all().delete()
+            self.add_cars(count)
+            with self.assertNumQueries(2):
+                self.assertEqual(len(self.fleet().json()["elevators"]), count)
+
+    def test_filters(self):
+        building = Building.objects.create(name="North")
+        bank = Bank.objects.create(building=building, name="All", highest_floor=20)
+        in_building = self.add_cars(2, bank=bank, building=building)
+        pool = self.add_cars(2)
+        self.assertEqual(self.listed(building=building.pk), [car.pk for car in in_building])
+        self.assertEqual(
+            self.listed(ids=f"{pool[1].pk},{in_building[0].pk}"),
+            sorted([pool[1].pk, in_building[0].pk]),
+        )
+        self.assertEqual(self.fleet(ids="1,two").status_code, 400)
+        self.assertEqual(self.fleet(ids="\u00b2").status_code, 400)
+        self.assertEqual(self.fleet(building="\u00b2").status_code, 400)
+        self.assertEqual(self.fleet(building="north").status_code, 400)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.elevator = Elevator.objects.create(current_floor=1)
+        UserRequest.objects.create(elevator=self.elevator, requested_floor=3, destination_floor=5)
+
+    def url(self, read):
+        return f"/elevators/{self.elevator.pk}/{read}"
+
+    def test_unchanged_reads_are_answered_from_the_version(self):
+        for read in ("", "get_user_requests/", "get_next_floor/", "check_direction/"):
+            with self.subTest(read=read):
+                etag = self.client.get(self.url(read))["ETag"]
+                with self.assertNumQueries(1):
+                    response = self.client.get(self.url(read), HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response["ETag"], etag)
+                self.assertEqual(response.content, b"")
+                response = self.client.get(self.url(read), HTTP_IF_NONE_MATCH=f'"other", {etag[2:]}')
+                self.assertEqual(response.status_code, 304)
+
+    def test_async_reads_share_the_etags(self):
+        for read in ("get_user_requests/", "get_next_floor/", "check_direction/"):
+            with self.subTest(read=read):
+                etag = self.client.get(self.url(read))["ETag"]
+                response = self.client.get(f"/async{self.url(read)}", HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response["ETag"], etag)
+
+    def test_writes_change_the_etag(self):
+        writes = (
+            lambda: self.client.post(
+                "/elevators/save_user_request/",
+                {"requested_floor": 2, "destination_floor": 9},
+                format="json",
+            ),
+            lambda: self.client.post(self.url("move_elevator/")),
+            lambda: self.client.post(self.url("door_status/")),
+            lambda: self.client.post(self.url("toggle_maintenance/")),
+        )
+        etag = self.client.get(self.url("get_user_requests/"))["ETag"]
+        for write in writes:
+            write()
+            response = self.client.get(
+                self.url("get_user_requests/"), HTTP_IF_NONE_MATCH=etag
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response["ETag"], etag)
+            etag = response["ETag"]
+
+    def test_strategy_answers_are_tagged_by_strategy(self):
+        fifo = self.client.get(self.url("get_next_floor/"))["ETag"]
+        with override_settings(ELEVATOR_DISPATCH={"STRATEGY": "look"}):
+            response = self.client.get(self.url("get_next_floor/"), HTTP_IF_NONE_MATCH=fifo)
+        self.assertEqual(response.status_code, 200)
+        # Aging makes the ETA answer drift with time, so it is never cached.
+        with override_settings(ELEVATOR_DISPATCH={"STRATEGY": "eta"}):
+            self.assertNotIn("ETag", self.client.get(self.url("check_direction/")))
+        with override_settings(ELEVATOR_DISPATCH={"STRATEGY": "eta", "AGING_WEIGHT": 0}):
+            self.assertIn("ETag", self.client.get(self.url("check_direction/")))
+
+
+class SerializationFastPathTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        building = Building.objects.create(name="Nord \u2028 Tower \u00e9")
+        bank = Bank.objects.create(building=building, name="Low", highest_floor=20)
+        self.elevator = Elevator.objects.create(bank=bank, building=building, current_floor=3)
+        Elevator.objects.create(in_maintenance=True)
+        UserRequest.objects.bulk_create(
+            UserRequest(
+                elevator=self.elevator,
+                requested_floor=floor,
+                destination_floor=None if floor == 4 else floor + 2,
+                is_complete=floor % 3 == 0,
+            )
+            for floor in range(1, 9)
+        )
+
+    def body(self, path, params=None, fast=True):
+        with override_settings(
+            ELEVATOR_SERIALIZATION={"FAST_PATH": fast, "STREAM_BATCH_SIZE": 2}
+        ):
+            response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        if response.streaming:
+            return b"".join(response.streaming_content)
+        return response.content
+
+    def test_list_routes_are_streamed_with_the_same_bytes(self):
+        for path in ("/elevators/", "/buildings/", "/banks/"):
+            with self.subTest(path=path):
+                self.assertEqual(self.body(path), self.body(path, fast=False))
+        Bank.objects.all().delete()
+        self.assertEqual(self.body("/banks/"), b"[]")
+        self.assertIn(b"<html", self.body("/elevators/", {"format": "api"}))
+
+    def test_user_request_pages_are_unchanged(self):
+        path = f"/elevators/{self.elevator.pk}/get_user_requests/"
+        for params in (
+            {"limit": 3},
+            {"is_complete": "false", "fields": "destination_floor,requested_floor"},
+            {"fields": "created_at"},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.body(path, params), self.body(path, params, fast=False))
+        with override_settings(ELEVATOR_SERIALIZATION={"FAST_PATH": True}):
+            cursor = self.client.get(path, {"limit": 3})["X-Next-Cursor"]
+        self.assertEqual(
+            self.body(path, {"limit": 3, "cursor": cursor}),
+            self.body(path, {"limit": 3, "cursor": cursor}, fast=False),
+        )
+
+    def test_renderer_matches_drf(self):
+        data = {
+            "text": "caf\u00e9 \u2028 \u2029 \"quoted\" \x00\n",
+            "when": timezone.now(),
+            "day": datetime.date(2026, 10, 17),
+            "nested": [{"id": 1, "ok": True, "none": None}],
+            "big": 2**70,
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            b"".join(FastJSONRenderer().stream(iter(data["nested"] * 5), 2)),
+            JSONRenderer().render(data["nested"] * 5),
+        )
+
+
+class DispatchStrategyTests(SimpleTestCase):
+    def test_look_keeps_sweeping_before_reversing(self):
+        car = SimElevator(1, current_floor=5)
+        car.direction = UP
+        below = SimRequest(4, 1, created_at=0)
+        above = SimRequest(9, 12, created_at=1)
+        self.assertIs(LookStrategy().next_request(car, [below, above]), above)
+
+    def test_look_carries_passenger_at_pickup_floor_first(self):
+        car = SimElevator(1, current_floor=5)
+        car.direction = UP
+        waiting_here = SimRequest(5, 1, created_at=1)
+        above = SimRequest(6, 12, created_at=0)
+        self.assertIs(LookStrategy().next_request(car, [above, waiting_here]), waiting_here)
+
+    def test_eta_counts_queued_stops(self):
+        busy = SimElevator(1, current_floor=3)
+        busy.pending = [SimRequest(3, 4, created_at=0), SimRequest(8, 2, created_at=0)]
+        idle = SimElevator(2, current_floor=9)
+        strategy = ETAStrategy(floor_travel_seconds=1, stop_seconds=10)
+        self.assertIs(strategy.select_elevator([busy, idle], 4, 1), idle)
+
+    @override_settings(ELEVATOR_DISPATCH={"STRATEGY": "look"})
+    def test_strategy_selected_from_settings(self):
+        self.assertIsInstance(get_strategy(), LookStrategy)
+        with self.assertRaises(ValueError):
+            get_strategy("nearest")
+
+    def test_simulation_is_reproducible_from_seed(self):
+        hails = random_traffic(200, floors=15, seed=7)
+        first = Simulator(get_strategy("look"), elevators=4).run(hails).as_dict()
+        second = Simulator(get_strategy("look"), elevators=4).run(hails).as_dict()
+        first.pop("requests_per_second")
+        second.pop("requests_per_second")
+        self.assertEqual(first, second)
+        self.assertEqual(first["completed"], 200)
+
+    def test_traffic_patterns_follow_their_lobby_mix(self):
+        up_peak = traffic("up_peak", 1000, floors=20, seed=3)
+        down_peak = traffic("down_peak", 1000, floors=20, seed=3)
+        self.assertEqual(up_peak, traffic("up_peak", 1000, floors=20, seed=3))
+        self.assertGreater(sum(hail[1] == 1 for hail in up_peak), 800)
+        self.assertGreater(sum(hail[2] == 1 for hail in down_peak), 800)
+        with self.assertRaises(ValueError):
+            traffic("rush", 10, floors=20)
+
+
+    def test_passenger_group_shares_floors_window_and_capacity(self):
+        first = SimRequest(1, 12, created_at=0)
+        pending = [
+            first,
+            SimRequest(1, 9, created_at=1),
+            SimRequest(1, 12, created_at=20),
+            SimRequest(1, 12, created_at=45),
+            SimRequest(1, 12, created_at=25),
+        ]
+        self.assertEqual(passenger_group(first, pending, 10, 30), [first, pending[2], pending[4]])
+        self.assertEqual(passenger_group(first, pending, 2, 30), [first, pending[2]])
+
+    def test_grouping_serves_up_peak_with_fewer_stops(self):
+        hails = traffic("up_peak", 400, floors=8, rate=0.3, seed=2)
+        single = Simulator(get_strategy("fifo"), elevators=3).run(hails)
+        grouped = Simulator(get_strategy("fifo"), elevators=3, group_window=30).run(hails)
+        self.assertEqual(grouped.completed, 400)
+        self.assertLess(grouped.stops_per_passenger, single.stops_per_passenger)
+        self.assertGreater(grouped.passengers_per_hour, single.passengers_per_hour)
+
+
+    def test_sweep_serves_every_request_along_the_direction(self):
+        car = SimElevator(1, current_floor=1)
+        first, down, later, inner = (
+            SimRequest(2, 9, created_at=0),
+            SimRequest(5, 3, created_at=1),
+            SimRequest(3, 8, created_at=2),
+            SimRequest(4, 6, created_at=3),
+        )
+        stops = plan_sweep(get_strategy("fifo"), car, [first, down, later, inner])
+        self.assertEqual(
+            stops,
+            [
+                (2, [first], []),
+                (3, [later], []),
+                (4, [inner], []),
+                (6, [], [inner]),
+                (8, [], [later]),
+                (9, [], [first]),
+            ],
+        )
+        car.capacity = 1
+        stops = plan_sweep(get_strategy("fifo"), car, [first, down, later, inner])
+        self.assertEqual(stops, [(2, [first], []), (9, [], [first])])
+
+    def test_sweep_first_goes_back_to_a_pickup_behind_the_car(self):
+        car = SimElevator(1, current_floor=7)
+        first = SimRequest(2, 9, created_at=0)
+        passed = SimRequest(1, 4, created_at=1)
+        self.assertEqual(
+            plan_sweep(get_strategy("fifo"), car, [first, passed]), [(2, [first], []), (9, [], [first])]
+        )
+
+
+class SweepMoveTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.elevator = Elevator.objects.create(current_floor=1)
+
+    def move(self, mode):
+        return self.client.post(
+            f"/elevators/{self.elevator.pk}/move_elevator/", {"mode": mode}, format="json"
+        )
+
+    def test_one_call_drains_the_sweep_in_one_update(self):
+        up = [
+            UserRequest.objects.create(elevator=self.elevator, requested_floor=2, destination_floor=9),
+            UserRequest.objects.create(elevator=self.elevator, requested_floor=4, destination_floor=6),
+        ]
+        down = UserRequest.objects.create(elevator=self.elevator, requested_floor=8, destination_floor=3)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.move("sweep")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["stops"],
+            [
+                {"floor": 2, "picked_up": [up[0].pk], "dropped_off": []},
+                {"floor": 4, "picked_up": [up[1].pk], "dropped_off": []},
+                {"floor": 6, "picked_up": [], "dropped_off": [up[1].pk]},
+                {"floor": 9, "picked_up": [], "dropped_off": [up[0].pk]},
+            ],
+        )
+        self.assertEqual(
+            sum(query["sql"].startswith("UPDATE") for query in queries.captured_queries), 2
+        )
+        self.assertEqual(
+            list(UserRequest.objects.filter(is_complete=False).values_list("pk", flat=True)),
+            [down.pk],
+        )
+        self.assertEqual(self.move("sweep").json()["current_floor"], 3)
+        self.assertEqual(self.move("sweep").status_code, 400)
+
+    def test_rejects_unknown_mode(self):
+        self.assertEqual(self.move("teleport").status_code, 400)
+
+
+@override_settings(
+    ELEVATOR_DISPATCH={"STRATEGY": "fifo", "DESTINATION_GROUPING": True, "GROUP_WINDOW_SECONDS": 30}
+)
+class DestinationGroupingTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.lobby_car = Elevator.objects.create(current_floor=1, capacity=3)
+        self.other = Elevator.objects.create(current_floor=2)
+
+    def hail(self, requested_floor, destination_floor):
+        response = self.client.post(
+            "/elevators/save_user_request/",
+            {"requested_floor": requested_floor, "destination_floor": destination_floor},
+            format="json",
+        )
+        return response.json()["elevator_id"]
+
+    def test_hails_join_a_waiting_group_up_to_capacity(self):
+        UserRequest.objects.create(elevator=self.other, requested_floor=2, destination_floor=3)
+        assigned = [self.hail(2, 12) for _ in range(4)]
+        # The first hail goes to the nearest car; the rest join its group
+        # until the car is full.
+        self.assertEqual(assigned[:3], [self.lobby_car.pk] * 3)
+        self.assertEqual(assigned[3], self.other.pk)
+
+    def test_batch_hails_join_groups_like_single_hails(self):
+        UserRequest.objects.create(elevator=self.other, requested_floor=2, destination_floor=3)
+        response = self.client.post(
+            "/elevators/batch_hail/",
+            {"requests": [{"requested_floor": 2, "destination_floor": 12}] * 4},
+            format="json",
+        )
+        self.assertEqual(
+            [result["elevator_id"] for result in response.json()["results"]],
+            [self.lobby_car.pk] * 3 + [self.other.pk],
+        )
+        self.assertEqual(self.hail(2, 12), self.other.pk)
+
+    def test_one_move_carries_the_whole_group(self):
+        for _ in range(3):
+            UserRequest.objects.create(elevator=self.lobby_car, requested_floor=1, destination_floor=12)
+        UserRequest.objects.create(elevator=self.lobby_car, requested_floor=1, destination_floor=7)
+        response = self.client.post(f"/elevators/{self.lobby_car.pk}/move_elevator/")
+        self.assertEqual(response.json()["current_floor"], 12)
+        self.assertEqual(
+            list(
+                UserRequest.objects.filter(elevator=self.lobby_car, is_complete=False)
+                .values_list("destination_floor", flat=True)
+            ),
+            [7],
+        )
+
+    def test_ticker_carries_groups_and_stale_requests_ride_alone(self):
+        group = [
+            UserRequest.objects.create(elevator=self.lobby_car, requested_floor=1, destination_floor=12)
+            for _ in range(2)
+        ]
+        UserRequest.objects.filter(pk=group[1].pk).update(
+            created_at=timezone.now() + datetime.timedelta(minutes=5)
+        )
+        self.assertEqual(tick().completed, 1)
+        self.assertTrue(UserRequest.objects.filter(pk=group[1].pk, is_complete=False).exists())
+
+
+class WhatIfReplayTests(TestCase):
+    def setUp(self):
+        self.building = Building.objects.create(name="replayed")
+        self.elevator = Elevator.objects.create(building=self.building)
+        self.start = timezone.now() - datetime.timedelta(days=2)
+        for index, (at, requested_floor, destination_floor) in enumerate(
+            random_traffic(60, 10, seed=5)
+        ):
+            ArchivedUserRequest.objects.create(
+                id=index + 1,
+                elevator_id=self.elevator.pk,
+                building_id=self.building.pk if index % 2 else None,
+                requested_floor=requested_floor,
+                destination_floor=destination_floor,
+                created_at=self.start + datetime.timedelta(seconds=at),
+            )
+        UserRequest.objects.create(elevator=self.elevator, requested_floor=2, destination_floor=7)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "hails.csv")
+
+    def test_export_merges_history_in_creation_order(self):
+        self.assertEqual(export_hails(self.path), 61)
+        hails = list(read_hails(self.path))
+        self.assertEqual([at for at, _, _ in hails], sorted(at for at, _, _ in hails))
+        self.assertEqual(hails[-1][1:], (2, 7))
+        self.assertEqual(export_hails(self.path, building=self.building.pk), 31)
+        self.assertEqual(export_hails(self.path, since=timezone.now() - datetime.timedelta(hours=1)), 1)
+
+    def test_streamed_replay_matches_the_simulator(self):
+        hails = random_traffic(500, 12, seed=2)
+        expected = Simulator(get_strategy("look"), elevators=3).run(hails)
+        report = ReplaySimulator(get_strategy("look"), elevators=3).run(iter(hails))
+        self.assertEqual(report["delivered"], expected.completed)
+        self.assertEqual(report["stops"], expected.stops)
+        self.assertAlmostEqual(report["avg_wait"], expected.avg_wait, places=1)
+        self.assertAlmostEqual(report["p95_wait"], expected.wait_percentiles[95], delta=0.5)
+
+    def test_histogram_percentiles_are_within_one_bin(self):
+        rng = random.Random(1)
+        values = [rng.uniform(0, 60) for _ in range(500)]
+        histogram = Histogram(width=0.5, limit=100)
+        for value in values:
+            histogram.add(value)
+        for percentile in (50, 95):
+            self.assertAlmostEqual(
+                histogram.percentile(percentile), nearest_rank(values, percentile), delta=0.5
+            )
+        self.assertEqual(histogram.percentile(100), max(values))
+        # Values beyond the limit share the last bin, which answers the maximum.
+        overflowing = Histogram(width=0.5, limit=10)
+        for value in values:
+            overflowing.add(value)
+        self.assertEqual(overflowing.percentile(99), max(values))
+
+    def test_pool_and_inline_replays_agree(self):
+        export_hails(self.path)
+        configs = [
+            {"label": name, "strategy": name, "elevators": 2, "group_window": None}
+            for name in ("fifo", "eta")
+        ]
+        inline = compare(self.path, configs, workers=1)
+        pooled = compare(self.path, configs, workers=2)
+        for report in inline + pooled:
+            report.pop("hails_per_second")
+        self.assertEqual(inline, pooled)
+
+    def test_command_compares_alternatives_with_the_current_configuration(self):
+        out = StringIO()
+        call_command(
+            "whatif_replay",
+            elevators="1,2",
+            strategies=["fifo"],
+            grouping=True,
+            workers=1,
+            json=True,
+            stdout=out,
+        )
+        reports = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(
+            [report["label"] for report in reports],
+            ["current", "fifo/1 grouped", "fifo/2", "fifo/2 grouped"],
+        )
+        self.assertEqual({report["delivered"] for report in reports}, {61})
+
+    @override_settings(ELEVATOR_PARKING={"ENABLED": True, "MIN_DEMAND": 0.5})
+    def test_current_configuration_parks_when_parking_is_enabled(self):
+        out = StringIO()
+        call_command(
+            "whatif_replay", strategies=["fifo"], parking=True, workers=1, json=True, stdout=out
+        )
+        reports = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(
+            [(report["label"], report["parking"]) for report in reports],
+            [("current", True), ("fifo/1", False)],
+        )
+        self.assertEqual({report["delivered"] for report in reports}, {61})
+
+    def test_current_configuration_uses_the_building_strategy(self):
+        building = Building.objects.create(name="North")
+        dispatch = {"STRATEGY": "fifo", "BUILDING_STRATEGIES": {building.pk: "look"}}
+        out = StringIO()
+        with override_settings(ELEVATOR_DISPATCH=dispatch):
+            call_command(
+                "whatif_replay",
+                building=building.pk,
+                strategies=["fifo"],
+                workers=1,
+                json=True,
+                stdout=out,
+            )
+        reports = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(
+            [(report["label"], report["strategy"]) for report in reports],
+            [("current", "look"), ("fifo/1", "fifo")],
+        )
+
+    def test_car_counts_are_validated(self):
+        for elevators in ("two", "0", "1,,2", "2,-1"):
+            with self.subTest(elevators=elevators), self.assertRaises(CommandError):
+                call_command("whatif_replay", elevators=elevators, workers=1, stdout=StringIO())
+
+
+# The simulator's client, like the benchmark commands', talks to "localhost".
+@override_settings(ALLOWED_HOSTS=["localhost"])
+class ApiSimulationTests(TestCase):
+    def test_replays_traffic_through_the_endpoints_reproducibly(self):
+        hails = traffic("lunch", 40, floors=12, seed=5)
+        first = ApiSimulator(get_strategy("fifo"), elevators=3).run(hails)
+        second = ApiSimulator(get_strategy("fifo"), elevators=3).run(hails)
+        self.assertEqual(first.completed, 40)
+        self.assertEqual(first.wait_percentiles, second.wait_percentiles)
+        self.assertEqual(first.journey_percentiles, second.journey_percentiles)
+        hail_stats = first.as_dict()["endpoints"]["save_user_request"]
+        self.assertEqual(hail_stats["calls"], 40)
+        self.assertEqual(hail_stats["queries_per_call"], 5)
+        self.assertGreater(first.endpoints["move_elevator"].as_dict()["calls"], 40)
+
+    def test_benchmark_api_prints_json_and_rolls_back(self):
+        out = StringIO()
+        call_command("benchmark_api", requests=10, pattern=["up_peak"], json=True, stdout=out)
+        run = json.loads(out.getvalue())
+        self.assertEqual((run["pattern"], run["completed"]), ("up_peak", 10))
+        self.assertFalse(Elevator.objects.exists())
+
+
+class EtaIndexTests(SimpleTestCase):
+    def fleet(self, rng, size, floors=30):
+        cars = []
+        for pk in range(1, size + 1):
+            car = SimElevator(pk, current_floor=rng.randint(1, floors))
+            for _ in range(rng.choice((0, 1, 3))):
+                car.pending.append(SimRequest(*rng.sample(range(1, floors + 1), 2), created_at=0))
+            cars.append(car)
+        return cars
+
+    def test_best_car_matches_a_full_scan_as_cars_change(self):
+        rng = random.Random(11)
+        strategy = ETAStrategy()
+        cars = self.fleet(rng, 50)
+        index = strategy.index(cars)
+        for _ in range(200):
+            car = rng.choice(cars)
+            car.current_floor = rng.randint(1, 40)
+            if car.pending and rng.random() < 0.5:
+                car.pending.pop(0)
+            car.in_maintenance = rng.random() < 0.1
+            index.update(car)
+            available = [car for car in cars if not car.in_maintenance]
+            for floor in (1, rng.randint(1, 40), 45):
+                self.assertIs(
+                    index.best(floor), strategy.select_elevator(available, floor, None)
+                )
+
+@override_settings(ELEVATOR_DISPATCH={"STRATEGY": "look"})
+class LookDispatchViewTests(TestCase):
+    def test_move_follows_sweep_direction(self):
+        elevator = Elevator.objects.create(current_floor=5, direction=UP)
+        UserRequest.objects.create(elevator=elevator, requested_floor=2, destination_floor=1)
+        UserRequest.objects.create(elevator=elevator, requested_floor=8, destination_floor=9)
+        response = APIClient().post(f"/elevators/{elevator.pk}/move_elevator/")
+        self.assertEqual(response.json()["current_floor"], 8)
+
+
+class StateStoreTests(TestCase):
+    def setUp(self):
+        handle, self.journal_path = tempfile.mkstemp(suffix=".journal")
+        os.close(handle)
+        self.addCleanup(os.remove, self.journal_path)
+        lock_path = f"{self.journal_path}.lock"
+        self.addCleanup(lambda: os.path.exists(lock_path) and os.remove(lock_path))
+        self.store = StateStore(self.journal_path, fsync=False)
+        patcher = mock.patch("Elevator_app.views.get_store", return_value=self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.elevator = Elevator.objects.create(current_floor=1)
+        UserRequest.objects.create(elevator=self.elevator, requested_floor=1, destination_floor=4)
+        self.store.load()
+        self.client = APIClient()
+
+    def test_reads_and_moves_are_served_from_memory(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(f"/elevators/{self.elevator.pk}/get_next_floor/")
+            self.assertEqual(response.json()["next_floor"], 4)
+            response = self.client.get("/elevators/fleet_status/")
+            self.assertEqual(response.json()["elevators"][0]["queue_depth"], 1)
+            response = self.client.post(f"/elevators/{self.elevator.pk}/move_elevator/")
+            self.assertEqual(response.json()["current_floor"], 4)
+        self.elevator.refresh_from_db()
+        self.assertEqual(self.elevator.current_floor, 1)
+
+    def test_etags_follow_the_state_version(self):
+        url = f"/elevators/{self.elevator.pk}/get_user_requests/"
+        next_floor = f"/elevators/{self.elevator.pk}/get_next_floor/"
+        etag = self.client.get(next_floor)["ETag"]
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(next_floor, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        etag = self.client.get(url)["ETag"]
+        # The request list also carries the database version (cached with
+        # Redis), which archive_requests bumps.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.post(
+            "/elevators/save_user_request/",
+            {"requested_floor": 3, "destination_floor": 2},
+            format="json",
+        )
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        # The list is read from the database, so it changes again on flush.
+        self.client.post(f"/elevators/{self.elevator.pk}/move_elevator/")
+        etag = self.client.get(url)["ETag"]
+        self.store.flush()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.client.get(url)["ETag"]
+        UserRequest.objects.update(created_at=timezone.now() - datetime.timedelta(days=30))
+        archive_completed(timezone.now())
+        for path in (url, f"/async{url}"):
+            with self.subTest(path=path):
+                response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    [row["requested_floor"] for row in json.loads(response.content)], [3]
+                )
+
+    def test_flush_writes_batched_changes_and_clears_journal(self):
+        self.client.post(f"/elevators/{self.elevator.pk}/move_elevator/")
+        self.client.post(f"/elevators/{self.elevator.pk}/door_status/")
+        self.assertEqual(self.store.flush(), 1)
+        self.elevator.refresh_from_db()
+        self.assertEqual(self.elevator.current_floor, 4)
+        self.assertTrue(self.elevator.is_door_open)
+        self.assertFalse(UserRequest.objects.filter(is_complete=False).exists())
+        self.assertEqual(os.path.getsize(self.journal_path), 0)
+
+    def test_recover_replays_journal_left_by_crash(self):
+        self.client.post(f"/elevators/{self.elevator.pk}/move_elevator/")
+        with open(self.journal_path, "a", encoding="utf-8") as journal:
+            journal.write('{"elevator": ')
+        restarted = StateStore(self.journal_path, fsync=False)
+        with self.assertLogs("Elevator_app.state", "WARNING"):
+            self.assertEqual(restarted.recover(), 1)
+        restarted.load()
+        self.assertEqual(restarted.get(self.elevator.pk).current_floor, 4)
+        self.assertEqual(restarted.get(self.elevator.pk).pending_count, 0)
+
+    def test_a_second_store_on_the_journal_refuses_to_start(self):
+        self.assertTrue(self.store.claim_journal())
+        self.addCleanup(self.store.release_journal)
+        other = StateStore(self.journal_path, fsync=False)
+        with self.assertRaises(ImproperlyConfigured):
+            other.start()
+        self.assertIsNone(other._thread)
+
+    def test_app_ready_recovers_a_journal_no_running_store_owns(self):
+        self.client.post(f"/elevators/{self.elevator.pk}/move_elevator/")
+        self.assertTrue(self.store.claim_journal())
+        self.addCleanup(self.store.release_journal)
+        config = apps.get_app_config("Elevator_app")
+        with override_settings(
+            ELEVATOR_STATE_STORE={"ENABLED": True, "JOURNAL": self.journal_path, "FSYNC": False}
+        ):
+            config.ready()
+            self.elevator.refresh_from_db()
+            self.assertEqual(self.elevator.current_floor, 1)
+            self.store.release_journal()
+            config.ready()
+        self.elevator.refresh_from_db()
+        self.assertEqual(self.elevator.current_floor, 4)
+        self.assertEqual(os.path.getsize(self.journal_path), 0)
+
+    @override_settings(ELEVATOR_DISPATCH={"STRATEGY": "eta"})
+    def test_batch_hails_are_assigned_from_the_store_index(self):
+        Elevator.objects.create(current_floor=1)
+        self.store.load()
+        with mock.patch.object(self.store, "index", wraps=self.store.index) as index:
+            response = self.client.post(
+                "/elevators/batch_hail/",
+                {"requests": [{"requested_floor": 1, "destination_floor": 9}] * 3},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(index.call_count, 3)
+        self.assertEqual(
+            sum(state.pending_count for state in self.store.all()),
+            UserRequest.objects.filter(is_complete=False).count(),
+        )
+        self.assertEqual(len({result["elevator_id"] for result in response.json()["results"]}), 2)
+
+    def test_tick_checks_each_car_under_the_store_lock(self):
+        # The car was reloaded with its door open after the tick listed it.
+        listed = self.store.all()
+        Elevator.objects.filter(pk=self.elevator.pk).update(is_door_open=True)
+        self.store.refresh(self.elevator.pk)
+        with mock.patch("Elevator_app.ticker.get_store", return_value=self.store), mock.patch.object(
+            self.store, "all", return_value=listed
+        ):
+            self.assertEqual(tick().moved, 0)
+        self.assertEqual(self.store.get(self.elevator.pk).current_floor, 1)
+
+    def test_hail_is_queued_in_memory(self):
+        response = self.client.post(
+            "/elevators/save_user_request/",
+            {"requested_floor": 3, "destination_floor": 2},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.store.get(self.elevator.pk).pending_count, 2)
+
+    @override_settings(ELEVATOR_DISPATCH={"STRATEGY": "eta"})
+    def test_hails_are_answered_from_the_maintained_eta_index(self):
+        far = Elevator.objects.create(current_floor=9)
+        self.store.load()
+        index = self.store.index(get_strategy())
+        self.assertIn(far.pk, index)
+
+        def hail(requested_floor):
+            response = self.client.post(
+                "/elevators/save_user_request/",
+                {"requested_floor": requested_floor, "destination_floor": 1},
+                format="json",
+            )
+            return response.json()["elevator_id"]
+
+        self.assertEqual(hail(8), far.pk)
+        # The busy car's queue puts it behind the idle one until it is served.
+        self.client.post(f"/elevators/{self.elevator.pk}/move_elevator/")
+        self.client.post(f"/elevators/{self.elevator.pk}/move_elevator/")
+        self.assertEqual(hail(2), self.elevator.pk)
+        self.client.post(f"/elevators/{far.pk}/door_status/")
+        self.assertNotIn(far.pk, index)
+        self.assertIs(self.store.index(get_strategy()), index)
+        # A building with other settings keeps its own index alongside.
+        other = self.store.index(ETAStrategy(floor_travel_seconds=3.0))
+        self.assertIsNot(other, index)
+        self.assertIs(self.store.index(get_strategy()), index)
+
+
+# Events are appended on commit, which TestCase never reaches.
+class EventLogTests(TransactionTestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "events.jsonl")
+        log_settings = override_settings(
+            ELEVATOR_EVENT_LOG={"ENABLED": True, "PATH": self.path, "SNAPSHOT_EVERY": 0}
+        )
+        log_settings.enable()
+        self.addCleanup(log_settings.disable)
+        self.client = APIClient()
+        response = self.client.post(
+            "/elevators/initialize_elevators/", {"number_of_elevators": 2}, format="json"
+        )
+        self.cars = [car["elevator_id"] for car in response.json()["elevators"]]
+
+    def post(self, pk, action):
+        return self.client.post(f"/elevators/{pk}/{action}/")
+
+    def traffic(self):
+        self.client.post(
+            "/elevators/save_user_request/",
+            {"requested_floor": 1, "destination_floor": 5},
+            format="json",
+        )
+        self.client.post(
+            "/elevators/batch_hail/",
+            {"requests": [{"requested_floor": 3, "destination_floor": 1}] * 3},
+            format="json",
+        )
+        for pk in self.cars:
+            self.post(pk, "move_elevator")
+        self.post(self.cars[0], "door_status")
+        self.post(self.cars[1], "toggle_maintenance")
+
+    def assertReplayMatchesDatabase(self, result):
+        self.assertEqual(sorted(result.states), sorted(Elevator.objects.values_list("pk", flat=True)))
+        for elevator in Elevator.objects.all():
+            state = result.states[elevator.pk]
+            self.assertEqual(
+                (state.current_floor, state.direction, state.is_door_open, state.in_maintenance),
+                (elevator.current_floor, elevator.direction, elevator.is_door_open, elevator.in_maintenance),
+            )
+            self.assertEqual(
+                [request.pk for request in state.pending],
+                list(
+                    UserRequest.objects.filter(elevator=elevator, is_complete=False)
+                    .order_by("queue_position", "created_at")
+                    .values_list("pk", flat=True)
+                ),
+            )
+
+    def test_replay_rebuilds_the_state_of_every_car(self):
+        self.traffic()
+        tick()
+        self.assertReplayMatchesDatabase(replay(self.path))
+        types = [event["type"] for _, event in read_events(self.path)]
+        self.assertEqual(types[:2], ["car", "car"])
+        self.assertEqual(types.count("hail"), 4)
+        self.assertIn("door", types)
+        self.assertIn("maintenance", types)
+
+    def test_replay_continues_from_the_snapshot_and_skips_a_torn_line(self):
+        self.traffic()
+        snapshot = write_snapshot(self.path)
+        self.post(self.cars[0], "door_status")
+        self.post(self.cars[0], "move_elevator")
+        self.client.post("/elevators/", {"current_floor": 7}, format="json")
+        with open(self.path, "a", encoding="utf-8") as log:
+            log.write('[1, "move", ')
+        result = replay(self.path)
+        self.assertEqual(result.events, 3)
+        self.assertEqual(result.offset, os.path.getsize(self.path) - len('[1, "move", '))
+        self.assertReplayMatchesDatabase(result)
+        self.assertGreater(result.offset, snapshot.offset)
+
+    def test_read_events_resumes_from_an_offset(self):
+        events = list(read_events(self.path))
+        self.post(self.cars[0], "door_status")
+        offset = events[-1][0]
+        self.assertEqual(
+            [event for _, event in read_events(self.path, offset)],
+            [
+                {
+                    "time": mock.ANY,
+                    "type": "door",
+                    "elevator_id": self.cars[0],
+                    "is_door_open": True,
+                }
+            ],
+        )
+
+    def test_replay_events_command_verifies_against_the_database(self):
+        self.traffic()
+        out = StringIO()
+        call_command("replay_events", "--snapshot", "--verify", stdout=out)
+        self.assertIn("2 cars, ", out.getvalue())
+        self.assertIn("replayed state matches the database", out.getvalue())
+
+    def test_rolled_back_changes_are_not_logged(self):
+        logged = os.path.getsize(self.path)
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            self.post(self.cars[0], "door_status")
+            self.assertEqual(os.path.getsize(self.path), logged)
+            raise DatabaseError("rolled back")
+        self.assertEqual(os.path.getsize(self.path), logged)
+        self.assertFalse(Elevator.objects.get(pk=self.cars[0]).is_door_open)
+        self.post(self.cars[0], "door_status")
+        self.assertGreater(os.path.getsize(self.path), logged)
+
+
+class FakeRedis:
+    """
+    Local stand-in for the subset of the Redis client the cache uses.
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1).encode()
+        return int(self.data[key])
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value).encode()
+        return True
+
+    def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def hget(self, key, field):
+        return self.data.get(key, {}).get(field)
+
+    def hset(self, key, field, value):
+        self.data.setdefault(key, {})[field] = str(value).encode()
+        return 1
+
+    def expire(self, key, seconds):
+        return key in self.data
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args):
+            self.commands.append((name, args))
+            return self
+
+        return queue
+
+    def execute(self):
+        return [getattr(self.client, name)(*args) for name, args in self.commands]
+
+
+class AsyncFakePipeline(FakePipeline):
+    async def execute(self):
+        # The client's own methods are wrapped as coroutines.
+        return [getattr(FakeRedis, name)(self.client, *args) for name, args in self.commands]
+
+
+class AsyncFakeRedis(FakeRedis):
+    def __getattribute__(self, name):
+        attribute = super().__getattribute__(name)
+        if name == "data":
+            return attribute
+        if name == "pipeline":
+            return lambda transaction=True: AsyncFakePipeline(self)
+
+        async def call(*args, **kwargs):
+            return attribute(*args, **kwargs)
+
+        return call
+
+
+class DownRedis:
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise redis.ConnectionError("Connection refused.")
+
+        return fail
+
+
+class ElevatorCacheTests(TestCase):
+    def setUp(self):
+        self.cache = ElevatorCache(FakeRedis())
+        patcher = mock.patch("Elevator_app.views.get_cache", return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.elevator = Elevator.objects.create(current_floor=1)
+        UserRequest.objects.create(elevator=self.elevator, requested_floor=3, destination_floor=5)
+
+    def test_repeated_reads_are_served_from_cache(self):
+        for url in ("get_user_requests", "get_next_floor", "check_direction"):
+            first = self.client.get(f"/elevators/{self.elevator.pk}/{url}/")
+            with self.assertNumQueries(0):
+                second = self.client.get(f"/elevators/{self.elevator.pk}/{url}/")
+            self.assertEqual(first.json(), second.json())
+
+    def test_mutations_invalidate_cached_answers(self):
+        url = f"/elevators/{self.elevator.pk}/get_next_floor/"
+        self.assertEqual(self.client.get(url).json()["next_floor"], 3)
+        self.client.post(f"/elevators/{self.elevator.pk}/move_elevator/")
+        self.assertEqual(self.client.get(url).json()["next_floor"], 5)
+        self.client.post(f"/elevators/{self.elevator.pk}/toggle_maintenance/")
+        response = self.client.get(f"/elevators/{self.elevator.pk}/check_direction/")
+        self.assertEqual(response.status_code, 400)
+
+    def test_falls_back_to_database_when_redis_is_down(self):
+        self.cache.client = DownRedis()
+        with self.assertLogs("Elevator_app.cache", "WARNING"):
+            response = self.client.get(f"/elevators/{self.elevator.pk}/get_user_requests/")
+        self.assertEqual(len(response.json()), 1)
+        self.assertFalse(self.cache.available)
+        response = self.client.get(f"/elevators/{self.elevator.pk}/get_next_floor/")
+        self.assertEqual(response.json()["next_floor"], 3)
+
+    def test_waiters_reuse_the_value_computed_under_lock(self):
+        client = self.cache.client
+        key = ElevatorCache.key(self.elevator.pk, "next_floor")
+        client.set(f"{key}:lock", 1)
+        reads = []
+
+        def mget(names):
+            # Another worker finishes computing after the first read misses.
+            reads.append(names)
+            if len(reads) == 2:
+                client.data[key] = b"0:[200, 7]"
+            return [client.data.get(name) for name in names]
+
+        compute = mock.Mock()
+        with mock.patch.object(client, "mget", side_effect=mget):
+            self.assertEqual(self.cache.get_or_set(self.elevator.pk, "next_floor", compute), [200, 7])
+        compute.assert_not_called()
+
+    def test_answers_computed_before_an_invalidation_are_not_served(self):
+        def stale():
+            # The car moves while this answer is being computed.
+            self.cache.invalidate(self.elevator)
+            return [200, 3]
+
+        self.assertEqual(self.cache.get_or_set(self.elevator.pk, "next_floor", stale), [200, 3])
+        fresh = mock.Mock(return_value=[200, 5])
+        self.assertEqual(self.cache.get_or_set(self.elevator.pk, "next_floor", fresh), [200, 5])
+        self.assertEqual(self.cache.get_or_set(self.elevator.pk, "next_floor", fresh), [200, 5])
+        fresh.assert_called_once()
+
+    def test_failed_invalidations_are_sent_before_the_next_read(self):
+        url = f"/elevators/{self.elevator.pk}/get_next_floor/"
+        self.assertEqual(self.client.get(url).json()["next_floor"], 3)
+        client = self.cache.client
+        self.cache.client = DownRedis()
+        with self.assertLogs("Elevator_app.cache", "WARNING"):
+            self.client.post(f"/elevators/{self.elevator.pk}/move_elevator/")
+        self.cache.client = client
+        self.cache.health.down_until = 0.0
+        self.assertEqual(self.client.get(url).json()["next_floor"], 5)
+        self.assertFalse(self.cache.health.unsent)
+
+    def test_invalidations_the_sync_cache_failed_to_send_reach_async_reads(self):
+        async_cache = AsyncElevatorCache(AsyncFakeRedis(), health=self.cache.health)
+        async_cache.client.data = self.cache.client.data
+        url = f"/async/elevators/{self.elevator.pk}/get_next_floor/"
+        with mock.patch("Elevator_app.async_views.get_async_cache", return_value=async_cache):
+            self.assertEqual(self.client.get(url).json()["next_floor"], 3)
+            client = self.cache.client
+            self.cache.client = DownRedis()
+            with self.assertLogs("Elevator_app.cache", "WARNING"):
+                self.client.post(f"/elevators/{self.elevator.pk}/move_elevator/")
+            self.cache.client = client
+            self.cache.health.down_until = 0.0
+            self.assertEqual(self.client.get(url).json()["next_floor"], 5)
+        self.assertFalse(self.cache.health.unsent)
+
+    def test_async_reads_share_the_cache(self):
+        async_cache = AsyncElevatorCache(AsyncFakeRedis())
+        async_cache.client.data = self.cache.client.data
+        url = f"/elevators/{self.elevator.pk}/get_next_floor/"
+        with mock.patch("Elevator_app.async_views.get_async_cache", return_value=async_cache):
+            self.assertEqual(self.client.get(f"/async{url}").json()["next_floor"], 3)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(f"/async{url}").json()["next_floor"], 3)
+            self.client.post(f"/elevators/{self.elevator.pk}/move_elevator/")
+            self.assertEqual(self.client.get(f"/async{url}").json()["next_floor"], 5)
+
+    def test_keys_are_partitioned_by_building(self):
+        building = Building.objects.create(name="North")
+        bank = Bank.objects.create(building=building, name="Low", highest_floor=10)
+        car = Elevator.objects.create(bank=bank, building=building)
+        UserRequest.objects.create(elevator=car, requested_floor=4, destination_floor=8)
+        self.client.get(f"/elevators/{car.pk}/get_next_floor/")
+        self.client.get(f"/elevators/{self.elevator.pk}/get_next_floor/")
+        self.assertEqual(
+            sorted(self.cache.client.data),
+            [
+                f"building:{{{building.pk}}}:elevator:{car.pk}:next_floor",
+                f"building:{{{building.pk}}}:elevator:{car.pk}:version",
+                f"building:{{default}}:elevator:{self.elevator.pk}:next_floor",
+                f"building:{{default}}:elevator:{self.elevator.pk}:version",
+            ],
+        )
+        self.client.post(f"/elevators/{car.pk}/move_elevator/")
+        self.assertEqual(self.client.get(f"/elevators/{car.pk}/get_next_floor/").json()["next_floor"], 8)
+
+
+class BuildingTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.building = Building.objects.create(name="North")
+        self.low = Bank.objects.create(building=self.building, name="Low", highest_floor=20)
+        self.high = Bank.objects.create(
+            building=self.building, name="High", lowest_floor=20, highest_floor=40
+        )
+
+    def initialize(self, number, **scope):
+        return self.client.post(
+            "/elevators/initialize_elevators/",
+            {"number_of_elevators": number, **scope},
+            format="json",
+        )
+
+    def hail(self, requested_floor, destination_floor, building=None):
+        data = {"requested_floor": requested_floor, "destination_floor": destination_floor}
+        if building is not None:
+            data["building"] = building
+        return self.client.post("/elevators/save_user_request/", data, format="json")
+
+    def test_initializes_cars_per_bank_without_touching_other_sites(self):
+        other = Building.objects.create(name="South")
+        other_bank = Bank.objects.create(building=other, name="All", highest_floor=10)
+        other_car = Elevator.objects.create(bank=other_bank, building=other)
+        pool_car = Elevator.objects.create()
+        response = self.initialize(2, building=self.building.pk)
+        self.assertEqual(len(response.json()["elevators"]), 4)
+        self.assertEqual(self.low.elevators.count(), 2)
+        self.assertEqual(self.high.elevators.count(), 2)
+        self.assertEqual(self.building.elevators.count(), 4)
+        self.initialize(3)
+        self.initialize(1, bank=self.high.pk)
+        self.assertTrue(Elevator.objects.filter(pk=other_car.pk).exists())
+        self.assertFalse(Elevator.objects.filter(pk=pool_car.pk).exists())
+        self.assertEqual(Elevator.objects.filter(building__isnull=True).count(), 3)
+        self.assertEqual(self.low.elevators.count(), 2)
+        self.assertEqual(self.high.elevators.count(), 1)
+
+    def test_initialize_rejects_unknown_or_empty_buildings(self):
+        self.assertEqual(self.initialize(2, building=999).status_code, 404)
+        empty = Building.objects.create(name="Empty")
+        self.assertEqual(self.initialize(2, building=empty.pk).status_code, 400)
+
+    def test_hails_go_to_a_bank_serving_both_floors(self):
+        self.initialize(1, building=self.building.pk)
+        self.initialize(1)
+        low_car = self.low.elevators.get()
+        high_car = self.high.elevators.get()
+        self.assertEqual(self.hail(3, 12, self.building.pk).json()["elevator_id"], low_car.pk)
+        self.assertEqual(self.hail(25, 38, self.building.pk).json()["elevator_id"], high_car.pk)
+        self.assertEqual(self.hail(3, 38, self.building.pk).status_code, 400)
+        pool_car = Elevator.objects.get(building__isnull=True)
+        self.assertEqual(self.hail(3, 38).json()["elevator_id"], pool_car.pk)
+
+    def test_batch_hails_are_dispatched_per_bank(self):
+        self.initialize(2, building=self.building.pk)
+        response = self.client.post(
+            "/elevators/batch_hail/",
+            {
+                "building": self.building.pk,
+                "requests": [
+                    {"requested_floor": 2, "destination_floor": 9},
+                    {"requested_floor": 30, "destination_floor": 21},
+                    {"requested_floor": 2, "destination_floor": 35},
+                ],
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 207)
+        results = response.json()["results"]
+        self.assertEqual(Elevator.objects.get(pk=results[0]["elevator_id"]).bank, self.low)
+        self.assertEqual(Elevator.objects.get(pk=results[1]["elevator_id"]).bank, self.high)
+        self.assertEqual(results[2]["error"], "No elevators available.")
+
+    def test_each_building_is_dispatched_by_its_own_strategy(self):
+        other = Building.objects.create(name="South")
+        cars = [
+            Elevator.objects.create(building=building, current_floor=5, direction=UP)
+            for building in (self.building, other)
+        ]
+        for car in cars:
+            UserRequest.objects.create(elevator=car, requested_floor=2, destination_floor=1)
+            UserRequest.objects.create(elevator=car, requested_floor=8, destination_floor=9)
+        dispatch = {"STRATEGY": "fifo", "BUILDING_STRATEGIES": {self.building.pk: "look"}}
+        with override_settings(ELEVATOR_DISPATCH=dispatch):
+            next_floors = [
+                self.client.get(f"/elevators/{car.pk}/get_next_floor/").json()["next_floor"]
+                for car in cars
+            ]
+            self.assertEqual(next_floors, [8, 2])
+            fleet = self.client.get("/elevators/fleet_status/").json()["elevators"]
+            self.assertEqual([car["next_floor"] for car in fleet], [8, 2])
+            moves = [
+                self.client.post(f"/elevators/{car.pk}/move_elevator/").json()["current_floor"]
+                for car in cars
+            ]
+            self.assertEqual(moves, [8, 2])
+
+    def test_elevators_follow_their_bank_building(self):
+        response = self.client.post("/elevators/", {"bank": self.low.pk}, format="json")
+        self.assertEqual(response.json()["building"], self.building.pk)
+        other = Building.objects.create(name="South")
+        self.client.patch(f"/banks/{self.low.pk}/", {"building": other.pk}, format="json")
+        self.assertEqual(Elevator.objects.get(pk=response.json()["id"]).building, other)
+
+    def test_store_dispatches_from_the_serving_bank(self):
+        self.initialize(1, building=self.building.pk)
+        store = StateStore(os.path.join(tempfile.mkdtemp(), "journal"), fsync=False)
+        store.load()
+        with mock.patch("Elevator_app.views.get_store", return_value=store), override_settings(
+            ELEVATOR_DISPATCH={"STRATEGY": "eta"}
+        ):
+            response = self.hail(25, 38, self.building.pk)
+        self.assertEqual(response.json()["elevator_id"], self.high.elevators.get().pk)
+        self.assertEqual(store.banks(self.building.pk, (3, 12)), [self.low.pk])
@@ -0,0 +1,223 @@
+"""
+Tick-driven operation of the whole elevator bank.
+
+`tick` advances every elevator that is not in maintenance and has its door
+closed by one `move_elevator` step, using the same dispatch strategy and
+request-completion rule as the endpoint. All of a tick's reads and writes
+happen in one transaction: one query loads the cars, one loads their pending
+queues, one bulk UPDATE moves the cars and one UPDATE completes requests.
+The cars are locked with `SELECT ... FOR UPDATE SKIP LOCKED`, so a car that an
+endpoint is writing at that moment simply sits this tick out, and every move
+bumps the car's version so endpoint writes based on the old row are retried.
+Each move is also recorded in the event log (see `events`).
+With parking enabled, the cars left idle are then parked where the demand
+forecast expects the next hails (see `forecast`), as moves of their own.
+The `run_elevators` management command calls it on a fixed interval. The
+in-memory state store is private to the serving process, so with the store
+enabled `start_ticker` ticks from a thread of that process instead (see
+ELEVATOR_STATE_STORE["TICK_INTERVAL"]).
+"""
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from Elevator_app.cache import get_cache
+from Elevator_app.dispatch import apply_move, group_window, strategy_for
+from Elevator_app.events import move_event, record
+from Elevator_app.forecast import get_parking_policy, park, parking_setting
+from Elevator_app.metrics import dispatch_timer, record_tick
+from Elevator_app.models import QUEUE_ORDERING, Bank, Elevator, UserRequest
+from Elevator_app.simulation import nearest_rank
+from Elevator_app.state import get_store
+from Elevator_app.streaming import publish_state
+
+logger = logging.getLogger(__name__)
+
+
+class TickResult:
+    __slots__ = ("moved", "completed", "parked")
+
+    def __init__(self, moved=0, completed=0, parked=0):
+        self.moved = moved
+        self.completed = completed
+        self.parked = parked
+
+
+def tick(strategy=None, now=None):
+    """
+    Advances every available elevator by one step, with `strategy` or else
+    the strategy of each car's building. Returns a TickResult.
+    """
+    now = now or timezone.now()
+    window = group_window()
+    policy = get_parking_policy()
+    if policy is not None:
+        policy.forecaster.catch_up(parking_setting("HISTORY_DAYS", 28))
+    store = get_store()
+    if store is not None:
+        return _tick_in_memory(store, strategy, now, window, policy)
+    with transaction.atomic():
+        elevators = list(
+            Elevator.objects.select_for_update(skip_locked=True).filter(
+                in_maintenance=False, is_door_open=False
+            )
+        )
+        queues = defaultdict(list)
+        pending = UserRequest.objects.filter(
+            elevator__in=[elevator.pk for elevator in elevators], is_complete=False
+        ).order_by("elevator_id", *QUEUE_ORDERING)
+        for user_request in pending:
+            queues[user_request.elevator_id].append(user_request)
+        moved = []
+        completed = []
+        events = []
+        idle = []
+        for elevator in elevators:
+            car_strategy = strategy or strategy_for(elevator.building_id)
+            with dispatch_timer(car_strategy, "next_request"):
+                done = apply_move(
+                    car_strategy, elevator, queues.get(elevator.pk, []), now=now, window=window
+                )
+            if done is None:
+                idle.append(elevator)
+                continue
+            elevator.version += 1
+            moved.append(elevator)
+            completed.extend(user_request.pk for user_request in done)
+            events.append(move_event(elevator, done))
+        parked = []
+        if policy is not None and idle:
+            ranges = {
+                bank.pk: (bank.lowest_floor, bank.highest_floor)
+                for bank in Bank.objects.filter(pk__in={car.bank_id for car in idle})
+            }
+            parked = park(policy, idle, now.timestamp(), ranges)
+            for elevator in parked:
+                elevator.version += 1
+                events.append(move_event(elevator))
+            moved.extend(parked)
+        if moved:
+            Elevator.objects.bulk_update(moved, ["current_floor", "direction", "version"])
+        if completed:
+            UserRequest.objects.filter(pk__in=completed, is_complete=False).update(
+                is_complete=True
+            )
+        record(events)
+    get_cache().invalidate(*moved)
+    publish_state(*moved)
+    return TickResult(len(moved) - len(parked), len(completed), len(parked))
+
+
+def _tick_in_memory(store, strategy, now, window, policy):
+    # The store journals each car's move and writes the batch behind. Each
+    # car is read, checked and moved under the store lock, as the endpoints
+    # do, so a hail, door toggle or reload in between is never overwritten.
+    moved = []
+    completed = 0
+    idle = []
+    for pk in [state.pk for state in store.all()]:
+        with store.lock:
+            state = store.get(pk)
+            if state is None or state.in_maintenance or state.is_door_open:
+                continue
+            car_strategy = strategy or strategy_for(state.building_id)
+            with dispatch_timer(car_strategy, "next_request"):
+                lookahead = None if window is not None else car_strategy.lookahead
+                done = apply_move(
+                    car_strategy, state, state.queue(lookahead), now=now, window=window
+                )
+            if done is None:
+                idle.append(state)
+                continue
+            store.commit(state, done)
+            record([move_event(state, done)])
+        moved.append(state)
+        completed += len(done)
+    parked = []
+    if policy is not None and idle:
+        with store.lock:
+            idle = [
+                state
+                for state in idle
+                if store.get(state.pk) is state
+                and not (state.in_maintenance or state.is_door_open or state.pending_count)
+            ]
+            ranges = {state.bank_id: (state.lowest_floor, state.highest_floor) for state in idle}
+            parked = park(policy, idle, now.timestamp(), ranges)
+            for state in parked:
+                store.commit(state)
+                record([move_event(state)])
+    get_cache().invalidate(*moved, *parked)
+    publish_state(*moved, *parked)
+    return TickResult(len(moved), completed, len(parked))
+
+
+class TickMetrics:
+    """
+    Tick count, achieved tick rate and per-tick latency over the last
+    `window` ticks. Every tick is also recorded in the metrics registry.
+    """
+
+    def __init__(self, window=1000):
+        self.ticks = 0
+        self.moves = 0
+        self.completions = 0
+        self.parks = 0
+        self.latencies = deque(maxlen=window)
+        self.started = time.monotonic()
+
+    def observe(self, seconds, result):
+        self.ticks += 1
+        self.moves += result.moved
+        self.completions += result.completed
+        self.parks += result.parked
+        self.latencies.append(seconds)
+        record_tick(seconds, result.moved, result.completed, result.parked)
+
+    @property
+    def tick_rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.ticks / elapsed if elapsed else 0.0
+
+    def latency_percentile(self, percentile):
+        return nearest_rank(self.latencies, percentile)
+
+    def summary(self):
+        return (
+            f"ticks={self.ticks} rate={self.tick_rate:.2f}/s moves={self.moves} "
+            f"completed={self.completions} parked={self.parks} "
+            f"latency_p50={self.latency_percentile(50) * 1000:.1f}ms "
+            f"latency_p99={self.latency_percentile(99) * 1000:.1f}ms "
+            f"latency_max={max(self.latencies, default=0) * 1000:.1f}ms"
+        )
+
+
+def start_ticker(interval):
+    """
+    Ticks every `interval` seconds, on a fixed-rate schedule, from a daemon
+    thread of this process. Returns the thread.
+    """
+    metrics = TickMetrics()
+
+    def run():
+        next_tick = time.monotonic()
+        while True:
+            started = time.perf_counter()
+            try:
+                result = tick()
+            except Exception:
+                logger.exception("Elevator tick failed.")
+            else:
+                metrics.observe(time.perf_counter() - started, result)
+            finally:
+                close_old_connections()
+            next_tick = max(next_tick + interval, time.monotonic())
+            time.sleep(max(next_tick - time.monotonic(), 0))
+
+    thread = threading.Thread(target=run, name="elevator-ticker", daemon=True)
+    thread.start()
+    return thread
@@ -1,12 +1,19 @@
 from django.urls import path,include
-from Elevator_app.views import ElevatorViewSet
+from Elevator_app import async_views
+from Elevator_app.views import BankViewSet, BuildingViewSet, ElevatorViewSet, metrics
 from rest_framework import routers
 
 router = routers.DefaultRouter()
 router.register(r'elevators',ElevatorViewSet)
+router.register(r'buildings',BuildingViewSet)
+router.register(r'banks',BankViewSet)
 
 urlpatterns = [
     path('',include(router.urls)),
+    path("metrics", metrics, name="metrics"),
+    path("async/elevators/<int:pk>/get_user_requests/", async_views.get_user_requests, name="async_get_user_requests"),
+    path("async/elevators/<int:pk>/get_next_floor/", async_views.get_next_floor, name="async_get_next_floor"),
+    path("async/elevators/<int:pk>/check_direction/", async_views.check_direction, name="async_check_direction"),
     path('initialize_elevators/', ElevatorViewSet.as_view({'post': 'initialize_system'}), name='initialize_system'),
     path('save_user_request/', ElevatorViewSet.as_view({'post': 'save_request'}), name='save_request'),
     path('<int:pk>/get_user_requests/', ElevatorViewSet.as_view({'get': 'get_requests'}), name='elevator-get-requests'),
@@ -1,26 +1,860 @@
-import redis
+import base64
+import binascii
 import json
-from django.http import JsonResponse
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Min, OuterRef, Q, Subquery, Window
+from django.db.models.functions import RowNumber
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from Elevator_app.serializers import ElevatorSerializer, UserRequestSerializer
-from Elevator_app.models import Elevator, UserRequest
-from operator import itemgetter
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags
+from Elevator_app.cache import get_cache
+from Elevator_app.dedup import MAX_IDEMPOTENCY_KEY_LENGTH, find_duplicate, remember_hail
+from Elevator_app.dispatch import (
+    Projection,
+    apply_move,
+    apply_sweep,
+    bank_indexes,
+    dispatch_setting,
+    get_strategy,
+    group_window,
+    joinable_car,
+    strategy_for,
+    target_floor,
+)
+from Elevator_app.eta_index import best_of
+from Elevator_app.events import (
+    car_event,
+    door_event,
+    hail_event,
+    maintenance_event,
+    move_event,
+    record,
+    record_cars,
+    removed_event,
+)
+from Elevator_app.metrics import CONTENT_TYPE, dispatch_timer, render
+from Elevator_app.state import STATE_FIELDS, ElevatorState, get_store
+from Elevator_app.streaming import publish_assignments, publish_state
+from Elevator_app.renderers import FastJSONRenderer
+from Elevator_app.serializers import (
+    BankSerializer,
+    BuildingSerializer,
+    ElevatorSerializer,
+    UserRequestSerializer,
+    fast_path_enabled,
+    serialization_setting,
+    values_serializer,
+)
+from Elevator_app.models import QUEUE_ORDERING, Bank, Building, Elevator, UserRequest
 from rest_framework.decorators import action
 from rest_framework import viewsets, status
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+USER_REQUESTS_PAGE_SIZE = 100
+USER_REQUESTS_MAX_PAGE_SIZE = 1000
+USER_REQUEST_FIELDS = tuple(
+    field.name for field in UserRequest._meta.fields if field.name != "idempotency_key"
+)
+MAX_WRITE_ATTEMPTS = 5
+
+# Building of each elevator seen by this process, so cached reads are routed
+# to their building's cache partition without a query. Entries are dropped
+# whenever a car is changed through this process.
+elevator_buildings = {}
+
+
+def load_elevator(pk):
+    """
+    Returns the elevator, served from the in-memory state store when it is
+    enabled. Raises Http404 if it does not exist.
+    """
+    store = get_store()
+    if store is None:
+        return get_object_or_404(Elevator, pk=pk)
+    elevator = store.get(pk)
+    if elevator is None:
+        raise Http404("No Elevator matches the given query.")
+    return elevator
+
+
+def elevator_transaction():
+    """
+    Scope of an atomic read-modify-write: a database transaction, or the
+    store lock when state is held in memory.
+    """
+    store = get_store()
+    return store.lock if store is not None else transaction.atomic()
+
+
+def save_elevator(elevator, completed=()):
+    """
+    Persists a mutated elevator and marks `completed` requests as complete.
+    The row is only written if its version is still the one that was loaded;
+    returns False if another writer got there first. In-memory states are
+    journaled and written behind by the store.
+    """
+    if isinstance(elevator, ElevatorState):
+        get_store().commit(elevator, completed)
+        return True
+    updated = Elevator.objects.filter(pk=elevator.pk, version=elevator.version).update(
+        version=F("version") + 1,
+        **{field: getattr(elevator, field) for field in STATE_FIELDS},
+    )
+    if not updated:
+        return False
+    elevator.version += 1
+    if completed:
+        # A request is only ever completed once, even by racing writers.
+        UserRequest.objects.filter(
+            pk__in=[user_request.pk for user_request in completed], is_complete=False
+        ).update(is_complete=True)
+    return True
+
+
+def claim_elevators(elevators):
+    """
+    Bumps the version of every car in `elevators` if none has changed since it
+    was loaded, so hails assigned from a stale view of a queue are retried.
+    Returns False on a conflict, leaving every version as it was.
+    """
+    if get_store() is not None:
+        return True
+    claimed = {elevator.pk: elevator.version for elevator in elevators}
+    condition = Q()
+    for pk, version in claimed.items():
+        condition |= Q(pk=pk, version=version)
+    claim = Elevator.objects.filter(condition)
+    if len(claimed) == 1:
+        return claim.update(version=F("version") + 1) == 1
+    # In a savepoint: on a conflict the cars that had not changed were bumped too.
+    with transaction.atomic():
+        if claim.update(version=F("version") + 1) == len(claimed):
+            return True
+        transaction.set_rollback(True)
+    return False
+
+
+def update_elevator(pk, change, event):
+    """
+    Runs `change(elevator)` on elevator `pk` as an atomic read-modify-write and
+    returns its response. `change` mutates the elevator and returns
+    `(response, completed requests)`, or `(response, None)` to leave it as is.
+    A saved change is recorded in the event log as `event(elevator, completed)`.
+    On a version conflict the change is retried on fresh state.
+    """
+    for _ in range(MAX_WRITE_ATTEMPTS):
+        with elevator_transaction():
+            elevator = load_elevator(pk)
+            response, completed = change(elevator)
+            if completed is None:
+                return response
+            if not save_elevator(elevator, completed):
+                continue
+            record([event(elevator, completed)])
+        get_cache().invalidate(elevator)
+        publish_state(elevator)
+        return response
+    return conflict_response()
+
+
+def conflict_response():
+    return Response(
+        {"error": "Elevator was updated concurrently, please retry."},
+        status=status.HTTP_409_CONFLICT,
+    )
+
+
+def duplicate_response(request_id, elevator_id):
+    return JsonResponse(
+        {
+            "message": "User request already saved.",
+            "elevator_id": elevator_id,
+            "request_id": request_id,
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+def forget_elevators(*elevators):
+    """
+    Drops the cached answers of `elevators` and where this process routes them.
+    """
+    get_cache().invalidate(*elevators)
+    for elevator in elevators:
+        elevator_buildings.pop(elevator.pk, None)
+
+
+def refresh_state(*elevators):
+    """
+    Drops the cached answers and in-memory state of `elevators` after they
+    were changed (or deleted) outside the state store, and records their new
+    state in the event log.
+    """
+    forget_elevators(*elevators)
+    record_cars([elevator.pk for elevator in elevators])
+    store = get_store()
+    if store is not None:
+        for elevator in elevators:
+            store.refresh(elevator.pk)
+
+
+def building_of(pk):
+    """
+    Building of elevator `pk` (None for the default pool or an unknown car).
+    """
+    store = get_store()
+    if store is not None:
+        state = store.get(pk)
+        return state.building_id if state is not None else None
+    try:
+        pk = int(pk)
+    except (TypeError, ValueError):
+        return None
+    if pk not in elevator_buildings:
+        elevator_buildings[pk] = (
+            Elevator.objects.filter(pk=pk).values_list("building_id", flat=True).first()
+        )
+    return elevator_buildings[pk]
+
+
+def elevator_strategy(pk):
+    """
+    Dispatch strategy of elevator `pk`'s building.
+    """
+    if not dispatch_setting("BUILDING_STRATEGIES", {}):
+        return get_strategy()
+    return strategy_for(building_of(pk))
+
+
+def cached_answer(pk, name, compute, variant=None):
+    """
+    `compute()`, served from the cache partition of elevator `pk`'s building.
+    """
+    cache = get_cache()
+    building = building_of(pk) if cache.available else None
+    return cache.get_or_set(pk, name, compute, variant=variant, building=building)
+
+
+def state_version(pk):
+    """
+    Version of elevator `pk`, which changes with every write that can change
+    what its read endpoints answer; None if there is no such car. Cached like
+    the answers themselves, so at most one query, and none with the state
+    store.
+    """
+    store = get_store()
+    if store is not None:
+        return store.version(pk)
+    return database_version(pk)
+
+
+def database_version(pk):
+    """
+    `Elevator.version` of car `pk` as a string, None if there is no such car.
+    """
+    try:
+        pk = int(pk)
+    except (TypeError, ValueError):
+        return None
+
+    def load():
+        version = Elevator.objects.filter(pk=pk).values_list("version", flat=True).first()
+        return None if version is None else str(version)
+
+    return cached_answer(pk, "version", load)
+
+
+def read_etag(pk, strategy=None):
+    """
+    ETag of a read answer about elevator `pk`, or None if it has none.
+    Answers that depend on the dispatch `strategy` have no ETag if its
+    answer can change with time alone.
+    """
+    if strategy is not None and strategy.time_dependent:
+        return None
+    return version_etag(state_version(pk), strategy)
+
+
+def request_list_etag(pk):
+    """
+    ETag of elevator `pk`'s request list. The archive_requests command
+    deletes requests from its own process, behind the state store's back,
+    and bumps only the database version, so with the store the ETag carries
+    both versions.
+    """
+    version = state_version(pk)
+    if version is not None and get_store() is not None:
+        version = f"{version}.{database_version(pk)}"
+    return version_etag(version)
+
+
+def version_etag(version, strategy=None):
+    """
+    ETag of a read answer about a car at `version` (None if there is no such
+    car). Answers that depend on the dispatch `strategy` are also tagged with
+    the dispatch settings.
+    """
+    if version is None:
+        return None
+    if strategy is not None:
+        dispatch = json.dumps(getattr(settings, "ELEVATOR_DISPATCH", {}), sort_keys=True, default=str)
+        version = f"{version}.{strategy.name}.{zlib.crc32(dispatch.encode()):08x}"
+    # Weak, because the browsable API renders the same version differently.
+    return f'W/"{version}"'
+
+
+def not_modified(request, etag):
+    """
+    A 304 response if `request`'s If-None-Match already holds `etag`, else None.
+    """
+    header = request.headers.get("If-None-Match")
+    if etag is None or header is None:
+        return None
+    # Weak comparison: a "W/" prefix on either side does not matter.
+    etags = {tag.removeprefix("W/") for tag in parse_etags(header)}
+    if "*" not in etags and etag.removeprefix("W/") not in etags:
+        return None
+    response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    response["ETag"] = etag
+    return response
+
+
+def with_etag(response, etag):
+    if etag is not None and response.status_code == status.HTTP_200_OK:
+        response["ETag"] = etag
+    return response
+
+
+def serves(elevator, *floors):
+    """
+    Whether `elevator`'s bank serves every one of `floors`. Cars of the
+    default pool serve every floor.
+    """
+    lowest = getattr(elevator, "lowest_floor", None)
+    if lowest is None:
+        return True
+    return all(lowest <= floor <= elevator.highest_floor for floor in floors)
+
+
+def available_elevators(building=None, floors=()):
+    """
+    Cars of `building` (the default pool if None) that can take a hail and
+    whose bank serves every floor in `floors`, each with `pending_destination`
+    (destination of the request at the head of its queue), `pending_count`,
+    `queue_tail` (highest pending queue position) and its bank's
+    `lowest_floor` and `highest_floor`. Fetched in one query, or from memory
+    when the state store is enabled.
+    """
+    store = get_store()
+    if store is not None:
+        return [
+            state
+            for state in store.all()
+            if state.building_id == building
+            and not state.in_maintenance
+            and not state.is_door_open
+            and serves(state, *floors)
+        ]
+    elevators = Elevator.objects.filter(
+        building=building, in_maintenance=False, is_door_open=False
+    )
+    if building is not None:
+        elevators = elevators.annotate(
+            lowest_floor=F("bank__lowest_floor"), highest_floor=F("bank__highest_floor")
+        )
+        if floors:
+            elevators = elevators.filter(
+                lowest_floor__lte=min(floors), highest_floor__gte=max(floors)
+            )
+    pending = UserRequest.objects.filter(elevator=OuterRef("pk"), is_complete=False)
+    return list(
+        elevators.annotate(
+            pending_destination=Subquery(
+                pending.order_by(*QUEUE_ORDERING).values("destination_floor")[:1]
+            ),
+            pending_count=Count("requests", filter=Q(requests__is_complete=False)),
+            queue_tail=Subquery(
+                pending.order_by("-queue_position").values("queue_position")[:1]
+            ),
+        )
+    )
+
+
+def is_valid_floor(floor):
+    return isinstance(floor, int) and floor > 0
+
+
+def is_valid_id(value):
+    return value is None or (isinstance(value, int) and not isinstance(value, bool) and value > 0)
+
+
+def pending_query(elevator, strategy, whole_queue=False):
+    """
+    Pending requests of `elevator`, oldest first, limited to what `strategy`
+    needs unless `whole_queue` is set (a passenger group can be anywhere in it).
+    """
+    requests = UserRequest.objects.filter(
+        elevator=elevator, is_complete=False
+    ).order_by(*QUEUE_ORDERING)
+    if strategy.lookahead is not None and not whole_queue:
+        requests = requests[: strategy.lookahead]
+    return requests
+
+
+def pending_requests(elevator, strategy, whole_queue=False):
+    if isinstance(elevator, ElevatorState):
+        return elevator.queue(None if whole_queue else strategy.lookahead)
+    return list(pending_query(elevator, strategy, whole_queue))
+
+
+def joinable_elevator(elevators, requested_floor, destination_floor, window):
+    """
+    The car among `elevators` (from `available_elevators`) with a passenger
+    group for these floors that a new hail can join (see
+    `dispatch.joinable_car`), or None. One query unless the state store is
+    enabled.
+    """
+    now = timezone.now()
+    if not elevators or isinstance(elevators[0], ElevatorState):
+        return joinable_car(elevators, requested_floor, destination_floor, now, window)
+    by_pk = {elevator.pk: elevator for elevator in elevators}
+    group = (
+        UserRequest.objects.filter(
+            elevator__in=list(by_pk),
+            is_complete=False,
+            requested_floor=requested_floor,
+            destination_floor=destination_floor,
+        )
+        .values("elevator_id", "elevator__capacity")
+        .annotate(started=Min("created_at"), waiting=Count("pk"))
+        .filter(
+            started__gte=now - timedelta(seconds=window),
+            waiting__lt=F("elevator__capacity"),
+        )
+        .order_by("started")
+        .first()
+    )
+    return by_pk[group["elevator_id"]] if group else None
+
+
+def encode_cursor(created_at, pk):
+    position = f"{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Returns the (created_at, id) position encoded in `cursor`, or None if it
+    is malformed.
+    """
+    try:
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        created_at = parse_datetime(created_at)
+        return (created_at, int(pk)) if created_at else None
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def parse_user_request_query(params):
+    """
+    Validates the get_user_requests query parameters.
+    Returns (options, error message); options is None when invalid.
+    """
+    options = {"limit": USER_REQUESTS_PAGE_SIZE}
+    limit = params.get("limit")
+    if limit is not None:
+        try:
+            options["limit"] = int(limit)
+        except ValueError:
+            options["limit"] = None
+        if options["limit"] is None or not 0 < options["limit"] <= USER_REQUESTS_MAX_PAGE_SIZE:
+            return None, f"limit must be between 1 and {USER_REQUESTS_MAX_PAGE_SIZE}."
+    if "cursor" in params:
+        options["cursor"] = decode_cursor(params["cursor"])
+        if options["cursor"] is None:
+            return None, "Invalid cursor."
+    if "is_complete" in params:
+        if params["is_complete"] not in ("true", "false"):
+            return None, "is_complete must be true or false."
+        options["is_complete"] = params["is_complete"] == "true"
+    for bound in ("created_after", "created_before"):
+        if bound in params:
+            try:
+                # Well-formed but impossible dates (February 30) raise.
+                options[bound] = parse_datetime(params[bound])
+            except ValueError:
+                options[bound] = None
+            if options[bound] is None:
+                return None, f"{bound} must be an ISO 8601 datetime."
+    if "fields" in params:
+        fields = [field for field in params["fields"].split(",") if field]
+        unknown = set(fields) - set(USER_REQUEST_FIELDS)
+        if not fields or unknown:
+            return None, f"Unknown fields: {', '.join(sorted(unknown)) or params['fields']}."
+        options["fields"] = fields
+    return options, None
+
+
+def user_request_query(elevator, options):
+    """
+    Rows of one page (plus one, to tell whether another page follows) of the
+    requests of `elevator` in (created_at, id) order, using keyset pagination
+    so every page is an index range scan.
+    """
+    requests = UserRequest.objects.filter(elevator=elevator)
+    if "is_complete" in options:
+        requests = requests.filter(is_complete=options["is_complete"])
+    if "created_after" in options:
+        requests = requests.filter(created_at__gte=options["created_after"])
+    if "created_before" in options:
+        requests = requests.filter(created_at__lt=options["created_before"])
+    if "cursor" in options:
+        created_at, last_pk = options["cursor"]
+        requests = requests.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=last_pk)
+        )
+    fields = options.get("fields")
+    rows = values_serializer(UserRequestSerializer, fields) if fast_path_enabled() else None
+    # The cursor needs id and created_at even when they are not returned.
+    if rows is not None:
+        requests = requests.values(*dict.fromkeys(["id", "created_at", *rows.lookups]))
+    elif fields:
+        requests = requests.only(*{"id", "created_at", *fields})
+    return requests.order_by("created_at", "pk")[: options["limit"] + 1]
+
+
+def user_request_result(rows, options):
+    """
+    The page of `rows` from `user_request_query`, which are `.values()` rows
+    on the serialization fast path and requests otherwise.
+    """
+    limit = options["limit"]
+    fields = options.get("fields")
+    next_cursor = None
+    if rows and isinstance(rows[0], dict):
+        if len(rows) > limit:
+            next_cursor = encode_cursor(rows[limit - 1]["created_at"], rows[limit - 1]["id"])
+        results = list(values_serializer(UserRequestSerializer, fields).serialize(rows[:limit]))
+    else:
+        if len(rows) > limit:
+            next_cursor = encode_cursor(rows[limit - 1].created_at, rows[limit - 1].pk)
+        results = UserRequestSerializer(rows[:limit], many=True, fields=fields).data
+    return {"results": results, "next_cursor": next_cursor}
+
+
+def user_request_page(pk, options):
+    """
+    One page of the requests of elevator `pk`.
+    """
+    elevator = get_object_or_404(Elevator, pk=pk)
+    return user_request_result(list(user_request_query(elevator, options)), options)
+
+
+def next_floor_result(elevator, pending, strategy):
+    """
+    Status code and body of the get_next_floor answer for `elevator` with
+    `pending` requests.
+    """
+    request = strategy.next_request(elevator, pending, now=timezone.now())
+    if not request:
+        return status.HTTP_400_BAD_REQUEST, {
+            "error": "No requests found for the elevator."
+        }
+    next_floor = target_floor(request, elevator.current_floor)
+    return status.HTTP_200_OK, {
+        "message": "Next floor retrieved successfully.",
+        "elevator_id": elevator.pk,
+        "next_floor": next_floor,
+    }
+
+
+def next_floor_answer(pk):
+    """
+    Status code and body of the get_next_floor answer for elevator `pk`.
+    """
+    elevator = load_elevator(pk)
+    strategy = strategy_for(elevator.building_id)
+    return next_floor_result(elevator, pending_requests(elevator, strategy), strategy)
+
+
+def unavailable_result(elevator):
+    """
+    The check_direction answer for a car that cannot move, or None.
+    """
+    if elevator.in_maintenance or elevator.is_door_open:
+        return status.HTTP_400_BAD_REQUEST, {
+            "error": "Elevator is in maintenance or door is open."
+        }
+    return None
+
+
+def direction_result(elevator, pending, strategy):
+    """
+    Status code and body of the check_direction answer for an available
+    `elevator` with `pending` requests.
+    """
+    current_floor = elevator.current_floor
+    request = strategy.next_request(elevator, pending, now=timezone.now())
+    if not request:
+        return status.HTTP_400_BAD_REQUEST, {
+            "error": "No requests found for the elevator."
+        }
+    return status.HTTP_200_OK, {
+        "message": "Direction retrieved successfully.",
+        "elevator_id": elevator.pk,
+        "direction": heading(current_floor, target_floor(request, current_floor)),
+    }
+
+
+def heading(current_floor, next_floor):
+    if next_floor > current_floor:
+        return "up"
+    if next_floor < current_floor:
+        return "down"
+    return "stationary"
+
+
+def direction_answer(pk):
+    """
+    Status code and body of the check_direction answer for elevator `pk`.
+    """
+    elevator = load_elevator(pk)
+    unavailable = unavailable_result(elevator)
+    if unavailable:
+        return unavailable
+    strategy = strategy_for(elevator.building_id)
+    return direction_result(elevator, pending_requests(elevator, strategy), strategy)
+
+
+def parse_fleet_query(params):
+    """
+    Validates the fleet_status query parameters.
+    Returns (filters, error message); filters is None when invalid.
+    """
+    filters = {}
+    if "building" in params:
+        try:
+            filters["building"] = int(params["building"])
+        except ValueError:
+            return None, "Invalid building provided."
+    if "ids" in params:
+        try:
+            filters["ids"] = {int(pk) for pk in params["ids"].split(",")}
+        except ValueError:
+            return None, "ids must be comma-separated elevator IDs."
+    return filters, None
+
+
+def fleet_queues(filters, lookahead):
+    """
+    `(car, pending requests, queue depth)` for every car matching `filters`,
+    in id order, where the pending requests are the first `lookahead` of the
+    car's queue (all of it if None). Two queries whatever the number of cars, or none when the
+    state store is enabled.
+    """
+    store = get_store()
+    if store is not None:
+        return [
+            (state, state.queue(lookahead), state.pending_count)
+            for state in sorted(store.all(), key=lambda state: state.pk)
+            if filters.get("building", state.building_id) == state.building_id
+            and state.pk in filters.get("ids", (state.pk,))
+        ]
+    elevators = Elevator.objects.all()
+    if "building" in filters:
+        elevators = elevators.filter(building=filters["building"])
+    if "ids" in filters:
+        elevators = elevators.filter(pk__in=filters["ids"])
+    elevators = list(
+        elevators.annotate(
+            queue_depth=Count("requests", filter=Q(requests__is_complete=False))
+        ).order_by("pk")
+    )
+    pending = UserRequest.objects.filter(
+        elevator__in=[elevator.pk for elevator in elevators], is_complete=False
+    )
+    if lookahead is not None:
+        # Only the head of each queue, numbered per car in queue order.
+        pending = pending.annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=F("elevator_id"),
+                order_by=[F(field).asc() for field in QUEUE_ORDERING],
+            )
+        ).filter(position__lte=lookahead)
+    queues = {elevator.pk: [] for elevator in elevators}
+    for user_request in pending.order_by("elevator_id", *QUEUE_ORDERING):
+        queues[user_request.elevator_id].append(user_request)
+    return [(elevator, queues[elevator.pk], elevator.queue_depth) for elevator in elevators]
+
+
+def fleet_status_result(filters):
+    """
+    Status of every car matching `filters`, with the next floor and direction
+    get_next_floor and check_direction would answer (None where they answer
+    with an error).
+    """
+    strategies = {None: get_strategy()}
+    for building, name in dispatch_setting("BUILDING_STRATEGIES", {}).items():
+        strategies[building] = get_strategy(name)
+    lookaheads = [strategy.lookahead for strategy in strategies.values()]
+    now = timezone.now()
+    cars = []
+    for elevator, pending, queue_depth in fleet_queues(
+        filters, None if None in lookaheads else max(lookaheads)
+    ):
+        strategy = strategies.get(elevator.building_id, strategies[None])
+        if strategy.lookahead is not None:
+            pending = pending[: strategy.lookahead]
+        request = strategy.next_request(elevator, pending, now=now)
+        next_floor = target_floor(request, elevator.current_floor) if request else None
+        direction = None
+        if next_floor is not None and unavailable_result(elevator) is None:
+            direction = heading(elevator.current_floor, next_floor)
+        cars.append(
+            {
+                "elevator_id": elevator.pk,
+                "current_floor": elevator.current_floor,
+                "direction": direction,
+                "is_door_open": elevator.is_door_open,
+                "in_maintenance": elevator.in_maintenance,
+                "next_floor": next_floor,
+                "queue_depth": queue_depth,
+            }
+        )
+    return {"elevators": cars}
+
+
+def metrics(request):
+    """
+    Prometheus scrape endpoint.
+    Returns: HttpResponse - every recorded metric in the text exposition format.
+    Example: GET /metrics
+    """
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
+
+
+def bank_building(serializer):
+    """
+    Building of the bank an elevator is being saved with.
+    """
+    bank = serializer.validated_data.get("bank", getattr(serializer.instance, "bank", None))
+    return bank.building if bank is not None else None
+
+
+def cars_of(queryset):
+    return list(queryset.only("pk", "building"))
+
+
+class FastListMixin:
+    """
+    With ELEVATOR_SERIALIZATION["FAST_PATH"] on, `list` builds its answer
+    from `.values()` rows, and streams it in STREAM_BATCH_SIZE row pieces as
+    the rows are read when plain JSON is asked for, so large lists are never
+    held in memory. The bytes are the same as the serializer's.
+    """
+
+    def list(self, request, *args, **kwargs):
+        serializer = values_serializer(self.get_serializer_class()) if fast_path_enabled() else None
+        if serializer is None or self.paginator is not None:
+            return super().list(request, *args, **kwargs)
+        batch_size = serialization_setting("STREAM_BATCH_SIZE", 1000)
+        rows = serializer.serialize(
+            self.filter_queryset(self.get_queryset())
+            .values(*serializer.lookups)
+            .iterator(chunk_size=batch_size)
+        )
+        renderer = request.accepted_renderer
+        if (
+            isinstance(renderer, FastJSONRenderer)
+            and renderer.fast
+            and renderer.get_indent(request.accepted_media_type, {}) is None
+        ):
+            return StreamingHttpResponse(
+                renderer.stream(rows, batch_size), content_type=renderer.media_type
+            )
+        return Response(list(rows))
+
+
+class BuildingViewSet(FastListMixin, viewsets.ModelViewSet):
+    queryset = Building.objects.all()
+    serializer_class = BuildingSerializer
+
+    def perform_destroy(self, instance):
+        elevators = cars_of(instance.elevators.all())
+        super().perform_destroy(instance)
+        refresh_state(*elevators)
+
+
+class BankViewSet(FastListMixin, viewsets.ModelViewSet):
+    queryset = Bank.objects.all()
+    serializer_class = BankSerializer
+
+    def perform_update(self, serializer):
+        elevators = cars_of(serializer.instance.elevators.all())
+        super().perform_update(serializer)
+        # Cars follow their bank to another building.
+        serializer.instance.elevators.update(
+            building=serializer.instance.building, version=F("version") + 1
+        )
+        refresh_state(*elevators)
+
+    def perform_destroy(self, instance):
+        elevators = cars_of(instance.elevators.all())
+        super().perform_destroy(instance)
+        refresh_state(*elevators)
 
-redis_client = redis.StrictRedis(host='localhost', port=6379, db=0)
 
 "https://docs.google.com/document/d/1ZlJKfawiwqaEy2qoa0iAOB36Y0Ph5K2_zsvLcVJJBxk/edit"
-class ElevatorViewSet(viewsets.ModelViewSet):
+class ElevatorViewSet(FastListMixin, viewsets.ModelViewSet):
     queryset = Elevator.objects.all()
     serializer_class = ElevatorSerializer
 
+    def retrieve(self, request, *args, **kwargs):
+        """
+        The elevator, with an ETag; If-None-Match with the current one is
+        answered with a 304 from a version check alone.
+        """
+        etag = read_etag(kwargs["pk"])
+        unchanged = not_modified(request, etag)
+        if unchanged is not None:
+            return unchanged
+        return with_etag(super().retrieve(request, *args, **kwargs), etag)
+
+    def perform_create(self, serializer):
+        serializer.save(building=bank_building(serializer))
+        refresh_state(serializer.instance)
+
+    def perform_update(self, serializer):
+        previous = Elevator(pk=serializer.instance.pk, building_id=serializer.instance.building_id)
+        serializer.save(building=bank_building(serializer), version=F("version") + 1)
+        serializer.instance.refresh_from_db(fields=["version"])
+        if previous.building_id != serializer.instance.building_id:
+            # Drop the answers cached under the building the car left.
+            get_cache().invalidate(previous)
+        refresh_state(serializer.instance)
+
+    def perform_destroy(self, instance):
+        deleted = Elevator(pk=instance.pk, building_id=instance.building_id)
+        super().perform_destroy(instance)
+        refresh_state(deleted)
+
     @action(detail=False, methods=["post"])
     def initialize_elevators(self, request):
         """
         Initializes the elevator system with the specified number of elevators.
-        Params: request - HTTP request with 'number_of_elevators' in data.
+        Only the cars being initialized are replaced: those of the given bank,
+        of every bank of the given building, or of the default pool if neither
+        is given. Other buildings are never touched.
+        Params: request - HTTP request with 'number_of_elevators' in data, and
+        optionally 'building' (N cars per bank) or 'bank' (N cars in that bank).
         Returns: JsonResponse - Success message and elevator data with IDs.
         Example: POST /initialize_elevators/ {"number_of_elevators": 3}
         Response: {"message": "3 elevators initialized successfully", "elevators": [{"elevator_id": 1}, {"elevator_id": 2}, {"elevator_id": 3}]}
@@ -33,13 +867,55 @@ class ElevatorViewSet(viewsets.ModelViewSet):
                 },
                 status=status.HTTP_404_NOT_FOUND,
             )
-        Elevator.objects.all().delete()
-        elevators = [Elevator.objects.create() for _ in range(num_elevators)]
+        building_id = request.data.get("building")
+        bank_id = request.data.get("bank")
+        if not is_valid_id(building_id) or not is_valid_id(bank_id):
+            return Response(
+                {"error": "building and bank must be IDs."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if bank_id is not None:
+            banks = list(Bank.objects.filter(pk=bank_id))
+            if not banks:
+                return Response({"error": "Bank not found."}, status=status.HTTP_404_NOT_FOUND)
+            scope = Elevator.objects.filter(bank=banks[0])
+        elif building_id is not None:
+            building = Building.objects.filter(pk=building_id).first()
+            if building is None:
+                return Response(
+                    {"error": "Building not found."}, status=status.HTTP_404_NOT_FOUND
+                )
+            banks = list(building.banks.all())
+            if not banks:
+                return Response(
+                    {"error": "The building has no banks."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            scope = Elevator.objects.filter(building=building)
+        else:
+            banks = [None]
+            scope = Elevator.objects.filter(building__isnull=True)
+        replaced = cars_of(scope)
+        with transaction.atomic():
+            scope.delete()
+            elevators = Elevator.objects.bulk_create(
+                Elevator(bank=bank, building_id=bank.building_id if bank else None)
+                for bank in banks
+                for _ in range(num_elevators)
+            )
+            record(
+                [removed_event(elevator.pk) for elevator in replaced]
+                + [car_event(elevator) for elevator in elevators]
+            )
+        forget_elevators(*replaced)
         elevator_data = [{"elevator_id": elevator.pk} for elevator in elevators]
+        store = get_store()
+        if store is not None:
+            store.load()
 
         return JsonResponse(
             {
-                "message": f"{num_elevators} elevators initialized successfully.",
+                "message": f"{len(elevators)} elevators initialized successfully.",
                 "elevators": elevator_data,
             },
             status=status.HTTP_200_OK,
@@ -51,80 +927,352 @@ class ElevatorViewSet(viewsets.ModelViewSet):
         """
         API to save a user request and assign the most optimal elevator.
         Parameters:
-            - request: HTTP request with 'requested_floor' and 'destination_floor' in data.
+            - request: HTTP request with 'requested_floor' and 'destination_floor' in data,
+              and optionally 'building' to dispatch to a bank of that building serving
+              both floors instead of the default pool.
+            An 'Idempotency-Key' header (up to 100 characters) makes retries of the
+            same hail return the request it created.
         Returns:
-            - JsonResponse: Success message and assigned elevator ID.
+            - JsonResponse: Success message, assigned elevator ID and request ID; a repeat
+              of a saved hail (same key, or same floors while still pending within the
+              merge window) gets its assignment back with a 200 and saves nothing.
         Example:
             >>> POST /save_user_request/ {"requested_floor": 2, "destination_floor": 6}
-            >>> Response: {"message": "User request saved successfully.", "elevator_id": 1}
+            >>> Response: {"message": "User request saved successfully.", "elevator_id": 1, "request_id": 7}
 
         """
         requested_from_floor = request.data.get("requested_floor")
         requested_to_floor = request.data.get("destination_floor")
-        if (
-            not requested_from_floor
-            or not requested_to_floor
-            or not isinstance(requested_from_floor, int)
-            or not isinstance(requested_to_floor, int)
-            or requested_from_floor <= 0
-            or requested_to_floor <= 0
+        if not is_valid_floor(requested_from_floor) or not is_valid_floor(
+            requested_to_floor
         ):
             return JsonResponse(
                 {"error": "Invalid floor number provided."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        elevators = Elevator.objects.filter(in_maintenance=False, is_door_open=False)
-        if not elevators:
+        building = request.data.get("building")
+        if not is_valid_id(building):
             return JsonResponse(
-                {"error": "No elevators available."}, status=status.HTTP_400_BAD_REQUEST
+                {"error": "Invalid building provided."},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-        distances = []
-        for elevator in elevators:
-            non_completed = (
-                UserRequest.objects.filter(elevator=elevator, is_complete=False)
-                .order_by("created_at")
+        key = request.headers.get("Idempotency-Key") or None
+        if key is not None and len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+            return JsonResponse(
+                {"error": "Invalid Idempotency-Key header."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        duplicate = find_duplicate(building, requested_from_floor, requested_to_floor, key)
+        if duplicate is not None:
+            return duplicate_response(*duplicate)
+        floors = (requested_from_floor, requested_to_floor)
+        try:
+            assigned = self.assign_hails(building, [(floors, key)])
+        except IntegrityError:
+            # The same key was saved concurrently, or by a process that did
+            # not remember it.
+            if key is None:
+                raise
+            existing = (
+                UserRequest.objects.filter(idempotency_key=key)
+                .values_list("pk", "elevator_id")
                 .first()
             )
-            if non_completed:
-                distance = abs(requested_from_floor - non_completed.destination_floor)
-            else:
-                distance = abs(requested_from_floor - elevator.current_floor)
-            distances.append({"elevator": elevator, "distance": distance})
-
-        sorted_elevators = sorted(distances, key=itemgetter("distance"))
-        elevator = sorted_elevators[0]["elevator"]
-        UserRequest.objects.create(
-            elevator=elevator,
-            current_floor=elevator.current_floor,
-            requested_floor=requested_from_floor,
-            destination_floor=requested_to_floor,
+            if existing is None:
+                raise
+            return duplicate_response(*existing)
+        if assigned is None:
+            return conflict_response()
+        [(elevator, user_request)] = assigned
+        if elevator is None:
+            return JsonResponse(
+                {"error": "No elevators available."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        remember_hail(user_request, building, key)
+        get_cache().invalidate(elevator)
+        publish_assignments(
+            [(elevator.pk, requested_from_floor, requested_to_floor)], building=building
         )
         return JsonResponse(
-            {"message": "User request saved successfully.", "elevator_id": elevator.pk},
+            {
+                "message": "User request saved successfully.",
+                "elevator_id": elevator.pk,
+                "request_id": user_request.pk,
+            },
             status=status.HTTP_201_CREATED,
         )
 
+    def assign_hails(self, building, hails, strategy=None):
+        """
+        Dispatches `hails`, a list of `(floors, idempotency key)`, in order and
+        saves them in one transaction, each seeing the load of those before
+        it. With destination grouping a hail first joins a car collecting
+        passengers for the same floors. Otherwise it goes to the car picked
+        by the strategy's index, when it keeps one for every bank serving
+        the floors (the state store's, or one built for a batch over enough
+        cars), else by the strategy among the available cars. `strategy`
+        defaults to the building's. Returns `(elevator, request)` for each
+        hail and `(None, None)` for those no car can take, or None if the
+        cars kept changing underneath.
+        """
+        strategy = strategy or strategy_for(building)
+        window = group_window()
+        for _ in range(MAX_WRITE_ATTEMPTS):
+            with elevator_transaction():
+                store = get_store()
+                projections = None
+                # Without the store, a batch's own indexes over the projections.
+                batch_indexes = None
+                # Passenger groups started earlier in this batch, not saved yet
+                # without the store: floors -> [car, passengers].
+                groups = {}
+                assigned = []
+                with dispatch_timer(strategy, "select" if len(hails) == 1 else "batch"):
+                    for floors, key in hails:
+                        # The store keeps the strategy's index (if it has one) of
+                        # every bank current, so a hail is answered without
+                        # scoring every car.
+                        indexes = None
+                        if store is not None:
+                            indexes = [
+                                store.index(strategy, bank)
+                                for bank in store.banks(building, floors)
+                            ]
+                            if None in indexes:
+                                indexes = None
+                        if projections is None and (indexes is None or window is not None):
+                            projections = {
+                                elevator.pk: Projection(elevator)
+                                for elevator in available_elevators(
+                                    building, floors if len(hails) == 1 else ()
+                                )
+                            }
+                            if store is None and len(hails) > 1:
+                                batch_indexes = bank_indexes(strategy, projections.values())
+                        if batch_indexes is not None:
+                            indexes = [
+                                index
+                                for index, car in batch_indexes.values()
+                                if serves(car, *floors)
+                            ]
+                        candidates = []
+                        if indexes is None or window is not None:
+                            candidates = [
+                                projection
+                                for projection in (projections or {}).values()
+                                if serves(projection.elevator, *floors)
+                            ]
+                        elevator = None
+                        group = groups.get(floors)
+                        if group is not None and group[1] < group[0].capacity:
+                            elevator = group[0]
+                        elif window is not None:
+                            elevator = joinable_elevator(
+                                [
+                                    projection.elevator
+                                    for projection in candidates
+                                    if group is None or projection.elevator is not group[0]
+                                ],
+                                *floors,
+                                window,
+                            )
+                        if elevator is None and indexes is not None:
+                            elevator = best_of(indexes, floors[0])
+                            if elevator is not None and batch_indexes is not None:
+                                # The batch's indexes hold projections.
+                                elevator = elevator.elevator
+                        elif elevator is None:
+                            # Scoring happens in memory on the annotated candidates.
+                            projection = strategy.select_elevator(candidates, *floors)
+                            elevator = projection.elevator if projection else None
+                        if elevator is None:
+                            assigned.append((None, None))
+                            continue
+                        projection = (projections or {}).get(elevator.pk)
+                        if projection is not None:
+                            queue_position = projection.take(floors[1])
+                            if batch_indexes is not None:
+                                batch_indexes[elevator.bank_id][0].update(projection)
+                        else:
+                            queue_position = (elevator.queue_tail or 0) + 1
+                        if window is not None:
+                            if group is not None and group[0] is elevator:
+                                group[1] += 1
+                            else:
+                                groups[floors] = [elevator, 1]
+                        user_request = UserRequest(
+                            elevator_id=elevator.pk,
+                            current_floor=elevator.current_floor,
+                            requested_floor=floors[0],
+                            destination_floor=floors[1],
+                            queue_position=queue_position,
+                            idempotency_key=key,
+                        )
+                        if store is not None:
+                            # Queued at once, so the next hail sees it in the index.
+                            user_request.save()
+                            store.add_request(elevator, user_request)
+                        assigned.append((elevator, user_request))
+                saved = [user_request for _, user_request in assigned if user_request]
+                if store is None and saved:
+                    if not claim_elevators(
+                        {elevator.pk: elevator for elevator, _ in assigned if elevator}.values()
+                    ):
+                        continue
+                    UserRequest.objects.bulk_create(saved)
+                record(hail_event(user_request) for user_request in saved)
+            return assigned
+        return None
+
+
+    @action(detail=False, methods=["post"])
+    def batch_hail(self, request):
+        """
+        API to save many user requests at once, assigned in a single dispatch pass.
+        Params:
+        - requests: list of {"requested_floor", "destination_floor"} objects.
+        - building: Optional building ID; each request goes to a bank of that
+          building serving both of its floors instead of the default pool.
+        Returns:
+        - JsonResponse: Per-item result in request order, with an elevator ID and
+          request ID or an error. Items repeating a hail saved earlier are merged
+          into it as by save_user_request and marked "duplicate". 201 if every
+          item was saved, 207 if only some were, 400 if none.
+        Example: POST /elevators/batch_hail/ {"requests": [{"requested_floor": 2, "destination_floor": 6}, {"requested_floor": 0, "destination_floor": 3}]}
+        Response: {"message": "1 of 2 user requests saved.", "results": [{"index": 0, "elevator_id": 1, "request_id": 7}, {"index": 1, "error": "Invalid floor number provided."}]}
+        """
+        hails = request.data.get("requests") if isinstance(request.data, dict) else None
+        max_batch_size = dispatch_setting("MAX_BATCH_SIZE", 1000)
+        if not isinstance(hails, list) or not hails or len(hails) > max_batch_size:
+            return JsonResponse(
+                {"error": f"Provide a list of 1 to {max_batch_size} requests."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        building = request.data.get("building")
+        if not is_valid_id(building):
+            return JsonResponse(
+                {"error": "Invalid building provided."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        results = [{"index": index} for index in range(len(hails))]
+        valid = []
+        for index, hail in enumerate(hails):
+            floors = (
+                (hail.get("requested_floor"), hail.get("destination_floor"))
+                if isinstance(hail, dict)
+                else (None, None)
+            )
+            if all(is_valid_floor(floor) for floor in floors):
+                valid.append((index, floors))
+            else:
+                results[index]["error"] = "Invalid floor number provided."
+        # Hails saved earlier (by save_user_request, say) are merged as
+        # there; hails within the batch are separate passengers.
+        new = []
+        for index, floors in valid:
+            duplicate = find_duplicate(building, *floors)
+            if duplicate is None:
+                new.append((index, floors))
+            else:
+                request_id, elevator_id = duplicate
+                results[index].update(
+                    elevator_id=elevator_id, request_id=request_id, duplicate=True
+                )
+        saved = []
+        if new:
+            assigned = self.assign_hails(building, [(floors, None) for _, floors in new])
+            if assigned is None:
+                return conflict_response()
+            for (index, floors), (elevator, user_request) in zip(new, assigned):
+                if elevator is None:
+                    results[index]["error"] = "No elevators available."
+                    continue
+                remember_hail(user_request, building)
+                results[index].update(elevator_id=elevator.pk, request_id=user_request.pk)
+                saved.append((elevator, floors))
+        if saved:
+            get_cache().invalidate(*{elevator.pk: elevator for elevator, _ in saved}.values())
+            publish_assignments(
+                [(elevator.pk, *floors) for elevator, floors in saved], building=building
+            )
+        valid = [result for result in results if "error" not in result]
+        if len(valid) == len(hails):
+            response_status = status.HTTP_201_CREATED
+        elif valid:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return JsonResponse(
+            {
+                "message": f"{len(valid)} of {len(hails)} user requests saved.",
+                "results": results,
+            },
+            status=response_status,
+        )
+
 
     @action(detail=True, methods=["get"])
     def get_user_requests(self, request, pk=None):
         """
-        Retrieve user requests for a specific elevator.
+        Retrieve user requests for a specific elevator, oldest first, one page at a time.
         Params:
         - pk: Elevator ID.
+        - limit: Page size (default 100, at most 1000).
+        - cursor: Value of the previous page's X-Next-Cursor header.
+        - is_complete: "true" or "false" to filter on completion.
+        - created_after / created_before: ISO 8601 bounds on created_at.
+        - fields: Comma-separated fields to return, e.g. "requested_floor,destination_floor".
         Returns:
-        - Response: Serialized user requests.
-        Example: GET /get_user_requests/1/
-        Response: [{"requested_floor": 2, "destination_floor": 6, "is_complete": false, "created_at": "2023-01-01T12:00:00Z"}, ...]
+        - Response: Serialized user requests. When more remain, the X-Next-Cursor
+          and Link headers point at the next page.
+        Example: GET /get_user_requests/1/?is_complete=false&fields=requested_floor,destination_floor
+        Response: [{"requested_floor": 2, "destination_floor": 6}, ...]
         """
-        # user_requests_cache = redis_client.get(f'user_requests_{pk}')
-        # if user_requests_cache:
-        #     return Response(json.loads(user_requests_cache))
-        elevator = get_object_or_404(Elevator, pk=pk)
-        requests = UserRequest.objects.filter(elevator=elevator)
-        serializer = UserRequestSerializer(requests, many=True)
-        # user_requests_data = serializer.data
-        # redis_client.set(f'user_requests_{pk}', json.dumps(user_requests_data), ex=3600)
-        return Response(serializer.data)
+        options, error = parse_user_request_query(request.query_params)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+        etag = request_list_etag(pk)
+        unchanged = not_modified(request, etag)
+        if unchanged is not None:
+            return unchanged
+        variant = "&".join(
+            f"{name}={value}" for name, value in sorted(request.query_params.items())
+        )
+        page = cached_answer(
+            pk, "requests", lambda: user_request_page(pk, options), variant=variant
+        )
+        response = Response(page["results"])
+        if page["next_cursor"]:
+            next_url = replace_query_param(
+                request.build_absolute_uri(), "cursor", page["next_cursor"]
+            )
+            response["X-Next-Cursor"] = page["next_cursor"]
+            response["Link"] = f'<{next_url}>; rel="next"'
+        return with_etag(response, etag)
+
+
+    @action(detail=False, methods=["get"])
+    def fleet_status(self, request):
+        """
+        API to retrieve the status of every elevator at once, for dashboards that
+        would otherwise poll each car.
+        Params:
+        - building: Only the cars of this building.
+        - ids: Comma-separated elevator IDs to return.
+        Returns:
+        - JsonResponse: Floor, direction, door and maintenance state, next floor and
+          number of pending requests of each car. direction and next_floor are what
+          check_direction and get_next_floor answer, or null where they answer an error.
+        Example: GET /fleet_status/?building=1
+        Response: {"elevators": [{"elevator_id": 1, "current_floor": 3, "direction": "up",
+                   "is_door_open": false, "in_maintenance": false, "next_floor": 7,
+                   "queue_depth": 2}, ...]}
+        """
+        filters, error = parse_fleet_query(request.query_params)
+        if error:
+            return JsonResponse({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse(fleet_status_result(filters), status=status.HTTP_200_OK)
 
 
     @action(detail=True, methods=["get"])
@@ -138,33 +1286,12 @@ class ElevatorViewSet(viewsets.ModelViewSet):
         Example: GET /get_next_floor/1/
         Response: {"message": "Next floor retrieved successfully.", "elevator_id": 1, "next_floor": 7}
         """
-        elevator = get_object_or_404(Elevator, pk=pk)
-        current_floor = elevator.current_floor
-        request = (
-            UserRequest.objects.filter(elevator=elevator, is_complete=False)
-            .order_by("created_at")
-            .first()
-        )
-        if not request:
-            return Response(
-                {"error": "No requests found for the elevator."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-        requested_from_floor = request.requested_floor
-        requested_to_floor = request.destination_floor
-        next_floor = (
-            requested_to_floor
-            if current_floor == requested_from_floor
-            else requested_from_floor
-        )
-        return JsonResponse(
-            {
-                "message": "Next floor retrieved successfully.",
-                "elevator_id": elevator.pk,
-                "next_floor": next_floor,
-            },
-            status=status.HTTP_200_OK,
-        )
+        etag = read_etag(pk, elevator_strategy(pk))
+        unchanged = not_modified(request, etag)
+        if unchanged is not None:
+            return unchanged
+        status_code, payload = cached_answer(pk, "next_floor", lambda: next_floor_answer(pk))
+        return with_etag(JsonResponse(payload, status=status_code), etag)
 
 
     @action(detail=True, methods=["get"])
@@ -178,43 +1305,12 @@ class ElevatorViewSet(viewsets.ModelViewSet):
         Example: GET /check_direction/1/
         Response: {"message": "Direction retrieved successfully.", "elevator_id": 1, "direction": "up"}
         """
-        elevator = get_object_or_404(Elevator, pk=pk)
-        if elevator.in_maintenance or elevator.is_door_open:
-            return Response(
-                {"error": "Elevator is in maintenance or door is open."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-        current_floor = elevator.current_floor
-        requests = UserRequest.objects.filter(
-            elevator=elevator, is_complete=False
-        ).order_by("created_at")
-        if not requests:
-            return Response(
-                {"error": "No requests found for the elevator."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-        request = requests.first()
-        requested_from_floor = request.requested_floor
-        requested_to_floor = request.destination_floor
-
-        if current_floor == requested_from_floor:
-            next_floor = requested_to_floor
-        else:
-            next_floor = requested_from_floor
-        if next_floor > current_floor:
-            direction = "up"
-        elif next_floor < current_floor:
-            direction = "down"
-        else:
-            direction = "stationary"
-        return JsonResponse(
-            {
-                "message": "Direction retrieved successfully.",
-                "elevator_id": elevator.pk,
-                "direction": direction,
-            },
-            status=status.HTTP_200_OK,
-        )
+        etag = read_etag(pk, elevator_strategy(pk))
+        unchanged = not_modified(request, etag)
+        if unchanged is not None:
+            return unchanged
+        status_code, payload = cached_answer(pk, "direction", lambda: direction_answer(pk))
+        return with_etag(JsonResponse(payload, status=status_code), etag)
 
 
     @action(detail=True, methods=["post"])
@@ -228,14 +1324,12 @@ class ElevatorViewSet(viewsets.ModelViewSet):
         Example: POST /door_status/1/
         Response: {"is_door_open": true}
         """
-        try:
-            elevator = self.get_object()
-            elevator.door_opened = not elevator.is_door_open #Using the not operator to invert the boolean value
-            elevator.save()
-            return Response({'door_opened': elevator.is_door_open})
-        except Elevator.DoesNotExist:
-            return Response({'error': 'Elevator not found.'}, status=status.HTTP_404_NOT_FOUND)
-        
+
+        def toggle_door(elevator):
+            elevator.is_door_open = not elevator.is_door_open
+            return Response({'door_opened': elevator.is_door_open}), []
+
+        return update_elevator(pk, toggle_door, door_event)
 
 
     @action(detail=True, methods=["post"])
@@ -249,21 +1343,17 @@ class ElevatorViewSet(viewsets.ModelViewSet):
         Example: POST /toggle_maintenance/1/
         Response: {"message": "Elevator marked as in maintenance."}
         """
-        try:
-            elevator = self.get_object()
-            elevator.in_maintenance = not elevator.in_maintenance
-            elevator.save()
 
+        def toggle(elevator):
+            elevator.in_maintenance = not elevator.in_maintenance
             status_message = (
                 "Elevator marked as in maintenance."
                 if elevator.in_maintenance
                 else "Elevator marked as not in maintenance."
             )
-            return Response({"message": status_message})
-        except Elevator.DoesNotExist:
-            return JsonResponse(
-                {"error": "Elevator not found."}, status=status.HTTP_404_NOT_FOUND
-            )
+            return Response({"message": status_message}), []
+
+        return update_elevator(pk, toggle, maintenance_event)
 
 
     @action(detail=True, methods=["post"])
@@ -272,43 +1362,69 @@ class ElevatorViewSet(viewsets.ModelViewSet):
         API to move a specific elevator to the requested floors.
         Params:
         - pk: Elevator ID.
+        - mode: "step" (default) moves to the next floor of one request; "sweep"
+          serves every request along the current direction in one call and
+          returns the stops made, with the requests picked up and dropped off.
         Returns:
         - JsonResponse: Success message and elevator details after the move.
         Example: POST /move_elevator/1/
         Response: {"message": "Elevator moved successfully.", "elevator_id": 1, "current_floor": 5, "previous_floor": 3}
+        Example: POST /move_elevator/1/ {"mode": "sweep"}
+        Response: {"message": "Elevator moved successfully.", "elevator_id": 1, "current_floor": 9, "previous_floor": 3, "stops": [{"floor": 4, "picked_up": [7], "dropped_off": []}, {"floor": 9, "picked_up": [], "dropped_off": [7]}]}
         """
-        elevator = get_object_or_404(Elevator, pk=pk)
-
-        if elevator.in_maintenance or elevator.is_door_open:
+        mode = request.data.get("mode", "step") if isinstance(request.data, dict) else None
+        if mode not in ("step", "sweep"):
             return Response(
-                {"error": "Elevator is in maintenance or door is open."},
+                {"error": 'mode must be "step" or "sweep".'},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        current_floor = elevator.current_floor
-        old_floor = current_floor
-        requests = UserRequest.objects.filter(
-            elevator=elevator, is_complete=False
-        ).order_by("created_at")
+        window = group_window()
 
-        if not requests.exists():
-            return Response(
-                {"error": "No more uncompleted requests found for this elevator."},
-                status=status.HTTP_400_BAD_REQUEST,
+        def move(elevator):
+            if elevator.in_maintenance or elevator.is_door_open:
+                return Response(
+                    {"error": "Elevator is in maintenance or door is open."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                ), None
+            strategy = strategy_for(elevator.building_id)
+            old_floor = elevator.current_floor
+            sweep = mode == "sweep"
+            pending = pending_requests(
+                elevator, strategy, whole_queue=sweep or window is not None
             )
-        first_request = requests.first()
-        if current_floor == first_request.requested_floor:
-            elevator.current_floor = first_request.destination_floor
-            first_request.is_complete = True
-        else:
-            elevator.current_floor = first_request.requested_floor
-        elevator.save()
-        first_request.save()
-        return JsonResponse(
-            {
+            planned = None
+            with dispatch_timer(strategy, "next_request"):
+                if sweep:
+                    planned = apply_sweep(strategy, elevator, pending, now=timezone.now())
+                if planned is not None:
+                    completed, stops = planned
+                else:
+                    # Also serves a sweep whose request goes nowhere.
+                    completed = apply_move(
+                        strategy, elevator, pending, now=timezone.now(), window=window
+                    )
+                    stops = [(elevator.current_floor, completed, completed)]
+
+            if completed is None:
+                return Response(
+                    {"error": "No more uncompleted requests found for this elevator."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                ), None
+            payload = {
                 "message": "Elevator moved successfully.",
                 "elevator_id": elevator.pk,
                 "current_floor": elevator.current_floor,
                 "previous_floor": old_floor,
-            },
-            status=status.HTTP_200_OK,
-        )
+            }
+            if sweep:
+                payload["stops"] = [
+                    {
+                        "floor": floor,
+                        "picked_up": [user_request.pk for user_request in boarding],
+                        "dropped_off": [user_request.pk for user_request in alighting],
+                    }
+                    for floor, boarding, alighting in stops
+                ]
+            return JsonResponse(payload, status=status.HTTP_200_OK), completed
+
+        return update_elevator(pk, move, move_event)
@@ -0,0 +1,215 @@
+"""
+What-if replay of the recorded hail history.
+
+`export_hails` streams every recorded hail (requests and archived requests,
+in creation order) into a CSV file of `seconds, requested_floor,
+destination_floor`. `replay` runs such a file through the offline
+`Simulator` with one configuration (strategy, number of cars, destination
+grouping, predictive parking), so assignment and moves follow
+`save_user_request` and `move_elevator`. It reads the file as simulated time reaches each hail and
+keeps fixed-size histograms of delivered passengers instead of the
+passengers themselves, so memory is bounded by the passengers still
+travelling, not by the length of the history. `compare` replays several
+configurations at once on a process pool.
+
+Every car starts idle at the lobby and all cars form one pool, whatever
+banks the recorded hails were made in. A parking forecaster starts empty and
+learns from the replayed hails as they arrive.
+"""
+import csv
+import heapq
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+
+import django
+
+from Elevator_app.dispatch import get_strategy
+from Elevator_app.forecast import parking_policy
+from Elevator_app.models import ArchivedUserRequest, UserRequest
+from Elevator_app.simulation import Simulator
+
+HAIL_COLUMNS = ("seconds", "requested_floor", "destination_floor")
+
+
+def export_hails(path, building=None, since=None, chunk_size=5000):
+    """
+    Writes the hails recorded since `since` (all of them if None), of one
+    `building` if given, to the CSV file `path` in creation order. Returns
+    the number of hails written.
+    """
+    live = UserRequest.objects.filter(
+        requested_floor__isnull=False, destination_floor__isnull=False
+    )
+    archived = ArchivedUserRequest.objects.filter(
+        requested_floor__isnull=False, destination_floor__isnull=False
+    )
+    if building is not None:
+        live = live.filter(elevator__building_id=building)
+        archived = archived.filter(building_id=building)
+    if since is not None:
+        live = live.filter(created_at__gte=since)
+        archived = archived.filter(created_at__gte=since)
+    fields = ("created_at", "requested_floor", "destination_floor")
+    rows = heapq.merge(
+        archived.order_by("created_at").values_list(*fields).iterator(chunk_size=chunk_size),
+        live.order_by("created_at").values_list(*fields).iterator(chunk_size=chunk_size),
+        key=itemgetter(0),
+    )
+    written = 0
+    with open(path, "w", newline="", encoding="utf-8") as output:
+        writer = csv.writer(output)
+        writer.writerow(HAIL_COLUMNS)
+        for created_at, requested_floor, destination_floor in rows:
+            writer.writerow((f"{created_at.timestamp():.3f}", requested_floor, destination_floor))
+            written += 1
+    return written
+
+
+def read_hails(path):
+    """
+    Yields the hails `(seconds, requested_floor, destination_floor)` of an
+    exported file, one line at a time.
+    """
+    with open(path, newline="", encoding="utf-8") as source:
+        rows = csv.reader(source)
+        next(rows, None)
+        for seconds, requested_floor, destination_floor in rows:
+            yield float(seconds), int(requested_floor), int(destination_floor)
+
+
+class Histogram:
+    """
+    Counts of values in `width`-wide bins up to `limit`; larger values share
+    the last bin. Percentiles are the upper edge of the bin holding the
+    nearest-rank value, at most `width` above the exact percentile.
+    """
+
+    def __init__(self, width=0.5, limit=3600):
+        self.width = width
+        self.counts = [0] * (int(limit / width) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[min(int(value / self.width), len(self.counts) - 1)] += 1
+        self.total += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self):
+        return self.sum / self.total if self.total else 0.0
+
+    def percentile(self, percentile):
+        if not self.total:
+            return 0.0
+        rank = min(self.total - 1, int(self.total * percentile / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen > rank:
+                if index == len(self.counts) - 1:
+                    break
+                return min((index + 1) * self.width, self.max)
+        return self.max
+
+
+class ReplaySimulator(Simulator):
+    """
+    A `Simulator` that takes hails from any iterable in time order as
+    simulated time reaches them, and only keeps statistics of the
+    passengers it delivers.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hails = 0
+        self.waits = Histogram()
+        self.journeys = Histogram()
+        # Passengers delivered per simulated hour.
+        self.hours = Counter()
+        self.first_hail = None
+        self.last_arrival = None
+
+    def _arrive(self, payload, now):
+        _, riders, _ = payload
+        super()._arrive(payload, now)
+        for rider in riders:
+            self.waits.add(rider.boarded_at - rider.created_at)
+            self.journeys.add(now - rider.created_at)
+            self.hours[int(now // 3600)] += 1
+            self.last_arrival = now
+
+    def _next_hail(self, hails, now):
+        hail = next(hails, None)
+        if hail is not None:
+            at, requested_floor, destination_floor = hail
+            # A hail out of order is taken to arrive now.
+            self._push(max(at, now), "hail", (requested_floor, destination_floor))
+
+    def run(self, hails):
+        hails = iter(hails)
+        started = time.perf_counter()
+        self._next_hail(hails, float("-inf"))
+        while self._events:
+            now, _, kind, payload = heapq.heappop(self._events)
+            if kind == "hail":
+                if self.first_hail is None:
+                    self.first_hail = now
+                self._hail(payload, now)
+                self.hails += 1
+                self._next_hail(hails, now)
+            else:
+                self._step(kind, payload, now)
+        return self.report(time.perf_counter() - started)
+
+    def report(self, elapsed):
+        delivered = self.journeys.total
+        stops = sum(car.stops for car in self.cars)
+        span = (self.last_arrival - self.first_hail) if delivered else 0.0
+        return {
+            "hails": self.hails,
+            "delivered": delivered,
+            "avg_wait": round(self.waits.mean, 2),
+            **{f"p{p}_wait": round(self.waits.percentile(p), 2) for p in (50, 95, 99)},
+            "avg_journey": round(self.journeys.mean, 2),
+            "p95_journey": round(self.journeys.percentile(95), 2),
+            "stops": stops,
+            "stops_per_passenger": round(stops / delivered, 3) if delivered else 0.0,
+            "passengers_per_hour": round(delivered * 3600 / span, 1) if span else 0.0,
+            "peak_hour_passengers": max(self.hours.values(), default=0),
+            "hails_per_second": round(self.hails / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+def replay(path, config):
+    """
+    Replays the exported hails in `path` with `config`, a dict with the
+    `strategy` name, the number of `elevators`, the destination grouping
+    `group_window` (None for off) and, if `parking` is true, predictive
+    parking with the ELEVATOR_PARKING settings. Returns `config` with the
+    report added.
+    """
+    simulator = ReplaySimulator(
+        get_strategy(config["strategy"]),
+        elevators=config["elevators"],
+        group_window=config["group_window"],
+        parking=parking_policy() if config.get("parking") else None,
+    )
+    return {**config, **simulator.run(read_hails(path))}
+
+
+def compare(path, configs, workers=None):
+    """
+    Replays `path` with every configuration in `configs` on `workers`
+    processes (one per core by default) and returns the reports in the
+    order of `configs`. One worker replays in this process.
+    """
+    if workers == 1:
+        return [replay(path, config) for config in configs]
+    # Workers started by spawning rather than forking set Django up first.
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+        return list(pool.map(replay, [path] * len(configs), configs))